@@ -0,0 +1,42 @@
+"""Compare loading the XGBoost model from JSON and from binary UBJ.
+
+Run from the project root:
+
+    python -m benchmarks.bench_model_load
+"""
+
+import os
+import tempfile
+import timeit
+
+from src.utils import model_utils
+
+REPEATS = 5
+NUMBER = 20
+
+
+def best_time_ms(func) -> float:
+    """Return the best per-call time in milliseconds over REPEATS runs."""
+    return min(timeit.repeat(func, number=NUMBER, repeat=REPEATS)) / NUMBER * 1000
+
+
+def main():
+    model = model_utils.load_xgboost_model(model_utils.XGBOOST_MODEL_PATH)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = {
+            "json": os.path.join(tmp_dir, "xgboost_model.json"),
+            "ubj": os.path.join(tmp_dir, "xgboost_model.ubj"),
+        }
+        for path in paths.values():
+            model.save_model(path)
+
+        print(f"{'format':>6} {'size KB':>9} {'model ms':>9} {'engine ms':>10}")
+        for name, path in paths.items():
+            model_ms = best_time_ms(lambda: model_utils.load_xgboost_model(path))
+            engine_ms = best_time_ms(lambda: model_utils.load_xgboost_engine(path))
+            size_kb = os.path.getsize(path) / 1024
+            print(f"{name:>6} {size_kb:>9.1f} {model_ms:>9.3f} {engine_ms:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
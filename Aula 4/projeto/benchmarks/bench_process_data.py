@@ -0,0 +1,131 @@
+"""Compare the single-pass process_data with the former per-column UPDATEs.
+
+Generates a raw ANAC-like Parquet file, processes it both ways, checks
+that the outputs are identical and prints the timings. Run from the
+project root:
+
+    python -m benchmarks.bench_process_data --rows 3000000
+"""
+
+import argparse
+import filecmp
+import os
+import tempfile
+import time
+
+import duckdb
+
+from src.data import process_data as processing
+
+TEXT_COLUMNS = [
+    "EMPRESA_SIGLA",
+    "EMPRESA_NOME",
+    "AEROPORTO_DE_ORIGEM_SIGLA",
+    "AEROPORTO_DE_DESTINO_SIGLA",
+    "NATUREZA",
+]
+
+
+def generate_raw(path: str, rows: int):
+    """Write a raw file with comma decimals, blanks and unparsable values."""
+    numeric = ", ".join(
+        f"""CASE WHEN i % 97 = {n} THEN ''
+                 WHEN i % 89 = {n} THEN 'n/a'
+                 ELSE CAST((i * {n + 7}) % 100000 AS VARCHAR) || ',' || CAST(i % 100 AS VARCHAR)
+            END AS {column}"""
+        for n, column in enumerate(processing.NUMERIC_COLUMNS)
+    )
+    text = ", ".join(
+        f"'{column[:3]}' || CAST(i % 50 AS VARCHAR) AS {column}"
+        for column in TEXT_COLUMNS
+    )
+    duckdb.connect().execute(
+        f"""
+        COPY (
+            SELECT {text}, 2000 + i % 24 AS ANO, 1 + i % 12 AS MES, {numeric}
+            FROM range({rows}) t(i)
+        ) TO '{path}' (FORMAT 'PARQUET')
+        """
+    )
+
+
+def process_data_per_column(input_path: str, output_path: str):
+    """The previous implementation: load, then one UPDATE per column and step."""
+    con = duckdb.connect()
+    con.execute(
+        f"CREATE TABLE raw_dataset AS SELECT * FROM parquet_scan('{input_path}')"
+    )
+    for column in processing.DROP_COLUMNS:
+        con.execute(f"ALTER TABLE raw_dataset DROP COLUMN {column}")
+    for column in processing.REPLACE_COMMA_WITH_DOT_COLUMNS:
+        con.execute(f"UPDATE raw_dataset SET {column} = REPLACE({column}, ',', '.')")
+    for column in processing.SET_EMPTY_TO_NULL_COLUMNS:
+        con.execute(
+            f"UPDATE raw_dataset SET {column} = NULL WHERE LENGTH(TRIM({column})) = 0"
+        )
+    for column in processing.NUMERIC_COLUMNS:
+        con.execute(
+            f"UPDATE raw_dataset SET {column} = TRY_CAST({column} AS REAL) WHERE {column} IS NOT NULL"
+        )
+    year, month = processing.DATE_COLUMNS
+    con.execute(f"ALTER TABLE raw_dataset ADD COLUMN {processing.NEW_DATE_COLUMN} DATE")
+    for column in processing.DATE_COLUMNS:
+        con.execute(f"UPDATE raw_dataset SET {column} = CAST({column} AS VARCHAR)")
+    con.execute(
+        f"UPDATE raw_dataset SET {processing.NEW_DATE_COLUMN} = CAST({year} || '-' || LPAD({month}, 2, '0') || '{processing.DATE_CONCAT_FORMAT}' AS DATE)"
+    )
+    con.execute(f"COPY raw_dataset TO '{output_path}' WITH (FORMAT 'PARQUET')")
+    con.close()
+
+
+def process_data_single_pass(input_path: str, output_path: str):
+    con = duckdb.connect()
+    processing.process_data(con, input_path, output_path)
+    con.close()
+
+
+def timed(func, *args) -> float:
+    started = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=3_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        raw = os.path.join(tmp_dir, "raw.parquet")
+        before = os.path.join(tmp_dir, "per_column.parquet")
+        after = os.path.join(tmp_dir, "single_pass.parquet")
+        generate_raw(raw, args.rows)
+
+        per_column_s = timed(process_data_per_column, raw, before)
+        single_pass_s = timed(process_data_single_pass, raw, after)
+
+        identical = filecmp.cmp(before, after, shallow=False)
+        differing_rows = (
+            duckdb.connect()
+            .execute(
+                f"""
+                SELECT COUNT(*) FROM (
+                    (SELECT * FROM '{before}' EXCEPT ALL SELECT * FROM '{after}')
+                    UNION ALL
+                    (SELECT * FROM '{after}' EXCEPT ALL SELECT * FROM '{before}')
+                )
+                """
+            )
+            .fetchone()[0]
+        )
+
+    print(f"{'rows':>10} {'per-column s':>13} {'single-pass s':>14} {'speedup':>8}")
+    print(
+        f"{args.rows:>10} {per_column_s:>13.2f} {single_pass_s:>14.2f} "
+        f"{per_column_s / single_pass_s:>7.1f}x"
+    )
+    print(f"identical files: {identical}, differing rows: {differing_rows}")
+
+
+if __name__ == "__main__":
+    main()
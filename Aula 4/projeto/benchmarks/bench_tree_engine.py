@@ -0,0 +1,49 @@
+"""Compare XGBRegressor.predict with the NumPy TreeEnsemble evaluator.
+
+Run from the project root:
+
+    python -m benchmarks.bench_tree_engine
+"""
+
+import timeit
+
+import numpy as np
+
+from src.models.predict import FEATURE_COLUMNS
+from src.utils import model_utils
+
+BATCH_SIZES = [1, 10, 100, 1000]
+REPEATS = 5
+
+
+def best_time_ms(func, number: int) -> float:
+    """Return the best per-call time in milliseconds over REPEATS runs."""
+    return min(timeit.repeat(func, number=number, repeat=REPEATS)) / number * 1000
+
+
+def main():
+    # Both predictors read the same file: the version the API serves now
+    path = model_utils.get_artifact_path("xgboost")
+    model = model_utils.load_xgboost_model(path)
+    engine = model_utils.load_xgboost_engine(path)
+    print(f"model: {path}")
+    rng = np.random.default_rng(42)
+
+    print(f"{'rows':>6} {'xgboost ms':>12} {'numpy ms':>10} {'speedup':>8}")
+    for batch_size in BATCH_SIZES:
+        features = rng.uniform(
+            0, [5e7, 5e6, 2e6], size=(batch_size, len(FEATURE_COLUMNS))
+        ).astype(np.float32)
+        np.testing.assert_allclose(
+            engine.predict(features), model.predict(features), rtol=1e-5, atol=1e-2
+        )
+        number = max(1, 2000 // batch_size)
+        xgb_ms = best_time_ms(lambda: model.predict(features), number)
+        numpy_ms = best_time_ms(lambda: engine.predict(features), number)
+        print(
+            f"{batch_size:>6} {xgb_ms:>12.4f} {numpy_ms:>10.4f} {xgb_ms / numpy_ms:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,47 +1,121 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
 from src.api import routes
+from src.monitoring import timing
+from src.monitoring.logging_pipeline import LogPipeline
+from src.monitoring.profiling import profiler
+from src.monitoring.prometheus import REGISTRY, CallbackMetric
+from src.monitoring.retention import RetentionTask
 from src.utils import db_manager
+from src.utils.sharded_db_manager import SHARD_MODE, SHARD_RETENTION_ERROR
+from src.utils.write_behind import WriteBehindBuffer
 import datetime
 import logging
-import os
 
-LOGGING_PATH = os.path.join("logs", "app.log")
-logging.basicConfig(
-    filename=LOGGING_PATH,  # specify the file name and path
-    level=logging.DEBUG,  # set the logging level to DEBUG
-    format="%(asctime)s - %(levelname)s - %(message)s",  # specify the format
-    datefmt="%Y-%m-%d %H:%M:%S",
-)  # format for the date in the log messages
+# Os registros vão para uma fila; uma thread grava o arquivo (JSON, com rotação)
+log_pipeline = LogPipeline()
+log_pipeline.install()
 
 
-app = FastAPI()
+# Um único DBManager para toda a aplicação (compartilhado com routes);
+# cada thread usa o próprio cursor
+db = db_manager.get_db_manager()
 
-# Inicializando o DBManager e configurando as tabelas
-db = db_manager.DBManager()
-db.setup_tables()
+# As métricas operacionais são gravadas em lote por uma thread em segundo plano
+operational_metrics_buffer = WriteBehindBuffer(
+    name="operational_metrics",
+    columns=["timestamp", "method", "url", "response_status", "latency", "route"]
+    + timing.STAGE_COLUMNS,
+    flush_fn=db.insert_operational_metrics,
+)
+
+REQUEST_LATENCY = REGISTRY.histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template.",
+    ("method", "route", "status"),
+)
+
+# Retenção periódica (RETENTION_INTERVAL_HOURS); no modo shard os dados ficam
+# nos segmentos e a retenção roda sobre o banco principal
+retention_task = RetentionTask(db)
+
+
+REGISTRY.register(
+    CallbackMetric(
+        "log_records_dropped_total",
+        "Log records dropped because the log queue was full.",
+        lambda: {(): log_pipeline.stats()["dropped_records"]},
+    )
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if SHARD_MODE and retention_task.interval > 0:
+        # Os workers não abrem o banco principal, onde a retenção é aplicada
+        raise RuntimeError(SHARD_RETENTION_ERROR)
+    log_pipeline.start()
+    db.connect()
+    db.setup_tables()
+    operational_metrics_buffer.start()
+    routes.prediction_buffer.start()
+    retention_task.start()
+    yield
+    retention_task.stop()
+    # Gravar o que ainda estiver nos buffers antes de encerrar
+    routes.prediction_buffer.stop()
+    operational_metrics_buffer.stop()
+    db.close()
+    log_pipeline.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 @app.middleware("http")
 async def log_and_store_requests(request: Request, call_next):
+    # Relógio de parede só para o timestamp; durações vêm do perf_counter_ns
     start_time = datetime.datetime.now()
+    request_timing = timing.start_request()
+    profile_id = profiler.start_request(request.headers)
 
     response = await call_next(request)
 
-    end_time = datetime.datetime.now()
-    latency = end_time - start_time
-    latency_miliseconds = latency.total_seconds() / 1000
+    total_ns = timing.finish_request(request_timing)
+    latency_miliseconds = total_ns / 1e6
+    # Numa resposta em streaming o corpo ainda não foi enviado: o total seria falso
+    if not request_timing.streaming:
+        response.headers["Server-Timing"] = request_timing.server_timing(total_ns)
+    if profile_id is not None:
+        response.headers["X-Profile-Id"] = profile_id
 
     logging.info(
         f"Request: {request.method} {request.url} - Response: {response.status_code} - Latency: {latency_miliseconds} ms"
     )
 
-    # Usando o DBManager para inserir métricas no banco de dados
-    db.insert_operational_metric(
-        start_time,
+    # Rota com o caminho declarado (ex.: /prediction/{prediction_id}), para
+    # que os rollups não tenham uma chave por ID
+    route = request.scope.get("route")
+    route_path = getattr(route, "path", request.url.path)
+    # Caminhos sem rota ficam agrupados, para não criar uma série por URL
+    REQUEST_LATENCY.observe(
+        total_ns / 1e9,
         request.method,
-        str(request.url),
+        route_path if route is not None else "unmatched",
         response.status_code,
-        latency_miliseconds,
+    )
+
+    # Enfileirando a métrica; a gravação no banco acontece fora da requisição
+    operational_metrics_buffer.append(
+        (
+            start_time,
+            request.method,
+            str(request.url),
+            response.status_code,
+            latency_miliseconds,
+            route_path,
+            *request_timing.stages_ms().values(),
+        )
     )
 
     return response
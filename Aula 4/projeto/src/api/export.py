@@ -0,0 +1,109 @@
+import io
+import json
+
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+
+def _json_default(value):
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def ndjson_chunks(batches):
+    """Serialize Arrow record batches as newline-delimited JSON, one chunk per batch."""
+    for batch in batches:
+        yield "".join(
+            json.dumps(row, default=_json_default) + "\n" for row in batch.to_pylist()
+        ).encode()
+
+
+def csv_chunks(batches):
+    """Serialize Arrow record batches as CSV, writing the header only once."""
+    include_header = True
+    for batch in batches:
+        buffer = io.BytesIO()
+        pa_csv.write_csv(
+            batch, buffer, pa_csv.WriteOptions(include_header=include_header)
+        )
+        include_header = False
+        yield buffer.getvalue()
+
+
+class _ChunkSink:
+    """Write-only file object whose bytes are taken out as they are written."""
+
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+def arrow_stream_chunks(batches):
+    """Serialize record batches in the Arrow IPC streaming format."""
+    sink = _ChunkSink()
+    writer = None
+    for batch in batches:
+        if writer is None:
+            writer = pa.ipc.new_stream(sink, batch.schema)
+        writer.write_batch(batch)
+        yield sink.take()
+    if writer is not None:
+        writer.close()
+        yield sink.take()
+
+
+def parquet_chunks(batches):
+    """Serialize record batches as a Parquet file, one row group per batch."""
+    sink = _ChunkSink()
+    writer = None
+    for batch in batches:
+        if writer is None:
+            writer = pq.ParquetWriter(sink, batch.schema)
+        writer.write_batch(batch)
+        yield sink.take()
+    if writer is not None:
+        writer.close()
+        yield sink.take()
+
+
+# format -> (media type, serializer)
+STREAM_FORMATS = {
+    "ndjson": ("application/x-ndjson", ndjson_chunks),
+    "csv": ("text/csv", csv_chunks),
+    "arrow": ("application/vnd.apache.arrow.stream", arrow_stream_chunks),
+    "parquet": ("application/vnd.apache.parquet", parquet_chunks),
+}
+MEDIA_TYPE_FORMATS = {
+    media_type: data_format for data_format, (media_type, _) in STREAM_FORMATS.items()
+}
+
+
+def format_from_accept(accept: str) -> str:
+    """Return the first format listed in an Accept header, or None."""
+    for media_type in (accept or "").split(","):
+        data_format = MEDIA_TYPE_FORMATS.get(media_type.split(";")[0].strip())
+        if data_format is not None:
+            return data_format
+    return None
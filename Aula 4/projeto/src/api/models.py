@@ -18,14 +18,67 @@ class PredictionData(BaseModel):
     model_type: Optional[str] = "xgboost"
 
 
+class BatchPredictionData(BaseModel):
+    # {
+    #     "ASK": [2397890.0, 1432100.0],
+    #     "ATK": [277088.0, 160025.0],
+    #     "COMBUSTIVEL_LITROS": [85952.0, 51200.0]
+    # }
+    ASK: List[float]
+    ATK: List[float]
+    COMBUSTIVEL_LITROS: List[float]
+    model_type: Optional[str] = "xgboost"
+
+
 class PredictionUpdate(BaseModel):
     actual_value: float
 
 
+class ActualValuesResponse(BaseModel):
+    received: int
+    updated: int
+    missing: int
+    duplicated: int
+
+
+class ModelVersionsResponse(BaseModel):
+    current_version: Optional[str]
+    versions: List[dict]
+
+
 class ModelMetricsResponse(BaseModel):
     metrics: List[dict]
     predictions: List[dict]
+    by_model_type: List[dict] = []
+    # Cursores para a próxima página (None quando não há mais linhas)
+    next_after_id: Optional[int] = None
+    next_metrics_after_id: Optional[int] = None
 
 
 class OperationalMetricsResponse(BaseModel):
     metrics: List[dict]
+    next_after_id: Optional[int] = None
+
+
+class OperationalRollupsResponse(BaseModel):
+    granularity: str
+    rollups: List[dict]
+
+
+class CacheMetricsResponse(BaseModel):
+    models: dict
+    predictions: dict
+
+
+class BatcherMetricsResponse(BaseModel):
+    enabled: bool
+    xgboost: Optional[dict] = None
+
+
+class ProfilingSettings(BaseModel):
+    # Fração das requisições que é perfilada (0 desliga)
+    sample_rate: float
+
+
+class ProfileListResponse(BaseModel):
+    profiles: List[dict]
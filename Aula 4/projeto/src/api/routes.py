@@ -1,59 +1,225 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.routing import APIRoute
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from typing import Optional
 import datetime
-import pandas as pd
-from src.models import train, predict
+import time
+from src.data import process_data
+from src.models import train, predict, batcher
+from src.monitoring import ground_truth, timing
+from src.monitoring.profiling import profiler, profiled_endpoint
+from src.monitoring.prometheus import REGISTRY, CallbackMetric
 from src.utils import model_utils, db_manager
+from src.utils.prediction_cache import prediction_cache
+from src.utils.write_behind import WriteBehindBuffer, get_buffer_stats
+from .export import STREAM_FORMATS, format_from_accept
 from .models import (
     PredictionData,
+    BatchPredictionData,
     PredictionUpdate,
+    ActualValuesResponse,
     ModelMetricsResponse,
     OperationalMetricsResponse,
+    OperationalRollupsResponse,
+    CacheMetricsResponse,
+    BatcherMetricsResponse,
+    ModelVersionsResponse,
+    ProfilingSettings,
+    ProfileListResponse,
 )
 import os
 import logging
 
-router = APIRouter()
-db = db_manager.DBManager()
-PARQUET_PATH = os.path.join("data", "processed", "input_dataset.parquet")
+
+class TimedRoute(APIRoute):
+    """Rota que mede as etapas da requisição e, quando pedido, gera um perfil."""
+
+    def __init__(self, path, endpoint, **kwargs):
+        endpoint = timing.timed_endpoint(profiled_endpoint(endpoint))
+        super().__init__(path, endpoint, **kwargs)
+
+
+router = APIRouter(route_class=TimedRoute)
+db = db_manager.get_db_manager()
+MAX_BATCH_SIZE = 50_000
+PREDICTION_ID_BLOCK_SIZE = int(os.getenv("PREDICTION_ID_BLOCK_SIZE", "1000"))
+METRICS_PAGE_SIZE = int(os.getenv("METRICS_PAGE_SIZE", "1000"))
+MAX_METRICS_PAGE_SIZE = 100_000
+
+# As previsões recebem um ID na hora e são gravadas em lote depois
+prediction_ids = db_manager.IdBlockAllocator(
+    db.allocate_prediction_ids, PREDICTION_ID_BLOCK_SIZE
+)
+prediction_buffer = WriteBehindBuffer(
+    name="predictions",
+    columns=["id", "timestamp", "model_type", "input_data", "predicted_value"],
+    flush_fn=db.insert_prediction_records,
+    flush_when_full=True,
+)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+PREDICTION_LATENCY = REGISTRY.histogram(
+    "prediction_duration_seconds",
+    "Time to serve one prediction, including cache lookups.",
+    ("model_type", "cache"),
+)
+BATCH_PREDICTION_LATENCY = REGISTRY.histogram(
+    "batch_prediction_duration_seconds",
+    "Time to compute the predictions of one batch request.",
+    ("model_type",),
+)
+# Os caches já contam acertos e erros; os valores são lidos só na coleta
+REGISTRY.register(
+    CallbackMetric(
+        "prediction_cache_requests_total",
+        "Prediction cache lookups by result.",
+        lambda: {
+            ("hit",): prediction_cache.stats()["hits"],
+            ("miss",): prediction_cache.stats()["misses"],
+        },
+        ("result",),
+    )
+)
+REGISTRY.register(
+    CallbackMetric(
+        "model_cache_requests_total",
+        "Model cache lookups by result.",
+        lambda: {
+            (result,): model_utils.get_model_cache_stats()[counter]
+            for result, counter in (
+                ("hit", "hits"),
+                ("miss", "misses"),
+                ("reload", "reloads"),
+            )
+        },
+        ("result",),
+    )
+)
+REGISTRY.register(
+    CallbackMetric(
+        "write_behind_dropped_rows_total",
+        "Rows dropped because a write-behind buffer was full.",
+        lambda: {
+            (name,): stats["dropped_rows"] for name, stats in get_buffer_stats().items()
+        },
+        ("buffer",),
+    )
+)
 
 
 @router.post("/train")
-def train_models():
-    df = pd.read_parquet(PARQUET_PATH)
+def train_models(
+    start_date: Optional[datetime.date] = None,
+    end_date: Optional[datetime.date] = None,
+):
+    # Só as partições (ANO/MES) do período pedido são lidas
+    df = process_data.read_processed(train.TRAINING_COLUMNS, start_date, end_date)
+    if df.empty:
+        raise HTTPException(
+            status_code=400, detail="No training data for the requested period"
+        )
 
     # Train the models
     baseline_value = train.train_baseline_model(df)
     xgb_model = train.train_xgboost_model(df)
 
-    # Save the models
-    model_utils.save_baseline_model(baseline_value)
-    model_utils.save_xgboost_model(xgb_model)
-    logging.info("Models trained and saved successfully.")
-    return {"message": "Models trained successfully"}
+    # Save the models as a new registry version
+    manifest = model_utils.publish_models(
+        xgb_model,
+        baseline_value,
+        metadata={
+            "data_path": process_data.processed_data_path(),
+            "start_date": start_date,
+            "end_date": end_date,
+            "training_rows": len(df),
+            "baseline_value": float(baseline_value),
+            "xgboost_params": xgb_model.get_xgb_params(),
+        },
+    )
+    prediction_cache.clear()
+    logging.info(f"Models trained and saved successfully as {manifest['version']}.")
+    return {"message": "Models trained successfully", "version": manifest["version"]}
+
+
+@router.get("/models/versions")
+def get_model_versions() -> ModelVersionsResponse:
+    return ModelVersionsResponse(
+        current_version=model_utils.get_current_version(),
+        versions=model_utils.list_model_versions(),
+    )
+
+
+@router.post("/models/rollback")
+def rollback_models():
+    try:
+        manifest = model_utils.rollback_models()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    prediction_cache.clear()
+    logging.info(f"Models rolled back to version {manifest['version']}.")
+    return {"message": "Models rolled back", "version": manifest["version"]}
+
+
+def compute_prediction(model_type: str, data: dict) -> float:
+    if model_type == "baseline":
+        with timing.stage("model_load"):
+            baseline_value = model_utils.get_baseline_model()
+        with timing.stage("inference"):
+            return predict.predict_baseline(data, baseline_value)
+    if batcher.MICROBATCH_ENABLED:
+        # O modelo é carregado pela thread do batcher
+        with timing.stage("inference"):
+            return batcher.get_xgboost_batcher().predict(data)
+    with timing.stage("model_load"):
+        xgb_model = model_utils.get_xgboost_predictor()
+    with timing.stage("inference"):
+        return predict.predict_xgboost(data, xgb_model)
 
 
 @router.post("/predict")
 def predict_model(prediction_data: PredictionData):
-    if prediction_data.model_type == "baseline":
-        baseline_value = model_utils.load_baseline_model()
-        prediction = predict.predict_baseline(prediction_data.data, baseline_value)
-    elif prediction_data.model_type == "xgboost":
-        xgb_model = model_utils.load_xgboost_model()
-        prediction = predict.predict_xgboost(prediction_data.data, xgb_model)
-    else:
+    if prediction_data.model_type not in model_utils.MODEL_TYPES:
         raise HTTPException(status_code=400, detail="Model type not supported")
-    # Salvar a previsão no banco de dados
+    data = prediction_data.data
+    if prediction_data.model_type != "baseline":
+        # Entrada inválida é erro do cliente, não do cache nem do modelo
+        try:
+            data = predict.validate_features(data)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    started = time.perf_counter()
+    # Reaproveitar previsões já calculadas para a mesma versão do modelo
+    with timing.stage("model_load"):
+        model_version = model_utils.get_model_version(prediction_data.model_type)
+    cache_key = prediction_cache.make_key(
+        prediction_data.model_type, model_version, data
+    )
+    prediction = prediction_cache.get(cache_key)
+    cache_result = "hit"
+    if prediction is None:
+        cache_result = "miss"
+        prediction = compute_prediction(prediction_data.model_type, data)
+        prediction_cache.put(cache_key, prediction)
+    PREDICTION_LATENCY.observe(
+        time.perf_counter() - started, prediction_data.model_type, cache_result
+    )
+
+    # Enfileirar a previsão para gravação em lote, já com o ID reservado
     try:
-        current_timestamp = (
-            datetime.datetime.now()
-        )  # você pode precisar importar datetime
-        db.insert_prediction(
-            timestamp=current_timestamp,
-            model_type=prediction_data.model_type,
-            input_data=str(prediction_data.data),
-            predicted_value=prediction,
-        )
-        logging.info(f"Prediction saved for model {prediction_data.model_type}.")
+        with timing.stage("db_write"):
+            prediction_id = prediction_ids.next_id()
+            prediction_buffer.append(
+                (
+                    prediction_id,
+                    datetime.datetime.now(),
+                    prediction_data.model_type,
+                    str(prediction_data.data),
+                    prediction,
+                )
+            )
+        logging.info(f"Prediction queued for model {prediction_data.model_type}.")
     except Exception as e:
         logging.error(f"Error saving prediction: {e}")
         # Caso haja algum erro ao salvar no banco de dados, você pode lidar com ele aqui
@@ -61,13 +227,75 @@ def predict_model(prediction_data: PredictionData):
             status_code=500, detail=f"Error saving prediction: {str(e)}"
         )
 
-    return {"prediction": prediction}
+    return {"prediction": prediction, "prediction_id": prediction_id}
+
+
+@router.post("/predict/batch")
+def predict_batch(batch_data: BatchPredictionData):
+    data = {column: getattr(batch_data, column) for column in predict.FEATURE_COLUMNS}
+    sizes = {len(values) for values in data.values()}
+    if len(sizes) != 1:
+        raise HTTPException(
+            status_code=400,
+            detail="ASK, ATK and COMBUSTIVEL_LITROS must have the same length",
+        )
+    batch_size = sizes.pop()
+    if batch_size > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400, detail=f"Batch size must not exceed {MAX_BATCH_SIZE} rows"
+        )
+
+    started = time.perf_counter()
+    if batch_data.model_type == "baseline":
+        with timing.stage("model_load"):
+            baseline_value = model_utils.get_baseline_model()
+        with timing.stage("inference"):
+            predictions = predict.predict_baseline_batch(data, baseline_value)
+    elif batch_data.model_type == "xgboost":
+        with timing.stage("model_load"):
+            xgb_model = model_utils.get_xgboost_predictor(batch_size)
+        with timing.stage("inference"):
+            predictions = predict.predict_xgboost_batch(data, xgb_model)
+    else:
+        raise HTTPException(status_code=400, detail="Model type not supported")
+    predictions = predictions.tolist()
+    BATCH_PREDICTION_LATENCY.observe(
+        time.perf_counter() - started, batch_data.model_type
+    )
+
+    # Salvar todas as previsões do lote com um único INSERT
+    try:
+        input_data = [
+            str(dict(zip(predict.FEATURE_COLUMNS, row))) for row in zip(*data.values())
+        ]
+        with timing.stage("db_write"):
+            prediction_ids_batch = db.allocate_prediction_ids(batch_size)
+            db.insert_predictions(
+                timestamp=datetime.datetime.now(),
+                model_type=batch_data.model_type,
+                input_data=input_data,
+                predicted_values=predictions,
+                ids=prediction_ids_batch,
+            )
+        logging.info(
+            f"Batch of {batch_size} predictions saved for model {batch_data.model_type}."
+        )
+    except Exception as e:
+        logging.error(f"Error saving batch predictions: {e}")
+        raise HTTPException(
+            status_code=500, detail=f"Error saving batch predictions: {str(e)}"
+        )
+
+    return {"predictions": predictions, "prediction_ids": prediction_ids_batch}
 
 
 @router.put("/prediction/{prediction_id}")
 def update_prediction(prediction_id: int, update_data: PredictionUpdate):
     try:
-        db.update_actual_value_by_id(prediction_id, update_data.actual_value)
+        with timing.stage("db_write"):
+            # Garantir que previsões ainda no buffer já estejam no banco
+            prediction_buffer.flush()
+            db.update_actual_value_by_id(prediction_id, update_data.actual_value)
         logging.info(f"Prediction with ID {prediction_id} updated successfully.")
         return {"message": f"Prediction with ID {prediction_id} updated successfully"}
     except Exception as e:
@@ -75,24 +303,236 @@ def update_prediction(prediction_id: int, update_data: PredictionUpdate):
         raise HTTPException(status_code=400, detail=str(e))
 
 
+def apply_actual_values(content: bytes, content_type: str) -> dict:
+    updates = ground_truth.read_actual_values(
+        content, ground_truth.format_from_content_type(content_type)
+    )
+    with timing.stage("db_write"):
+        # Garantir que previsões ainda no buffer já estejam no banco
+        prediction_buffer.flush()
+        return db.update_actual_values(updates)
+
+
+@router.post("/predictions/actuals")
+async def update_actual_values(request: Request) -> ActualValuesResponse:
+    # Corpo lido cru para aceitar JSON, CSV ou Parquet conforme o Content-Type
+    content = await request.body()
+    try:
+        result = await run_in_threadpool(
+            apply_actual_values, content, request.headers.get("content-type")
+        )
+    except Exception as e:
+        logging.error(f"Error updating actual values: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+    logging.info(
+        f"Actual values updated: {result['updated']} updated, {result['missing']} missing."
+    )
+    return ActualValuesResponse(**result)
+
+
+def next_after_id(rows: list, limit: int) -> Optional[int]:
+    # Página cheia: pode haver mais linhas depois do último ID
+    return rows[-1]["id"] if len(rows) == limit else None
+
+
 @router.get("/metrics/model")
-def get_model_metrics() -> ModelMetricsResponse:
+def get_model_metrics(
+    after_id: Optional[int] = None,
+    metrics_after_id: Optional[int] = None,
+    limit: int = Query(METRICS_PAGE_SIZE, ge=1, le=MAX_METRICS_PAGE_SIZE),
+    start_time: Optional[datetime.datetime] = None,
+    end_time: Optional[datetime.datetime] = None,
+) -> ModelMetricsResponse:
     try:
-        metrics = db.fetch_ml_metrics()
-        predictions = db.fetch_predictions()
+        time_range = {"start_time": start_time, "end_time": end_time}
+        metrics = db.fetch_ml_metrics(
+            after_id=metrics_after_id, limit=limit, **time_range
+        )
+        predictions = db.fetch_predictions(after_id=after_id, limit=limit, **time_range)
+        by_model_type = db.fetch_metric_aggregates()
         logging.info("Model metrics fetched successfully.")
-        return ModelMetricsResponse(metrics=metrics, predictions=predictions)
+        return ModelMetricsResponse(
+            metrics=metrics,
+            predictions=predictions,
+            by_model_type=by_model_type,
+            next_after_id=next_after_id(predictions, limit),
+            next_metrics_after_id=next_after_id(metrics, limit),
+        )
     except Exception as e:
         logging.error(f"Error fetching model metrics: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/metrics/model/recompute")
+def recompute_model_metrics():
+    try:
+        prediction_buffer.flush()
+        db.recompute_metric_aggregates()
+        logging.info("Model metrics recomputed successfully.")
+        return {"by_model_type": db.fetch_metric_aggregates()}
+    except Exception as e:
+        logging.error(f"Error recomputing model metrics: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/metrics/operational")
-def get_operational_metrics() -> OperationalMetricsResponse:
+def get_operational_metrics(
+    after_id: Optional[int] = None,
+    limit: int = Query(METRICS_PAGE_SIZE, ge=1, le=MAX_METRICS_PAGE_SIZE),
+    start_time: Optional[datetime.datetime] = None,
+    end_time: Optional[datetime.datetime] = None,
+) -> OperationalMetricsResponse:
     try:
-        metrics = db.fetch_operational_metrics()
+        metrics = db.fetch_operational_metrics(
+            after_id=after_id, limit=limit, start_time=start_time, end_time=end_time
+        )
         logging.info("Operational metrics fetched successfully.")
-        return OperationalMetricsResponse(metrics=metrics)
+        return OperationalMetricsResponse(
+            metrics=metrics, next_after_id=next_after_id(metrics, limit)
+        )
     except Exception as e:
         logging.error(f"Error fetching operational metrics: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/metrics/operational/rollups")
+def get_operational_rollups(
+    granularity: str = "minute",
+    start_time: Optional[datetime.datetime] = None,
+    end_time: Optional[datetime.datetime] = None,
+    route: Optional[str] = None,
+    by_status: bool = True,
+) -> OperationalRollupsResponse:
+    if granularity not in db_manager.ROLLUP_GRANULARITIES:
+        raise HTTPException(
+            status_code=400, detail=f"Granularity {granularity} not supported"
+        )
+    try:
+        rollups = db.fetch_operational_rollups(
+            granularity,
+            start_time=start_time,
+            end_time=end_time,
+            route=route,
+            by_status=by_status,
+        )
+        return OperationalRollupsResponse(granularity=granularity, rollups=rollups)
+    except Exception as e:
+        logging.error(f"Error fetching operational rollups: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/metrics/export/{table}")
+def export_table(
+    table: str,
+    request: Request,
+    format: Optional[str] = None,
+    columns: Optional[str] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    start_time: Optional[datetime.datetime] = None,
+    end_time: Optional[datetime.datetime] = None,
+    include_archive: bool = False,
+):
+    if table not in db_manager.TABLE_COLUMNS:
+        raise HTTPException(status_code=404, detail=f"Table {table} not found")
+    # format= tem prioridade sobre o header Accept; NDJSON é o padrão
+    format = format or format_from_accept(request.headers.get("accept")) or "ndjson"
+    if format not in STREAM_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Format {format} not supported")
+    selected_columns = None
+    if columns:
+        selected_columns = [column.strip() for column in columns.split(",")]
+        unknown_columns = set(selected_columns) - set(db_manager.TABLE_COLUMNS[table])
+        if unknown_columns:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown columns: {', '.join(sorted(unknown_columns))}",
+            )
+
+    # A tabela é lida em lotes enquanto a resposta é enviada
+    media_type, serialize = STREAM_FORMATS[format]
+    batches = db.iter_record_batches(
+        table,
+        columns=selected_columns,
+        after_id=after_id,
+        limit=limit,
+        start_time=start_time,
+        end_time=end_time,
+        include_archive=include_archive,
+    )
+    return StreamingResponse(serialize(batches), media_type=media_type)
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def get_prometheus_metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+@router.get("/metrics/cache")
+def get_cache_metrics() -> CacheMetricsResponse:
+    return CacheMetricsResponse(
+        models=model_utils.get_model_cache_stats(),
+        predictions=prediction_cache.stats(),
+    )
+
+
+@router.get("/metrics/batcher")
+def get_batcher_metrics() -> BatcherMetricsResponse:
+    if not batcher.MICROBATCH_ENABLED:
+        return BatcherMetricsResponse(enabled=False)
+    return BatcherMetricsResponse(
+        enabled=True, xgboost=batcher.get_xgboost_batcher().stats()
+    )
+
+
+@router.get("/metrics/write_behind")
+def get_write_behind_metrics():
+    return get_buffer_stats()
+
+
+def require_profile_token(request: Request):
+    if not profiler.is_authorized(request.headers):
+        raise HTTPException(
+            status_code=403, detail="Missing or invalid X-Profile-Token header"
+        )
+
+
+@router.get("/admin/profiling")
+def get_profiling_settings(request: Request) -> ProfilingSettings:
+    require_profile_token(request)
+    return ProfilingSettings(sample_rate=profiler.sample_rate)
+
+
+@router.put("/admin/profiling")
+def update_profiling_settings(
+    request: Request, settings: ProfilingSettings
+) -> ProfilingSettings:
+    require_profile_token(request)
+    if not 0 <= settings.sample_rate <= 1:
+        raise HTTPException(
+            status_code=400, detail="sample_rate must be between 0 and 1"
+        )
+    profiler.sample_rate = settings.sample_rate
+    logging.info(f"Profiling sample rate set to {settings.sample_rate}.")
+    return settings
+
+
+@router.get("/admin/profiles")
+def list_profiles(request: Request) -> ProfileListResponse:
+    require_profile_token(request)
+    return ProfileListResponse(profiles=profiler.list_profiles())
+
+
+@router.get("/admin/profiles/{request_id}")
+def download_profile(request: Request, request_id: str):
+    require_profile_token(request)
+    try:
+        path = profiler.path(request_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    # Abrir com: python -m pstats <arquivo> ou snakeviz <arquivo>
+    return FileResponse(
+        path, media_type="application/octet-stream", filename=f"{request_id}.prof"
+    )
@@ -0,0 +1,263 @@
+"""Repair ANAC JSON exports and convert them to typed Parquet, streaming.
+
+The ANAC JSON exports are several JSON arrays glued together
+(``..."}][{"...``), so json.loads rejects them. This module fixes the
+defect chunk by chunk, decodes the records one at a time and writes them
+to Parquet in row groups, so memory is bounded by the chunk size and the
+row group size rather than by the size of the file. Run from the project
+root (.gz files are accepted):
+
+    python -m src.data.fix_json
+    python -m src.data.fix_json data/raw/Dados_Estatisticos_2021_a_2030.json --output data/raw/dataset.parquet
+    python -m src.data.fix_json export.json --format json --output fixed.json
+"""
+
+import argparse
+import gzip
+import json
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.data import process_data as processing
+
+RAW_JSON_PATH = os.path.join("data", processing.config["DEFAULT"]["RAW_JSON_PATH"])
+CHUNK_SIZE = 1024 * 1024  # characters
+ROW_GROUP_SIZE = 100_000
+# Longest record accepted; past it a record that does not decode is malformed
+MAX_RECORD_SIZE = 1024 * 1024
+
+# The defect: the end of one array glued to the start of the next one
+BROKEN_SEPARATOR = '"}][{"'
+FIXED_SEPARATOR = '"},{"'
+
+ARROW_TYPES = {
+    "REAL": pa.float32(),
+    "FLOAT": pa.float32(),
+    "DOUBLE": pa.float64(),
+    "INTEGER": pa.int32(),
+    "BIGINT": pa.int64(),
+    "VARCHAR": pa.string(),
+}
+
+
+def open_text(path: str):
+    opener = gzip.open if path.lower().endswith(".gz") else open
+    return opener(path, "rt", encoding="utf-8-sig")
+
+
+def repaired_chunks(file, chunk_size: int = CHUNK_SIZE):
+    """Yield the text of ``file`` in chunks, with the glued arrays joined.
+
+    The last characters of each chunk are held back until the next one is
+    read, so a separator split between two chunks is still replaced.
+    """
+    keep = len(BROKEN_SEPARATOR) - 1
+    pending = ""
+    while True:
+        chunk = file.read(chunk_size)
+        if not chunk:
+            break
+        text = (pending + chunk).replace(BROKEN_SEPARATOR, FIXED_SEPARATOR)
+        pending = text[-keep:]
+        if len(text) > keep:
+            yield text[:-keep]
+    if pending:
+        yield pending
+
+
+def iter_records(chunks, max_record_size: int = MAX_RECORD_SIZE):
+    """Decode the objects of a (possibly concatenated) JSON array one by one.
+
+    ``chunks`` is an iterable of text. An object cut at the end of a chunk
+    is decoded again once the next chunk arrives; one that is still not
+    valid after more than ``max_record_size`` characters raises ValueError,
+    so a malformed file cannot make the buffer grow without bound.
+    """
+    decoder = json.JSONDecoder()
+    chunks = iter(chunks)
+    buffer, pos, offset = "", 0, 0
+    expect = "["
+    while True:
+        while pos < len(buffer) and buffer[pos] in " \t\r\n":
+            pos += 1
+        if pos == len(buffer):
+            chunk = next(chunks, None)
+            if chunk is None:
+                break
+            offset += pos
+            buffer, pos = chunk, 0
+            continue
+
+        char = buffer[pos]
+        if expect == "[":
+            if char != "[":
+                raise ValueError(f"Expected '[' at character {offset + pos}")
+            pos += 1
+            expect = "{]"
+        elif char == "," and expect == ",]":
+            pos += 1
+            expect = "{"
+        elif char == "]" and expect in (",]", "{]"):
+            pos += 1
+            expect = "["
+        elif char == "{" and expect in ("{", "{]"):
+            try:
+                record, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if len(buffer) - pos > max_record_size:
+                    raise ValueError(
+                        f"Malformed record at character {offset + pos}"
+                    ) from None
+                chunk = next(chunks, None)
+                if chunk is None:
+                    raise ValueError(
+                        f"Truncated record at character {offset + pos}"
+                    ) from None
+                offset += pos
+                buffer, pos = buffer[pos:] + chunk, 0
+                continue
+            yield record
+            pos = end
+            expect = ",]"
+        else:
+            raise ValueError(f"Unexpected {char!r} at character {offset + pos}")
+    if expect != "[":
+        raise ValueError("Truncated JSON: the last array is not closed")
+
+
+def column_types() -> dict:
+    """Return the Arrow type of the numeric and date columns from config.ini."""
+    return {
+        column: ARROW_TYPES[column_type]
+        for column, column_type in processing.csv_column_types().items()
+    }
+
+
+def to_number(value, arrow_type):
+    """Convert a JSON value to ``arrow_type``; None if it does not parse.
+
+    Strings may use a decimal comma and blanks are null, as in process_data.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        value = value.strip().replace(",", ".")
+        if not value:
+            return None
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    if pa.types.is_integer(arrow_type):
+        return int(number) if number.is_integer() else None
+    return number
+
+
+def records_schema(record: dict) -> pa.Schema:
+    """Build the schema from the first record; unconfigured columns are text."""
+    types = column_types()
+    return pa.schema([(name, types.get(name, pa.string())) for name in record])
+
+
+def records_table(records: list, schema: pa.Schema) -> pa.Table:
+    columns = []
+    for field in schema:
+        values = [record.get(field.name) for record in records]
+        if pa.types.is_string(field.type):
+            values = [None if v is None else str(v) for v in values]
+        else:
+            values = [to_number(v, field.type) for v in values]
+        columns.append(pa.array(values, type=field.type))
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def json_to_parquet(
+    path: str,
+    output_path: str,
+    chunk_size: int = CHUNK_SIZE,
+    row_group_size: int = ROW_GROUP_SIZE,
+) -> int:
+    """Write the records of an ANAC JSON export to Parquet, one row group at a time.
+
+    The columns are those of the first record; a later record with a
+    column not in it raises ValueError. On any error the previous output
+    is kept. Returns the number of rows.
+    """
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    tmp_path = output_path + ".tmp"
+    writer, schema, names, rows, batch = None, None, None, 0, []
+    try:
+        with open_text(path) as file:
+            for record in iter_records(repaired_chunks(file, chunk_size)):
+                if schema is None:
+                    schema = records_schema(record)
+                    names = set(schema.names)
+                    writer = pq.ParquetWriter(tmp_path, schema)
+                elif not record.keys() <= names:
+                    unknown = sorted(set(record) - names)
+                    raise ValueError(
+                        f"Record {rows + len(batch)} has new columns {unknown}"
+                    )
+                batch.append(record)
+                if len(batch) == row_group_size:
+                    writer.write_table(records_table(batch, schema))
+                    rows += len(batch)
+                    batch = []
+        if writer is None:
+            raise ValueError(f"No records in {path}")
+        if batch:
+            writer.write_table(records_table(batch, schema))
+            rows += len(batch)
+        writer.close()
+    except Exception:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, output_path)
+    return rows
+
+
+def fix_json(path: str, output_path: str, chunk_size: int = CHUNK_SIZE):
+    """Write the repaired JSON text of ``path`` to ``output_path``, streaming."""
+    with open_text(path) as source, open(
+        output_path + ".tmp", "w", encoding="utf-8"
+    ) as target:
+        for chunk in repaired_chunks(source, chunk_size):
+            target.write(chunk)
+    os.replace(output_path + ".tmp", output_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "path", nargs="?", default=RAW_JSON_PATH, help="ANAC JSON export (or .gz)"
+    )
+    parser.add_argument("--output", default=processing.INPUT_PATH)
+    parser.add_argument(
+        "--format",
+        choices=["parquet", "json"],
+        default="parquet",
+        help="write typed Parquet, or only the repaired JSON",
+    )
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--row-group-size", type=int, default=ROW_GROUP_SIZE)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        parser.error(f"{args.path} not found")
+    if args.format == "json":
+        fix_json(args.path, args.output, args.chunk_size)
+        print(f"Repaired JSON written to {args.output}")
+    else:
+        rows = json_to_parquet(
+            args.path, args.output, args.chunk_size, args.row_group_size
+        )
+        print(f"{rows} rows written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
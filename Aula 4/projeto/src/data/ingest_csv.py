@@ -0,0 +1,98 @@
+"""Ingest raw ANAC CSV files into the raw Parquet file.
+
+ANAC publishes semicolon-separated CSVs with decimal commas. DuckDB's
+parallel CSV reader parses them with the types from config.ini and the
+rows are streamed straight to Parquet, so nothing is loaded into memory
+as a whole. Run from the project root (globs and .gz files are accepted):
+
+    python -m src.data.ingest_csv
+    python -m src.data.ingest_csv "data/raw/*.CSV.gz" --output data/raw/dataset.parquet
+    python -m src.data.ingest_csv "data/raw/*.CSV" --encoding latin-1
+
+DuckDB only reads UTF-8, so files in another encoding (``--encoding`` or
+CSV_ENCODING in config.ini) are first converted to a temporary UTF-8
+copy next to the output. process_data also reads UTF-8 CSVs directly
+with ``--input``.
+"""
+
+import argparse
+import gzip
+import os
+import shutil
+import tempfile
+
+from src.data import process_data as processing
+
+
+def convert_to_utf8(files: list, encoding: str, directory: str) -> list:
+    """Write a UTF-8 copy of each (possibly gzipped) CSV into ``directory``."""
+    converted = []
+    for i, path in enumerate(files):
+        name = os.path.basename(path)
+        if name.lower().endswith(".gz"):
+            name = name[:-3]
+        target = os.path.join(directory, f"{i}-{name}")
+        opener = gzip.open if path.lower().endswith(".gz") else open
+        with opener(path, "rt", encoding=encoding, newline="") as source, open(
+            target, "w", encoding="utf-8", newline=""
+        ) as destination:
+            shutil.copyfileobj(source, destination, 1024 * 1024)
+        converted.append(target)
+    return converted
+
+
+def ingest_csv(
+    con, path, output_path: str, encoding: str = processing.CSV_ENCODING
+) -> int:
+    """Write the rows of the CSV files at ``path`` to ``output_path``.
+
+    A value that does not parse as its configured type fails the whole
+    ingestion, and the previous output is kept. Returns the number of rows.
+    """
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    if processing.is_utf8(encoding):
+        return copy_to_parquet(con, processing.csv_source_sql(path), output_path)
+    with tempfile.TemporaryDirectory(
+        dir=os.path.dirname(output_path) or "."
+    ) as directory:
+        files = convert_to_utf8(processing.expand_paths(path), encoding, directory)
+        source = processing.csv_source_sql(files, encoding="utf-8")
+        return copy_to_parquet(con, source, output_path)
+
+
+def copy_to_parquet(con, source: str, output_path: str) -> int:
+    try:
+        rows = con.execute(
+            f"COPY (SELECT * FROM {source}) TO '{output_path}.tmp' WITH (FORMAT 'PARQUET')"
+        ).fetchone()[0]
+    except Exception:
+        if os.path.exists(output_path + ".tmp"):
+            os.remove(output_path + ".tmp")
+        raise
+    os.replace(output_path + ".tmp", output_path)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "path", nargs="?", default=processing.RAW_CSV_PATH, help="CSV file or glob"
+    )
+    parser.add_argument("--output", default=processing.INPUT_PATH)
+    parser.add_argument(
+        "--encoding",
+        default=processing.CSV_ENCODING,
+        help="encoding of the CSV files, e.g. latin-1 (converted to UTF-8)",
+    )
+    args = parser.parse_args()
+
+    if not processing.expand_paths(args.path):
+        parser.error(f"no files match {args.path}")
+    con = processing.connect_to_db()
+    rows = ingest_csv(con, args.path, args.output, args.encoding)
+    con.close()
+    print(f"{rows} rows written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
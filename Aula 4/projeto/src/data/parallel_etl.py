@@ -0,0 +1,340 @@
+"""Process many raw ANAC files in parallel into the partitioned dataset.
+
+Each file (Parquet or CSV, optionally .gz) is transformed by its own worker
+process, with its own DuckDB connection limited to ``--threads`` threads,
+into a staged Parquet file. Completed files are recorded in a checkpoint,
+so a run that crashes or is interrupted resumes with the files that were
+not finished. The staged files are then merged into the ANO=/MES=
+partitions and manifest read by ``process_data.read_processed``; only the
+months whose raw rows changed are rewritten.
+
+Files of earlier runs stay in the dataset, so new files can be added a few
+at a time; ``--prune`` (implied by ``--full``) drops the files that are not
+in this run's input, with their partitions. Run from the project root:
+
+    python -m src.data.parallel_etl "data/raw/*.CSV.gz"
+    python -m src.data.parallel_etl data/raw --workers 8 --threads 2
+    python -m src.data.parallel_etl data/raw --prune
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import duckdb
+
+from src.data import process_data as processing
+
+STAGING_PATH = os.path.abspath(
+    os.path.join("data", processing.config["DEFAULT"]["ETL_STAGING_PATH"])
+)
+CHECKPOINT_FILE = "_checkpoint.json"
+RAW_EXTENSIONS = (".parquet", ".csv", ".csv.gz")
+
+
+def list_input_files(path: str) -> list:
+    """Return the raw files of a directory, or those matching a path or glob."""
+    if os.path.isdir(path):
+        return sorted(
+            os.path.abspath(os.path.join(path, name))
+            for name in os.listdir(path)
+            if name.lower().endswith(RAW_EXTENSIONS)
+        )
+    return [os.path.abspath(file) for file in processing.expand_paths(path)]
+
+
+def file_signature(path: str) -> list:
+    """Size and modification time; a file whose signature changed is redone."""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def staged_path(staging_dir: str, path: str) -> str:
+    name = hashlib.sha256(os.path.abspath(path).encode()).hexdigest()[:16]
+    return os.path.join(staging_dir, f"{name}.parquet")
+
+
+def read_checkpoint(staging_dir: str) -> dict:
+    path = os.path.join(staging_dir, CHECKPOINT_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def write_checkpoint(staging_dir: str, checkpoint: dict):
+    path = os.path.join(staging_dir, CHECKPOINT_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def is_current(entry: dict) -> bool:
+    """Whether the staged file of ``entry`` exists and has the current transformation.
+
+    The transformation is hashed again from the raw schema kept in the
+    entry, so a config.ini change makes every staged file out of date.
+    """
+    return (
+        entry is not None
+        and "schema" in entry
+        and os.path.exists(entry["staged"])
+        and entry["transform"] == processing.transform_hash(entry["schema"])
+    )
+
+
+def is_completed(entry: dict, path: str) -> bool:
+    return is_current(entry) and entry["signature"] == file_signature(path)
+
+
+def process_file(
+    path: str, staging_dir: str, threads: int, memory_limit: str = None
+) -> dict:
+    """Transform one raw file into its staged Parquet file (runs in a worker).
+
+    Returns the checkpoint entry of the file: its signature, staged file,
+    row count, raw schema, transformation hash and the fingerprint of each
+    of its ANO/MES partitions.
+    """
+    signature = file_signature(path)
+    staged = staged_path(staging_dir, path)
+    con = duckdb.connect()
+    try:
+        con.execute(f"SET threads TO {threads}")
+        if memory_limit:
+            con.execute(f"SET memory_limit = '{memory_limit}'")
+        source = processing.raw_source(path)
+        schema = processing.source_schema(con, source)
+        rows = con.execute(
+            f"COPY ({processing.transform_sql(schema, source)}) "
+            f"TO '{staged}.tmp' WITH (FORMAT 'PARQUET')"
+        ).fetchone()[0]
+        partitions = processing.partition_fingerprints(con, source, schema)
+    except Exception:
+        if os.path.exists(staged + ".tmp"):
+            os.remove(staged + ".tmp")
+        raise
+    finally:
+        con.close()
+    os.replace(staged + ".tmp", staged)
+    return {
+        "signature": signature,
+        "staged": staged,
+        "rows": rows,
+        "schema": schema,
+        "transform": processing.transform_hash(schema),
+        "partitions": partitions,
+    }
+
+
+def merge_partitions(
+    con, entries: dict, output_dir: str, full: bool = False, prune: bool = False
+) -> dict:
+    """Write the partitions of the staged files that changed since the last merge.
+
+    A month spread over several files gets the combined fingerprint of its
+    rows in all of them (counts and hash sums add up), so with a single raw
+    file the manifest is the same process_data.process_partitions writes.
+    Partitions in no file are removed only with ``prune``.
+    """
+    transforms = sorted({entry["transform"] for entry in entries.values()})
+    transform = (
+        transforms[0]
+        if len(transforms) == 1
+        else hashlib.sha256("".join(transforms).encode()).hexdigest()
+    )
+    manifest = processing.read_manifest(output_dir)
+    if full or manifest is None or manifest.get("transform") != transform:
+        manifest = {"transform": transform, "partitions": {}}
+
+    partitions, sources = {}, {}
+    for entry in entries.values():
+        for key, partition in entry["partitions"].items():
+            count, digest = partition["fingerprint"].split(":")
+            if key in partitions:
+                previous_count, previous_digest = partitions[key]["fingerprint"].split(
+                    ":"
+                )
+                count = int(count) + int(previous_count)
+                digest = int(digest) + int(previous_digest)
+            partitions[key] = {**partition, "fingerprint": f"{count}:{digest}"}
+            sources.setdefault(key, []).append(entry["staged"])
+
+    previous = manifest["partitions"]
+    changed = [
+        key
+        for key, partition in partitions.items()
+        if previous.get(key, {}).get("fingerprint") != partition["fingerprint"]
+    ]
+    removed = [key for key in previous if key not in partitions] if prune else []
+
+    os.makedirs(output_dir, exist_ok=True)
+    for key in changed:
+        file_list = ", ".join(f"'{path}'" for path in sources[key])
+        rows = f"read_parquet([{file_list}], union_by_name=true)"
+        previous[key] = processing.write_partition(
+            con, rows, output_dir, partitions[key]
+        )
+    for key in removed:
+        shutil.rmtree(os.path.join(output_dir, os.path.dirname(previous[key]["path"])))
+        del previous[key]
+    processing.write_manifest(output_dir, manifest)
+    return {
+        "processed": changed,
+        "skipped": len(partitions) - len(changed),
+        "removed": removed,
+    }
+
+
+def run(
+    files: list,
+    output_dir: str = processing.PARTITIONED_OUTPUT_PATH,
+    staging_dir: str = STAGING_PATH,
+    workers: int = None,
+    threads: int = None,
+    memory_limit: str = None,
+    full: bool = False,
+    prune: bool = False,
+) -> dict:
+    """Process ``files`` in a pool of ``workers`` processes and merge the result.
+
+    By default there is one worker per core and the cores are split evenly
+    between the workers' DuckDB connections. Files already in the
+    checkpoint with the same signature and transformation are not
+    processed again, unless ``full``. If any file fails, the completed ones
+    stay checkpointed, the output is left untouched and RuntimeError is
+    raised.
+
+    Files checkpointed by earlier runs are merged with ``files``; the ones
+    with an old transformation are processed again. With ``prune`` (or
+    ``full``) they are dropped instead, with their staged files and the
+    partitions only they had.
+    """
+    prune = prune or full
+    cores = os.cpu_count() or 1
+    os.makedirs(staging_dir, exist_ok=True)
+
+    checkpoint = read_checkpoint(staging_dir)
+    known = {} if full else checkpoint
+    entries = {path: known[path] for path in files if path in known}
+    pending = [path for path in files if not is_completed(entries.get(path), path)]
+    if not prune:
+        for path, entry in known.items():
+            if path in entries:
+                continue
+            if is_current(entry):
+                entries[path] = entry
+            elif os.path.exists(path):
+                pending.append(path)
+            else:
+                raise RuntimeError(
+                    f"{path} (from an earlier run) is out of date and no longer "
+                    "exists; rerun with --prune to drop it"
+                )
+
+    workers = min(workers or cores, max(len(pending), 1))
+    threads = threads or max(1, cores // workers)
+    logging.info(
+        f"{len(set(entries) - set(pending))} files already processed, {len(pending)} "
+        f"to process with {workers} workers x {threads} threads"
+    )
+
+    failed = {}
+    if pending:
+        # spawn: os processos filhos não herdam o estado do DuckDB do processo pai
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(workers, mp_context=context) as pool:
+            futures = {
+                pool.submit(
+                    process_file, path, staging_dir, threads, memory_limit
+                ): path
+                for path in pending
+            }
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    entries[path] = future.result()
+                except Exception as e:
+                    failed[path] = e
+                    logging.error(f"Error processing {path}: {e}")
+                    continue
+                # Checkpoint a cada arquivo concluído
+                write_checkpoint(staging_dir, {**checkpoint, **entries})
+                logging.info(f"Processed {path} ({entries[path]['rows']} rows)")
+    if failed:
+        raise RuntimeError(
+            f"{len(failed)} of {len(pending)} files failed; rerun to resume: "
+            + ", ".join(failed)
+        )
+
+    if prune:
+        # Arquivos fora da entrada deixam de fazer parte do checkpoint
+        for path, entry in checkpoint.items():
+            if path not in entries and os.path.exists(entry["staged"]):
+                os.remove(entry["staged"])
+    write_checkpoint(staging_dir, entries)
+
+    con = duckdb.connect()
+    try:
+        con.execute(f"SET threads TO {cores}")
+        result = merge_partitions(con, entries, output_dir, full, prune)
+    finally:
+        con.close()
+    result["files_processed"] = len(pending)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "path", help="directory of raw files, or a file or glob (Parquet or CSV)"
+    )
+    parser.add_argument("--workers", type=int, help="worker processes (default: cores)")
+    parser.add_argument(
+        "--threads", type=int, help="DuckDB threads per worker (default: cores/workers)"
+    )
+    parser.add_argument(
+        "--memory-limit", help="DuckDB memory limit per worker, e.g. 2GB"
+    )
+    parser.add_argument("--output", default=processing.PARTITIONED_OUTPUT_PATH)
+    parser.add_argument("--staging", default=STAGING_PATH)
+    parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="drop files of earlier runs that are not in this input",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="ignore the checkpoint and the manifest (implies --prune)",
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+
+    files = list_input_files(args.path)
+    if not files:
+        parser.error(f"no files match {args.path}")
+    result = run(
+        files,
+        args.output,
+        args.staging,
+        args.workers,
+        args.threads,
+        args.memory_limit,
+        args.full,
+        args.prune,
+    )
+    print(
+        f"{result['files_processed']} files processed; "
+        f"{len(result['processed'])} partitions written, {result['skipped']} "
+        f"unchanged, {len(result['removed'])} removed"
+    )
+
+
+if __name__ == "__main__":
+    main()
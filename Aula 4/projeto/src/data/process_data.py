@@ -1,6 +1,15 @@
+import argparse
+import codecs
+import datetime
 import duckdb
 import configparser
+import glob
+import gzip
+import hashlib
+import json
 import os
+import pandas as pd
+import shutil
 
 # Determine the location of the config.ini relative to the project root
 config_path = os.path.join("src", "data", "config.ini")
@@ -13,16 +22,161 @@ DATABASE_PATH = config["DEFAULT"]["DATABASE_PATH"]
 READ_ONLY = config.getboolean("DEFAULT", "READ_ONLY")
 INPUT_PATH = os.path.abspath(os.path.join("data", config["DEFAULT"]["INPUT_PATH"]))
 OUTPUT_PATH = os.path.abspath(os.path.join("data", config["DEFAULT"]["OUTPUT_PATH"]))
-DROP_COLUMNS = config["DEFAULT"]["DROP_COLUMNS"].split(",")
-NUMERIC_COLUMNS = config["DEFAULT"]["NUMERIC_COLUMNS"].split(",")
-DATE_COLUMNS = config["DEFAULT"]["DATE_COLUMNS"].split(",")
+# Saída particionada por ANO=/MES=, com um manifesto das partições processadas
+PARTITIONED_OUTPUT_PATH = os.path.abspath(
+    os.path.join("data", config["DEFAULT"]["PARTITIONED_OUTPUT_PATH"])
+)
+MANIFEST_FILE = "_manifest.json"
+RAW_CSV_PATH = os.path.join("data", config["DEFAULT"]["RAW_CSV_PATH"])
+CSV_SEPARATOR = config["DEFAULT"]["CSV_SEPARATOR"]
+CSV_DECIMAL_SEPARATOR = config["DEFAULT"]["CSV_DECIMAL_SEPARATOR"]
+CSV_ENCODING = config["DEFAULT"]["CSV_ENCODING"]
+# Rows inspected for untyped decimal-comma columns (DuckDB's sniffer sample)
+CSV_SAMPLE_ROWS = 20480
+NUMERIC_COLUMN_TYPE = config["DEFAULT"]["NUMERIC_COLUMN_TYPE"]
+DATE_COLUMN_TYPE = config["DEFAULT"]["DATE_COLUMN_TYPE"]
+
+
+def parse_columns(value: str) -> list:
+    """Split a comma-separated list of column names from config.ini."""
+    return [column.strip() for column in value.split(",") if column.strip()]
+
+
+DROP_COLUMNS = parse_columns(config["DEFAULT"]["DROP_COLUMNS"])
+NUMERIC_COLUMNS = parse_columns(config["DEFAULT"]["NUMERIC_COLUMNS"])
+DATE_COLUMNS = parse_columns(config["DEFAULT"]["DATE_COLUMNS"])
 DATE_FORMAT = config["DEFAULT"]["DATE_FORMAT"]
 NEW_DATE_COLUMN = config["DEFAULT"]["NEW_DATE_COLUMN"]
 DATE_CONCAT_FORMAT = config["DEFAULT"]["DATE_CONCAT_FORMAT"]
-REPLACE_COMMA_WITH_DOT_COLUMNS = config["DEFAULT"][
-    "REPLACE_COMMA_WITH_DOT_COLUMNS"
-].split(",")
-SET_EMPTY_TO_NULL_COLUMNS = config["DEFAULT"]["SET_EMPTY_TO_NULL_COLUMNS"].split(",")
+REPLACE_COMMA_WITH_DOT_COLUMNS = parse_columns(
+    config["DEFAULT"]["REPLACE_COMMA_WITH_DOT_COLUMNS"]
+)
+SET_EMPTY_TO_NULL_COLUMNS = parse_columns(
+    config["DEFAULT"]["SET_EMPTY_TO_NULL_COLUMNS"]
+)
+
+
+def quote(identifier: str) -> str:
+    """Quote a column name for SQL (ANAC exports have names like "CLASSE IDA")."""
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def csv_column_types() -> dict:
+    """Return the explicit types of the numeric and date columns of raw CSVs."""
+    types = {column: NUMERIC_COLUMN_TYPE for column in NUMERIC_COLUMNS}
+    types.update({column: DATE_COLUMN_TYPE for column in DATE_COLUMNS})
+    return types
+
+
+def expand_paths(path) -> list:
+    """Expand a path, glob or list of them into the matching files."""
+    paths = path if isinstance(path, list) else [path]
+    files = []
+    for pattern in paths:
+        files.extend(
+            sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        )
+    return files
+
+
+def is_csv_path(path) -> bool:
+    files = expand_paths(path)
+    return bool(files) and files[0].lower().endswith((".csv", ".csv.gz"))
+
+
+def is_utf8(encoding: str) -> bool:
+    return codecs.lookup(encoding).name == "utf-8"
+
+
+def csv_header(path: str, encoding: str = CSV_ENCODING) -> list:
+    """Return the column names in the first line of a (possibly gzipped) CSV."""
+    opener = gzip.open if path.lower().endswith(".gz") else open
+    if is_utf8(encoding):
+        encoding = "utf-8-sig"
+    with opener(path, "rt", encoding=encoding) as f:
+        return [column.strip() for column in f.readline().split(CSV_SEPARATOR)]
+
+
+def decimal_comma_columns(file_list: str, options: list) -> list:
+    """Return the VARCHAR columns whose sampled values are all decimal-comma numbers.
+
+    DuckDB 0.8 ignores decimal_separator when sniffing types, so a column
+    such as TARIFA ("2780,00") that is not typed in config.ini would stay
+    text.
+    """
+    con = duckdb.connect()
+    try:
+        source = f"read_csv_auto([{file_list}], {', '.join(options)})"
+        text_columns = [
+            name
+            for name, column_type in source_schema(con, source)
+            if column_type == "VARCHAR"
+        ]
+        if not text_columns:
+            return []
+        decimal = f"'^-?[0-9]+({CSV_DECIMAL_SEPARATOR}[0-9]+)?$'"
+        checks = ", ".join(
+            f"COUNT({quote(name)}) > 0 AND "
+            f"bool_and(regexp_matches({quote(name)}, {decimal}))"
+            for name in text_columns
+        )
+        numeric = con.execute(
+            f"SELECT {checks} FROM (SELECT * FROM {source} LIMIT {CSV_SAMPLE_ROWS})"
+        ).fetchone()
+    finally:
+        con.close()
+    return [name for name, is_numeric in zip(text_columns, numeric) if is_numeric]
+
+
+def csv_source_sql(path, encoding: str = CSV_ENCODING) -> str:
+    """Build a read_csv_auto call for ANAC CSVs (a path, glob or list of them).
+
+    Decimal commas are parsed by the reader and the configured columns get
+    explicit types, so no comma replacement or TRY_CAST is needed later.
+    Other text columns whose sampled values are all decimal-comma numbers
+    are read as DOUBLE. Gzip is detected from the ``.gz`` extension; files
+    whose columns differ are combined by name.
+
+    DuckDB only reads UTF-8: files in another encoding (CSV_ENCODING) must
+    be converted first, which src.data.ingest_csv does.
+    """
+    if not is_utf8(encoding):
+        raise ValueError(
+            f"DuckDB only reads UTF-8 CSVs, not {encoding}: convert them with "
+            "'python -m src.data.ingest_csv' first"
+        )
+    files = expand_paths(path)
+    if not files:
+        raise FileNotFoundError(f"No files match {path}")
+    # Tipos só para as colunas presentes em todos os arquivos
+    columns = set.intersection(*(set(csv_header(file, encoding)) for file in files))
+    file_list = ", ".join(f"'{file}'" for file in files)
+    column_types = {
+        column: column_type
+        for column, column_type in csv_column_types().items()
+        if column in columns
+    }
+    options = [
+        f"sep='{CSV_SEPARATOR}'",
+        f"decimal_separator='{CSV_DECIMAL_SEPARATOR}'",
+        "header=true",
+        "union_by_name=true",
+    ]
+    if CSV_DECIMAL_SEPARATOR != ".":
+        for column in decimal_comma_columns(file_list, options):
+            column_types.setdefault(column, "DOUBLE")
+    types = ", ".join(
+        f"'{column}': '{column_type}'" for column, column_type in column_types.items()
+    )
+    options.append(f"types={{{types}}}")
+    return f"read_csv_auto([{file_list}], {', '.join(options)})"
+
+
+def raw_source(path) -> str:
+    """Return the DuckDB relation reading a raw Parquet file or ANAC CSVs."""
+    if is_csv_path(path):
+        return csv_source_sql(path)
+    return f"parquet_scan('{path}')"
 
 
 def connect_to_db():
@@ -30,54 +184,269 @@ def connect_to_db():
     return duckdb.connect(database=DATABASE_PATH, read_only=READ_ONLY)
 
 
-def load_data_into_db(con, table_name, file_path):
-    """Load data from a Parquet file into a DuckDB table."""
-    con.execute(
-        f"CREATE TABLE {table_name} AS SELECT * FROM parquet_scan('{file_path}')"
-    )
+def source_schema(con, source: str) -> list:
+    """Return the (name, type) of every column of a DuckDB relation."""
+    return [
+        (name, column_type)
+        for name, column_type, *_ in con.execute(
+            f"DESCRIBE SELECT * FROM {source}"
+        ).fetchall()
+    ]
 
 
-def process_data(con):
-    """Process data with the required transformations."""
-    for column in DROP_COLUMNS:
-        con.execute(f"ALTER TABLE raw_dataset DROP COLUMN {column}")
+def transform_sql(schema: list, source: str) -> str:
+    """Build one SELECT applying every transformation in a single scan.
 
-    # Replace comma with a decimal point for specified columns
-    for column in REPLACE_COMMA_WITH_DOT_COLUMNS:
-        con.execute(f"UPDATE raw_dataset SET {column} = REPLACE({column}, ',', '.')")
+    Each text column goes through the same steps, in the same order, as
+    the former per-column UPDATEs: comma replacement, empty strings to NULL
+    and TRY_CAST to REAL. The cast result is stored back in the column's
+    original type, as the UPDATE assignment did. Columns that are already
+    typed (e.g. read from CSV with explicit types) are kept as they are.
+    """
+    expressions = {}
+    for name, column_type in schema:
+        if name in DROP_COLUMNS:
+            continue
+        expression = quote(name)
+        if column_type != "VARCHAR":
+            expressions[name] = expression
+            continue
+        if name in REPLACE_COMMA_WITH_DOT_COLUMNS:
+            expression = f"REPLACE({expression}, ',', '.')"
+        if name in SET_EMPTY_TO_NULL_COLUMNS:
+            expression = (
+                f"CASE WHEN LENGTH(TRIM({expression})) = 0 THEN NULL "
+                f"ELSE {expression} END"
+            )
+        if name in NUMERIC_COLUMNS:
+            expression = f"CAST(TRY_CAST({expression} AS REAL) AS {column_type})"
+        expressions[name] = expression
 
-    # Set empty strings to NULL for specified columns
-    for column in SET_EMPTY_TO_NULL_COLUMNS:
-        con.execute(
-            f"UPDATE raw_dataset SET {column} = NULL WHERE LENGTH(TRIM({column})) = 0"
-        )
+    year, month = (f"CAST({expressions[column]} AS VARCHAR)" for column in DATE_COLUMNS)
+    date_expression = f"CAST({year} || '-' || LPAD({month}, 2, '0') || '{DATE_CONCAT_FORMAT}' AS DATE)"
+    select_list = [
+        expression if expression == quote(name) else f"{expression} AS {quote(name)}"
+        for name, expression in expressions.items()
+    ]
+    select_list.append(f"{date_expression} AS {quote(NEW_DATE_COLUMN)}")
+    return f"SELECT {', '.join(select_list)} FROM {source}"
 
-    for column in NUMERIC_COLUMNS:
-        # Use TRY_CAST to attempt conversion, ignoring nulls
-        con.execute(
-            f"UPDATE raw_dataset SET {column} = TRY_CAST({column} AS REAL) WHERE {column} IS NOT NULL"
-        )
 
-    # Convert specified columns and create a new date column
-    con.execute(f"ALTER TABLE raw_dataset ADD COLUMN {NEW_DATE_COLUMN} DATE")
-    for column in DATE_COLUMNS:
-        con.execute(f"UPDATE raw_dataset SET {column} = CAST({column} AS VARCHAR)")
+def process_data(con, input_path, output_path):
+    """Clean, cast and date the raw data and write the processed file.
+
+    The whole transformation is a single COPY (SELECT ...), so the raw data
+    is scanned once and never materialized in a table.
+    """
+    source = raw_source(input_path)
+    query = transform_sql(source_schema(con, source), source)
+    con.execute(f"COPY ({query}) TO '{output_path}' WITH (FORMAT 'PARQUET')")
+
+
+def partition_dir(output_dir: str, year, month) -> str:
+    """Return the Hive-style directory of one ANO/MES partition."""
+    year_column, month_column = DATE_COLUMNS
+    return os.path.join(output_dir, f"{year_column}={year}", f"{month_column}={month}")
+
+
+def partition_fingerprints(con, source: str, schema: list) -> dict:
+    """Fingerprint the raw rows of every ANO/MES partition in one scan.
+
+    The fingerprint is the row count and the sum of the row hashes, so it
+    does not depend on the order of the rows in the raw file.
+    """
+    year, month = (quote(column) for column in DATE_COLUMNS)
+    row_hash = f"hash({', '.join(quote(name) for name, _ in schema)})"
+    rows = con.execute(
+        f"""
+        SELECT {year}, {month}, COUNT(*),
+               CAST(SUM(CAST({row_hash} AS HUGEINT)) AS VARCHAR)
+        FROM {source}
+        GROUP BY ALL
+        """
+    ).fetchall()
+    return {
+        f"{y}/{m}": {"year": y, "month": m, "fingerprint": f"{count}:{digest}"}
+        for y, m, count, digest in rows
+    }
+
+
+def read_manifest(output_dir: str) -> dict:
+    """Return the manifest of a partitioned output, or None if there is none."""
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def write_manifest(output_dir: str, manifest: dict):
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2, default=str)
+    os.replace(path + ".tmp", path)
+
+
+def transform_hash(schema: list) -> str:
+    """Hash the transformation applied to a raw schema, for the manifest."""
+    return hashlib.sha256(transform_sql(schema, "raw").encode()).hexdigest()
+
+
+def write_partition(con, rows: str, output_dir: str, partition: dict) -> dict:
+    """Write the ANO/MES partition of ``rows`` atomically; return its manifest entry."""
+    year, month = (quote(column) for column in DATE_COLUMNS)
+    directory = partition_dir(output_dir, partition["year"], partition["month"])
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, "data.parquet")
     con.execute(
-        f"UPDATE raw_dataset SET {NEW_DATE_COLUMN} = CAST({DATE_COLUMNS[0]} || '-' || LPAD({DATE_COLUMNS[1]}, 2, '0') || '{DATE_CONCAT_FORMAT}' AS DATE)"
+        f"COPY (SELECT * FROM {rows} WHERE {year} = ? AND {month} = ?) "
+        f"TO '{path}.tmp' WITH (FORMAT 'PARQUET')",
+        [partition["year"], partition["month"]],
     )
+    os.replace(path + ".tmp", path)
+    return {
+        **partition,
+        "path": os.path.relpath(path, output_dir),
+        "processed_at": datetime.datetime.now(),
+    }
+
+
+def process_partitions(con, input_path, output_dir, full: bool = False) -> dict:
+    """Reprocess only the ANO/MES partitions that are new or changed.
+
+    Each partition is written to ``ANO=<ano>/MES=<mes>/data.parquet`` under
+    ``output_dir``. The manifest keeps the fingerprint of the raw rows each
+    partition came from and the hash of the transformation, so a config
+    change reprocesses everything. Partitions no longer in the raw file
+    are removed.
 
+    Each changed month is copied straight from the raw data with its
+    ANO/MES filter pushed into the Parquet scan. A CSV source is scanned
+    once per changed month; for large CSV exports convert them first
+    (src.data.ingest_csv) or use src.data.parallel_etl.
 
-def save_processed_data(con, table_name, output_path):
-    """Save the processed data to a Parquet file."""
-    con.execute(f"COPY {table_name} TO '{output_path}' WITH (FORMAT 'PARQUET')")
+    Returns the keys ("ano/mes") processed, skipped and removed.
+    """
+    source = raw_source(input_path)
+    schema = source_schema(con, source)
+    transform = transform_hash(schema)
+    manifest = read_manifest(output_dir)
+    if full or manifest is None or manifest.get("transform") != transform:
+        manifest = {"transform": transform, "partitions": {}}
+
+    fingerprints = partition_fingerprints(con, source, schema)
+    previous = manifest["partitions"]
+    changed = [
+        key
+        for key, partition in fingerprints.items()
+        if previous.get(key, {}).get("fingerprint") != partition["fingerprint"]
+    ]
+    removed = [key for key in previous if key not in fingerprints]
+
+    os.makedirs(output_dir, exist_ok=True)
+    # Um COPY por mês direto da origem: o filtro de ANO/MES chega ao scan do
+    # Parquet, que só lê os row groups do mês, sem tabela intermediária
+    rows = f"({transform_sql(schema, source)})"
+    for key in changed:
+        previous[key] = write_partition(con, rows, output_dir, fingerprints[key])
+
+    for key in removed:
+        shutil.rmtree(os.path.join(output_dir, os.path.dirname(previous[key]["path"])))
+        del previous[key]
+    write_manifest(output_dir, manifest)
+    return {
+        "processed": changed,
+        "skipped": len(fingerprints) - len(changed),
+        "removed": removed,
+    }
+
+
+def processed_files(output_dir: str = PARTITIONED_OUTPUT_PATH, start=None, end=None):
+    """List the partition files whose month falls in [start, end].
+
+    ``start`` and ``end`` are dates (only year and month matter). Returns
+    None when ``output_dir`` has no manifest.
+    """
+    manifest = read_manifest(output_dir)
+    if manifest is None:
+        return None
+    files = []
+    for partition in manifest["partitions"].values():
+        month = datetime.date(int(partition["year"]), int(partition["month"]), 1)
+        if start is not None and month < start.replace(day=1):
+            continue
+        if end is not None and month > end.replace(day=1):
+            continue
+        files.append(os.path.join(output_dir, partition["path"]))
+    return sorted(files)
+
+
+def processed_data_path() -> str:
+    """Return the path read_processed reads from: partitions or the single file."""
+    if read_manifest(PARTITIONED_OUTPUT_PATH) is not None:
+        return PARTITIONED_OUTPUT_PATH
+    return OUTPUT_PATH
+
+
+def read_processed(columns: list = None, start=None, end=None):
+    """Read the processed dataset as a DataFrame, pruning partitions by month.
+
+    Falls back to the single OUTPUT_PATH file when there is no partitioned
+    output yet.
+    """
+    select = ", ".join(quote(column) for column in columns) if columns else "*"
+    con = duckdb.connect()
+    try:
+        files = processed_files(PARTITIONED_OUTPUT_PATH, start, end)
+        if files is None:
+            conditions = []
+            if start is not None:
+                conditions.append(
+                    f"{quote(NEW_DATE_COLUMN)} >= '{start.replace(day=1)}'"
+                )
+            if end is not None:
+                conditions.append(f"{quote(NEW_DATE_COLUMN)} <= '{end}'")
+            where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+            return con.execute(
+                f"SELECT {select} FROM parquet_scan('{OUTPUT_PATH}'){where}"
+            ).df()
+        if not files:
+            return pd.DataFrame(columns=columns)
+        file_list = ", ".join(f"'{path}'" for path in files)
+        return con.execute(
+            f"SELECT {select} FROM read_parquet([{file_list}], union_by_name=true)"
+        ).df()
+    finally:
+        con.close()
 
 
 def main():
     """Main function to handle data processing."""
+    parser = argparse.ArgumentParser(
+        description="Process the raw ANAC dataset into ANO=/MES= partitions."
+    )
+    parser.add_argument(
+        "--input",
+        default=INPUT_PATH,
+        help="raw Parquet file, or ANAC CSVs (glob, .gz) read directly",
+    )
+    parser.add_argument("--full", action="store_true", help="reprocess every partition")
+    parser.add_argument(
+        "--single-file",
+        action="store_true",
+        help=f"write the whole dataset to {OUTPUT_PATH} instead",
+    )
+    args = parser.parse_args()
+
     con = connect_to_db()
-    load_data_into_db(con, "raw_dataset", INPUT_PATH)  # E/L
-    process_data(con)  # T
-    save_processed_data(con, "raw_dataset", OUTPUT_PATH)
+    if args.single_file:
+        process_data(con, args.input, OUTPUT_PATH)  # E/T/L
+    else:
+        result = process_partitions(con, args.input, PARTITIONED_OUTPUT_PATH, args.full)
+        print(
+            f"{len(result['processed'])} partitions processed, "
+            f"{result['skipped']} unchanged, {len(result['removed'])} removed"
+        )
     con.close()
 
 
@@ -0,0 +1,153 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from src.models.predict import FEATURE_COLUMNS
+from src.monitoring.histogram import Histogram, exponential_buckets
+from src.utils import model_utils
+
+# Micro-batching is opt-in: set MICROBATCH_ENABLED=true to route single-row
+# xgboost predictions through the shared batcher.
+MICROBATCH_ENABLED = os.getenv("MICROBATCH_ENABLED", "false").lower() == "true"
+MICROBATCH_MAX_WAIT_MS = float(os.getenv("MICROBATCH_MAX_WAIT_MS", "2"))
+MICROBATCH_MAX_BATCH_SIZE = int(os.getenv("MICROBATCH_MAX_BATCH_SIZE", "64"))
+# How long a caller waits for its prediction before giving up
+MICROBATCH_RESULT_TIMEOUT_S = float(os.getenv("MICROBATCH_RESULT_TIMEOUT_S", "30"))
+
+
+class MicroBatcher:
+    """Collect concurrent single-row predictions and score them in one call.
+
+    Callers block on ``predict`` while a background thread gathers requests
+    for at most ``max_wait_ms`` (counted from the oldest queued request) or
+    until ``max_batch_size`` rows are queued, then runs ``predict_fn`` once
+    on the stacked feature matrix.
+    """
+
+    def __init__(
+        self,
+        predict_fn,
+        max_wait_ms: float,
+        max_batch_size: int,
+        result_timeout_s: float = MICROBATCH_RESULT_TIMEOUT_S,
+    ):
+        self.predict_fn = predict_fn
+        self.result_timeout = result_timeout_s
+        self.max_wait = max_wait_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.batch_size_histogram = Histogram(
+            exponential_buckets(1, 2, max(1, max_batch_size.bit_length()))
+        )
+        self.queue_wait_histogram = Histogram(exponential_buckets(0.05, 2, 12))
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="micro-batcher", daemon=True
+                )
+                self._thread.start()
+
+    def predict(self, data: dict) -> float:
+        """Queue one row and wait for its prediction.
+
+        A row that is not numeric raises here, before it can reach (and fail)
+        a batch shared with other requests. Raises TimeoutError if no result
+        arrives within ``result_timeout_s``.
+        """
+        row = [float(data[column]) for column in FEATURE_COLUMNS]
+        self._ensure_started()
+        future = Future()
+        self._queue.put((time.perf_counter(), row, future))
+        return future.result(timeout=self.result_timeout)
+
+    def close(self):
+        """Stop the background thread after the queued requests are served."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> dict:
+        """Return the batch size and queue wait (ms) histograms."""
+        return {
+            "max_wait_ms": self.max_wait * 1000,
+            "max_batch_size": self.max_batch_size,
+            "batch_size": self.batch_size_histogram.snapshot(),
+            "queue_wait_ms": self.queue_wait_histogram.snapshot(),
+        }
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = item[0] + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                try:
+                    if timeout > 0:
+                        item = self._queue.get(timeout=timeout)
+                    else:
+                        item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._run_batch(batch)
+
+    def _run_batch(self, batch: list):
+        started = time.perf_counter()
+        self.batch_size_histogram.observe(len(batch))
+        for enqueued, _, _ in batch:
+            self.queue_wait_histogram.observe((started - enqueued) * 1000)
+
+        try:
+            features = np.array([row for _, row, _ in batch], dtype=np.float32)
+            predictions = [float(p) for p in self.predict_fn(features)]
+            if len(predictions) != len(batch):
+                raise ValueError(
+                    f"{len(predictions)} predictions for a batch of {len(batch)} rows"
+                )
+        except Exception as e:
+            # Every caller gets the error; the worker thread keeps running
+            for _, _, future in batch:
+                future.set_exception(e)
+            return
+        for (_, _, future), prediction in zip(batch, predictions):
+            future.set_result(prediction)
+
+
+def _predict_with_current_model(features: np.ndarray) -> np.ndarray:
+    return model_utils.get_xgboost_predictor(len(features)).predict(features)
+
+
+_xgboost_batcher = None
+_xgboost_batcher_lock = threading.Lock()
+
+
+def get_xgboost_batcher() -> MicroBatcher:
+    """Return the process-wide micro-batcher for the XGBoost model."""
+    global _xgboost_batcher
+    if _xgboost_batcher is None:
+        with _xgboost_batcher_lock:
+            if _xgboost_batcher is None:
+                _xgboost_batcher = MicroBatcher(
+                    _predict_with_current_model,
+                    max_wait_ms=MICROBATCH_MAX_WAIT_MS,
+                    max_batch_size=MICROBATCH_MAX_BATCH_SIZE,
+                )
+    return _xgboost_batcher
@@ -1,6 +1,26 @@
 import numpy as np
 import xgboost as xgb
 
+FEATURE_COLUMNS = ["ASK", "ATK", "COMBUSTIVEL_LITROS"]
+
+
+def validate_features(data: dict) -> dict:
+    """Return the model features of ``data`` as floats.
+
+    Raises ValueError naming the features that are missing or not numbers.
+    """
+    missing = [column for column in FEATURE_COLUMNS if column not in data]
+    if missing:
+        raise ValueError(f"Missing features: {', '.join(missing)}")
+    invalid = [
+        column
+        for column in FEATURE_COLUMNS
+        if isinstance(data[column], bool) or not isinstance(data[column], (int, float))
+    ]
+    if invalid:
+        raise ValueError(f"Features must be numbers: {', '.join(invalid)}")
+    return {column: float(data[column]) for column in FEATURE_COLUMNS}
+
 
 def predict_baseline(data: dict, model: float) -> float:
     """Make a prediction using the baseline model."""
@@ -15,3 +35,16 @@ def predict_xgboost(data: dict, model: xgb.XGBRegressor) -> float:
 
     pred = model.predict(np.array([[ASK, ATK, COMBUSTIVEL_LITROS]]))
     return float(pred[0])
+
+
+def predict_baseline_batch(data: dict, model: float) -> np.ndarray:
+    """Make predictions for a columnar batch using the baseline model."""
+    return np.full(len(data[FEATURE_COLUMNS[0]]), model, dtype=np.float64)
+
+
+def predict_xgboost_batch(data: dict, model: xgb.XGBRegressor) -> np.ndarray:
+    """Make predictions for a columnar batch with a single XGBoost call."""
+    features = np.column_stack(
+        [np.asarray(data[column], dtype=np.float32) for column in FEATURE_COLUMNS]
+    )
+    return model.predict(features)
@@ -2,6 +2,9 @@ import numpy as np
 import pandas as pd
 import xgboost as xgb
 
+# Colunas lidas do dataset processado para o treino
+TRAINING_COLUMNS = ["ASK", "ATK", "COMBUSTIVEL_LITROS", "PASSAGEIROS_PAGOS"]
+
 
 def train_baseline_model(data: pd.DataFrame) -> float:
     """Train a simple baseline model."""
@@ -11,9 +14,9 @@ def train_baseline_model(data: pd.DataFrame) -> float:
 
 def train_xgboost_model(data: pd.DataFrame) -> xgb.XGBRegressor:
     """Train an XGBoost regression model."""
-    for column in ["ASK", "ATK", "COMBUSTIVEL_LITROS", "PASSAGEIROS_PAGOS"]:
+    for column in TRAINING_COLUMNS:
         data[column] = pd.to_numeric(data[column], errors="coerce")
-    X = data[["ASK", "ATK", "COMBUSTIVEL_LITROS", "PASSAGEIROS_PAGOS"]].dropna()
+    X = data[TRAINING_COLUMNS].dropna()
     y = X["PASSAGEIROS_PAGOS"]
     X = X.drop("PASSAGEIROS_PAGOS", axis=1)
 
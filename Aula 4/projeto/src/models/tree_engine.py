@@ -0,0 +1,148 @@
+import json
+
+import numpy as np
+
+# Objectives whose prediction is the raw margin (identity link).
+SUPPORTED_OBJECTIVES = {"reg:squarederror", "reg:absoluteerror"}
+
+
+class TreeEnsemble:
+    """Pure-NumPy evaluator for an XGBoost regression tree ensemble.
+
+    All trees are flattened into one set of node arrays. Leaves point to
+    themselves, so walking ``max_depth`` steps from every root lands each
+    (row, tree) pair on its leaf using nothing but array indexing.
+    """
+
+    def __init__(
+        self,
+        feature,
+        threshold,
+        left,
+        right,
+        default_left,
+        value,
+        roots,
+        max_depth,
+        base_score,
+    ):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.default_left = default_left
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.base_score = base_score
+        # children[2 * node + go_left] -> next node, one gather per level
+        self._children = np.stack([right, left], axis=1).ravel()
+
+    @classmethod
+    def from_model_json(cls, model_json: dict) -> "TreeEnsemble":
+        """Build the ensemble from the dict produced by ``save_model(...json)``."""
+        learner = model_json["learner"]
+        objective = learner["objective"]["name"]
+        if objective not in SUPPORTED_OBJECTIVES:
+            raise ValueError(f"Objective {objective} is not supported")
+        booster = learner["gradient_booster"]
+        if booster["name"] != "gbtree":
+            raise ValueError(f"Booster {booster['name']} is not supported")
+
+        trees = booster["model"]["trees"]
+        best_iteration = learner.get("attributes", {}).get("best_iteration")
+        if best_iteration is not None:
+            num_parallel_tree = int(
+                booster["model"]["gbtree_model_param"]["num_parallel_tree"]
+            )
+            trees = trees[: (int(best_iteration) + 1) * num_parallel_tree]
+
+        features, thresholds, lefts, rights, defaults, values, roots = (
+            [] for _ in range(7)
+        )
+        offset = 0
+        max_depth = 0
+        for tree in trees:
+            if any(tree["split_type"]):
+                raise ValueError("Categorical splits are not supported")
+            left = np.asarray(tree["left_children"], dtype=np.int32)
+            right = np.asarray(tree["right_children"], dtype=np.int32)
+            is_leaf = left == -1
+            node_ids = np.arange(len(left), dtype=np.int32)
+            # Leaves loop back to themselves so extra steps are harmless
+            left = np.where(is_leaf, node_ids, left) + offset
+            right = np.where(is_leaf, node_ids, right) + offset
+
+            features.append(np.asarray(tree["split_indices"], dtype=np.int32))
+            thresholds.append(np.asarray(tree["split_conditions"], dtype=np.float32))
+            lefts.append(left)
+            rights.append(right)
+            defaults.append(np.asarray(tree["default_left"], dtype=bool))
+            # For leaves, split_conditions holds the leaf value
+            values.append(
+                np.where(is_leaf, np.asarray(tree["split_conditions"]), 0.0).astype(
+                    np.float32
+                )
+            )
+            roots.append(offset)
+            max_depth = max(
+                max_depth, _tree_depth(tree["left_children"], tree["right_children"])
+            )
+            offset += len(left)
+
+        return cls(
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds),
+            left=np.concatenate(lefts),
+            right=np.concatenate(rights),
+            default_left=np.concatenate(defaults),
+            value=np.concatenate(values),
+            roots=np.asarray(roots, dtype=np.int32),
+            max_depth=max_depth,
+            base_score=np.float32(learner["learner_model_param"]["base_score"]),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "TreeEnsemble":
+        """Load the ensemble from an XGBoost JSON model file."""
+        with open(path, "r") as f:
+            return cls.from_model_json(json.load(f))
+
+    @classmethod
+    def from_booster(cls, booster) -> "TreeEnsemble":
+        """Build the ensemble from an in-memory ``xgb.Booster``."""
+        return cls.from_model_json(json.loads(booster.save_raw(raw_format="json")))
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        """Predict a (n_rows, n_features) matrix; mirrors ``XGBRegressor.predict``."""
+        features = np.asarray(features, dtype=np.float32)
+        if features.ndim == 1:
+            features = features.reshape(1, -1)
+        n_rows, n_features = features.shape
+        flat_features = features.ravel()
+        row_offsets = (np.arange(n_rows, dtype=np.int64) * n_features)[:, None]
+        has_missing = np.isnan(flat_features).any()
+
+        nodes = np.broadcast_to(self.roots, (n_rows, len(self.roots)))
+        for _ in range(self.max_depth):
+            values = flat_features.take(row_offsets + self.feature.take(nodes))
+            go_left = values < self.threshold.take(nodes)
+            if has_missing:
+                go_left = np.where(
+                    np.isnan(values), self.default_left.take(nodes), go_left
+                )
+            nodes = self._children.take(2 * nodes + go_left)
+        return self.value.take(nodes).sum(axis=1, dtype=np.float32) + self.base_score
+
+
+def _tree_depth(left_children: list, right_children: list) -> int:
+    depth = 0
+    stack = [(0, 0)]
+    while stack:
+        node, node_depth = stack.pop()
+        if left_children[node] == -1:
+            depth = max(depth, node_depth)
+            continue
+        stack.append((left_children[node], node_depth + 1))
+        stack.append((right_children[node], node_depth + 1))
+    return depth
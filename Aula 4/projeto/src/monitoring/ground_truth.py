@@ -0,0 +1,104 @@
+"""Load ground-truth (id, actual_value) pairs in bulk.
+
+The same reader backs ``POST /predictions/actuals`` and this CLI. Run from
+the project root while the API is stopped (DuckDB allows a single writer
+process):
+
+    python -m src.monitoring.ground_truth actuals.csv
+    python -m src.monitoring.ground_truth actuals.parquet
+"""
+
+import argparse
+import io
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.utils import db_manager
+
+ACTUAL_VALUE_COLUMNS = ["id", "actual_value"]
+# Content types accepted by the API and the file extensions used by the CLI
+CONTENT_TYPE_FORMATS = {
+    "application/json": "json",
+    "text/csv": "csv",
+    "application/vnd.apache.parquet": "parquet",
+    "application/x-parquet": "parquet",
+    "application/octet-stream": "parquet",
+}
+EXTENSION_FORMATS = {".json": "json", ".csv": "csv", ".parquet": "parquet"}
+
+
+def format_from_content_type(content_type: str) -> str:
+    """Map a Content-Type header to one of json, csv or parquet."""
+    media_type = (content_type or "application/json").split(";")[0].strip().lower()
+    if media_type not in CONTENT_TYPE_FORMATS:
+        raise ValueError(f"Content type {media_type} not supported")
+    return CONTENT_TYPE_FORMATS[media_type]
+
+
+def read_actual_values(content: bytes, data_format: str) -> pd.DataFrame:
+    """Parse (id, actual_value) pairs from a JSON array, CSV or Parquet payload.
+
+    JSON accepts either ``[{"id": 1, "actual_value": 2.5}, ...]`` or
+    ``[[1, 2.5], ...]``.
+    """
+    if data_format == "json":
+        records = json.loads(content)
+        if not isinstance(records, list):
+            raise ValueError("Expected a JSON array of (id, actual_value) pairs")
+        df = pd.DataFrame.from_records(records, columns=ACTUAL_VALUE_COLUMNS)
+    elif data_format == "csv":
+        df = pd.read_csv(io.BytesIO(content))
+    elif data_format == "parquet":
+        df = pd.read_parquet(io.BytesIO(content))
+    else:
+        raise ValueError(f"Format {data_format} not supported")
+
+    missing_columns = set(ACTUAL_VALUE_COLUMNS) - set(df.columns)
+    if missing_columns:
+        raise ValueError(f"Missing columns: {', '.join(sorted(missing_columns))}")
+    df = df[ACTUAL_VALUE_COLUMNS]
+    if df.isna().any().any():
+        raise ValueError("id and actual_value must not be null")
+    ids = pd.to_numeric(df["id"], errors="coerce")
+    actual_values = pd.to_numeric(df["actual_value"], errors="coerce")
+    # Casting 1.7 or inf to int64 would silently update another prediction
+    if not (np.isfinite(ids) & (ids == np.floor(ids))).all():
+        raise ValueError("id must be an integer")
+    if not np.isfinite(actual_values).all():
+        raise ValueError("actual_value must be a finite number")
+    return pd.DataFrame(
+        {"id": ids.astype("int64"), "actual_value": actual_values.astype("float64")}
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="JSON, CSV or Parquet file with id,actual_value")
+    parser.add_argument(
+        "--format", choices=sorted(set(EXTENSION_FORMATS.values())), default=None
+    )
+    args = parser.parse_args()
+
+    data_format = args.format or EXTENSION_FORMATS.get(
+        os.path.splitext(args.path)[1].lower()
+    )
+    if data_format is None:
+        parser.error("Cannot infer the format from the extension, use --format")
+    with open(args.path, "rb") as f:
+        updates = read_actual_values(f.read(), data_format)
+
+    db = db_manager.DBManager()
+    db.setup_tables()
+    result = db.update_actual_values(updates)
+    db.close()
+    print(
+        f"received={result['received']} updated={result['updated']} "
+        f"missing={result['missing']} duplicated={result['duplicated']}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import bisect
+import threading
+
+
+def exponential_buckets(start: float, factor: float, count: int) -> list:
+    """Return ``count`` upper bounds starting at ``start`` and growing by ``factor``."""
+    return [start * factor**i for i in range(count)]
+
+
+def quantile_from_counts(bounds: list, counts: list, q: float) -> float:
+    """Estimate the ``q`` quantile from per-bucket counts (last bucket is +Inf).
+
+    Returns the upper bound of the bucket holding the quantile, or None when
+    there are no observations.
+    """
+    total = sum(counts)
+    if total == 0:
+        return None
+    rank = q * total
+    cumulative = 0
+    for bound, count in zip(list(bounds) + [float("inf")], counts):
+        cumulative += count
+        if cumulative >= rank:
+            return bound
+    return float("inf")
+
+
+class Histogram:
+    """Thread-safe fixed-bucket histogram (Prometheus ``le`` semantics)."""
+
+    def __init__(self, bounds: list):
+        self.bounds = sorted(bounds)
+        self._counts = [0] * (len(self.bounds) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        """Record one observation."""
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate the ``q`` quantile as the upper bound of the matching bucket."""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+        if total == 0:
+            return None
+        return quantile_from_counts(self.bounds, counts, q)
+
+    def snapshot(self) -> dict:
+        """Return the cumulative bucket counts, total count and sum."""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+            total_sum = self._sum
+        buckets = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + ["+Inf"], counts):
+            cumulative += count
+            buckets.append({"le": bound, "count": cumulative})
+        return {"buckets": buckets, "count": total, "sum": total_sum}
@@ -0,0 +1,152 @@
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+
+LOG_PATH = os.getenv("LOG_PATH", os.path.join("logs", "app.log"))
+LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "5"))
+# Records waiting for the writer thread; past this they are dropped
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Fraction of the routine per-operation INFO lines of the DB managers kept
+LOG_DB_SAMPLE_RATE = float(os.getenv("LOG_DB_SAMPLE_RATE", "1"))
+
+SAMPLED_MODULES = ("db_manager", "sharded_db_manager")
+SAMPLED_FUNCTION_PREFIXES = ("insert_", "update_", "fetch_")
+
+# Attributes every LogRecord has; anything else came from ``extra=``
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Format each record as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "timestamp": datetime.datetime.fromtimestamp(record.created).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "module": record.module,
+            "function": record.funcName,
+            "line": record.lineno,
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        return json.dumps(entry, default=str)
+
+
+class DbLogSampler(logging.Filter):
+    """Keep only ``rate`` of the per-operation INFO lines of the DB managers."""
+
+    def __init__(self, rate: float = LOG_DB_SAMPLE_RATE):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if (
+            self.rate >= 1
+            or record.levelno != logging.INFO
+            or record.module not in SAMPLED_MODULES
+            or not record.funcName.startswith(SAMPLED_FUNCTION_PREFIXES)
+        ):
+            return True
+        return random.random() < self.rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops (and counts) records when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve the message now, but leave the JSON formatting to the writer
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _BlockingSentinelListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # The queue may be full; wait for the writer instead of failing to stop
+        self.queue.put(self._sentinel)
+
+
+class LogPipeline:
+    """Route every log record through a queue to a rotating JSON file.
+
+    Request threads only format the message and put the record on a bounded
+    queue; a QueueListener thread does the file I/O. Records logged before
+    ``start`` wait in the queue.
+    """
+
+    def __init__(
+        self,
+        path: str = LOG_PATH,
+        level: str = LOG_LEVEL,
+        max_bytes: int = LOG_MAX_BYTES,
+        backup_count: int = LOG_BACKUP_COUNT,
+        queue_size: int = LOG_QUEUE_SIZE,
+        db_sample_rate: float = LOG_DB_SAMPLE_RATE,
+    ):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, delay=True
+        )
+        file_handler.setFormatter(JsonFormatter())
+        self.queue_handler = DroppingQueueHandler(queue.Queue(queue_size))
+        self.queue_handler.addFilter(DbLogSampler(db_sample_rate))
+        self.listener = _BlockingSentinelListener(
+            self.queue_handler.queue, file_handler, respect_handler_level=True
+        )
+        self.level = level
+        self._started = False
+
+    def install(self):
+        """Make the queue the only handler of the root logger."""
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(self.queue_handler)
+        root.setLevel(self.level)
+
+    def start(self):
+        """Start the writer thread."""
+        if not self._started:
+            self.listener.start()
+            self._started = True
+
+    def stop(self):
+        """Write the queued records and stop the writer thread."""
+        if self._started:
+            self.listener.stop()
+            self._started = False
+
+    def stats(self) -> dict:
+        return {
+            "queued_records": self.queue_handler.queue.qsize(),
+            "dropped_records": self.queue_handler.dropped,
+        }
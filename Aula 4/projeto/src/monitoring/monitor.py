@@ -1,3 +1,4 @@
+import math
 from sklearn.metrics import mean_squared_error, mean_absolute_error
 
 
@@ -9,3 +10,13 @@ def calculate_rmse(true_values: list, predicted_values: list) -> float:
 def calculate_mae(true_values: list, predicted_values: list) -> float:
     """Calculate the Mean Absolute Error."""
     return mean_absolute_error(true_values, predicted_values)
+
+
+def calculate_rmse_from_aggregates(count: int, sum_squared_error: float) -> float:
+    """Calculate the RMSE from a running count and sum of squared errors."""
+    return math.sqrt(max(sum_squared_error, 0.0) / count)
+
+
+def calculate_mae_from_aggregates(count: int, sum_abs_error: float) -> float:
+    """Calculate the MAE from a running count and sum of absolute errors."""
+    return max(sum_abs_error, 0.0) / count
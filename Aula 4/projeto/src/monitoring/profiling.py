@@ -0,0 +1,132 @@
+import contextvars
+import cProfile
+import datetime
+import functools
+import inspect
+import logging
+import os
+import random
+import re
+import uuid
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join("logs", "profiles"))
+# Without a token profiling can only be switched on by PROFILE_SAMPLE_RATE
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN") or None
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Header that asks for a profile of the request, and the one that
+# authorizes the /admin/profil* endpoints; both carry PROFILE_TOKEN
+PROFILE_HEADER = "x-profile"
+ADMIN_HEADER = "x-profile-token"
+REQUEST_ID_HEADER = "x-request-id"
+_REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+_profile_id = contextvars.ContextVar("profile_id", default=None)
+
+
+class Profiler:
+    """Decides which requests are profiled and stores their cProfile output.
+
+    A request is profiled when it carries the ``X-Profile`` header with
+    the configured token, or when it falls in the sampled fraction
+    ``sample_rate``. With the rate at 0 the check costs at most one float
+    comparison and one header lookup per request.
+    """
+
+    def __init__(
+        self,
+        token: str = PROFILE_TOKEN,
+        sample_rate: float = PROFILE_SAMPLE_RATE,
+        profile_dir: str = PROFILE_DIR,
+    ):
+        self.token = token
+        self.sample_rate = sample_rate
+        self.profile_dir = profile_dir
+
+    def is_authorized(self, headers, header: str = ADMIN_HEADER) -> bool:
+        return self.token is not None and headers.get(header) == self.token
+
+    def start_request(self, headers) -> str:
+        """Return the id of the profile to record for this request, or None."""
+        sampled = self.sample_rate and random.random() < self.sample_rate
+        if not sampled and not self.is_authorized(headers, PROFILE_HEADER):
+            return None
+        request_id = headers.get(REQUEST_ID_HEADER, "")
+        if not _REQUEST_ID_PATTERN.match(request_id) or os.path.exists(
+            self.path(request_id)
+        ):
+            request_id = uuid.uuid4().hex
+        _profile_id.set(request_id)
+        return request_id
+
+    def path(self, request_id: str) -> str:
+        """Return the file of a profile; raises ValueError for malformed ids."""
+        if not _REQUEST_ID_PATTERN.match(request_id):
+            raise ValueError(f"Invalid request id: {request_id}")
+        return os.path.join(self.profile_dir, f"{request_id}.prof")
+
+    def save(self, request_id: str, profile: cProfile.Profile):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        profile.dump_stats(self.path(request_id))
+        logging.info(f"Profile of request {request_id} saved to {self.profile_dir}")
+
+    def list_profiles(self) -> list:
+        """Return the stored profiles, newest first."""
+        if not os.path.isdir(self.profile_dir):
+            return []
+        profiles = []
+        for name in os.listdir(self.profile_dir):
+            request_id, extension = os.path.splitext(name)
+            if extension != ".prof":
+                continue
+            stat = os.stat(os.path.join(self.profile_dir, name))
+            profiles.append(
+                {
+                    "request_id": request_id,
+                    "size_bytes": stat.st_size,
+                    "created_at": datetime.datetime.fromtimestamp(stat.st_mtime),
+                }
+            )
+        return sorted(profiles, key=lambda p: p["created_at"], reverse=True)
+
+
+profiler = Profiler()
+
+
+def profiled_endpoint(endpoint):
+    """Wrap an endpoint so it runs under cProfile when its request was selected.
+
+    The profiler is enabled in the thread that runs the endpoint (the
+    threadpool for sync endpoints). For async endpoints it also sees other
+    coroutines scheduled while the endpoint awaits.
+    """
+    if inspect.iscoroutinefunction(endpoint):
+
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            request_id = _profile_id.get()
+            if request_id is None:
+                return await endpoint(*args, **kwargs)
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                profile.disable()
+                profiler.save(request_id, profile)
+
+    else:
+
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            request_id = _profile_id.get()
+            if request_id is None:
+                return endpoint(*args, **kwargs)
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                profile.disable()
+                profiler.save(request_id, profile)
+
+    return wrapper
@@ -0,0 +1,206 @@
+import bisect
+import threading
+
+from src.monitoring.histogram import exponential_buckets
+
+# 0.1 ms .. ~3.3 s, in seconds as Prometheus expects
+LATENCY_BUCKETS_SECONDS = exponential_buckets(0.0001, 2, 16)
+
+
+class _ThreadCells:
+    """One dict of values per thread, so updates never take a lock.
+
+    A thread registers its dict once (under the lock); afterwards only that
+    thread writes to it. Readers sum the dicts of every thread that ever
+    recorded a value, which keeps counters monotonic.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._cells = []
+        self._lock = threading.Lock()
+
+    def get(self) -> dict:
+        try:
+            return self._local.cells
+        except AttributeError:
+            cells = {}
+            with self._lock:
+                self._cells.append(cells)
+            self._local.cells = cells
+            return cells
+
+    def snapshot(self) -> list:
+        with self._lock:
+            cells = list(self._cells)
+        # list(dict.items()) runs without releasing the GIL
+        return [list(thread_cells.items()) for thread_cells in cells]
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._cells = _ThreadCells()
+
+    def inc(self, amount: float = 1, *label_values):
+        """Add ``amount`` to the series identified by ``label_values``."""
+        cells = self._cells.get()
+        cells[label_values] = cells.get(label_values, 0) + amount
+
+    def collect(self) -> dict:
+        """Return the value of every series, keyed by label values."""
+        totals = {}
+        for thread_cells in self._cells.snapshot():
+            for label_values, value in thread_cells:
+                totals[label_values] = totals.get(label_values, 0) + value
+        return totals
+
+    def render(self) -> list:
+        return [
+            f"{self.name}{_labels(self.label_names, label_values)} {_number(value)}"
+            for label_values, value in sorted(self.collect().items())
+        ]
+
+
+class HistogramMetric:
+    """Fixed log-bucket histogram with optional labels (``le`` semantics)."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: tuple = (),
+        bounds: list = LATENCY_BUCKETS_SECONDS,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.bounds = sorted(bounds)
+        self._cells = _ThreadCells()
+
+    def observe(self, value: float, *label_values):
+        """Record one observation in the series identified by ``label_values``."""
+        cells = self._cells.get()
+        series = cells.get(label_values)
+        if series is None:
+            # bucket counts (last one is +Inf) followed by the sum
+            series = cells[label_values] = [0] * (len(self.bounds) + 1) + [0.0]
+        series[bisect.bisect_left(self.bounds, value)] += 1
+        series[-1] += value
+
+    def collect(self) -> dict:
+        """Return per-bucket counts and sum of every series, keyed by label values."""
+        totals = {}
+        for thread_cells in self._cells.snapshot():
+            for label_values, series in thread_cells:
+                total = totals.get(label_values)
+                if total is None:
+                    totals[label_values] = list(series)
+                else:
+                    for i, value in enumerate(series):
+                        total[i] += value
+        return totals
+
+    def render(self) -> list:
+        lines = []
+        for label_values, series in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.bounds + ["+Inf"], series[:-1]):
+                cumulative += count
+                le = bound if bound == "+Inf" else f"{bound:.6g}"
+                labels = _labels(self.label_names + ("le",), label_values + (le,))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels} {_number(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class CallbackMetric:
+    """Metric whose series are read from a function at scrape time.
+
+    Used for values some component already tracks (e.g. cache stats), so
+    the hot path is not charged twice.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        collect_fn,
+        label_names: tuple = (),
+        type: str = "counter",
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.collect_fn = collect_fn
+        self.label_names = tuple(label_names)
+        self.type = type
+
+    def render(self) -> list:
+        return [
+            f"{self.name}{_labels(self.label_names, label_values)} {_number(value)}"
+            for label_values, value in sorted(self.collect_fn().items())
+        ]
+
+
+class MetricsRegistry:
+    """Set of metrics rendered together in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """Add ``metric``, or return the one already registered under its name."""
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, label_names: tuple = ()):
+        return self.register(Counter(name, documentation, label_names))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        label_names: tuple = (),
+        bounds: list = LATENCY_BUCKETS_SECONDS,
+    ):
+        return self.register(HistogramMetric(name, documentation, label_names, bounds))
+
+    def render(self) -> str:
+        """Return every metric in the Prometheus text exposition format 0.0.4."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,28 @@
+"""Rebuild the RMSE/MAE aggregates from every labeled prediction.
+
+Archived predictions (see src/monitoring/retention.py) are included, so the
+result matches the aggregates the API maintains incrementally.
+
+Run from the project root while the API is stopped (DuckDB allows a single
+writer process); with the API running use ``POST /metrics/model/recompute``:
+
+    python -m src.monitoring.reconcile_metrics
+"""
+
+from src.utils import db_manager
+
+
+def main():
+    db = db_manager.DBManager()
+    db.setup_tables()
+    db.recompute_metric_aggregates()
+    for aggregate in db.fetch_metric_aggregates():
+        print(
+            f"{aggregate['model_type']}: count={aggregate['count']} "
+            f"rmse={aggregate['rmse']:.4f} mae={aggregate['mae']:.4f}"
+        )
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Apply the retention policy to the metrics database.
+
+Raw rows older than RETENTION_RAW_DAYS are archived to date-partitioned
+Parquet files under ARCHIVE_DIR and deleted; minute and hour rollups are
+dropped after their own retention, so old data survives as coarser
+rollups. Predictions still waiting for their actual value are kept until
+RETENTION_UNLABELED_DAYS, since feedback only updates rows in the table. The API runs this every RETENTION_INTERVAL_HOURS when set;
+otherwise run it from the project root while the API is stopped:
+
+    python -m src.monitoring.retention
+
+Shard-mode workers (SHARD_MODE=true) never open the main database, so the
+API refuses to start with both set; load the segments first with
+``python -m src.utils.compact_shards --into-db`` and run this command.
+
+Archived rows stay queryable, e.g. with ``include_archive=true`` on
+``/metrics/export/{table}`` or directly in DuckDB:
+
+    SELECT * FROM read_parquet('logs/archive/predictions/*/*.parquet',
+                               hive_partitioning=true)
+"""
+
+import argparse
+import datetime
+import logging
+import os
+import threading
+
+from src.utils import db_manager
+
+# 0 keeps the data forever
+RETENTION_RAW_DAYS = int(os.getenv("RETENTION_RAW_DAYS", "30"))
+RETENTION_UNLABELED_DAYS = int(os.getenv("RETENTION_UNLABELED_DAYS", "365"))
+ROLLUP_RETENTION_DAYS = {
+    "minute": int(os.getenv("RETENTION_MINUTE_ROLLUP_DAYS", "7")),
+    "hour": int(os.getenv("RETENTION_HOUR_ROLLUP_DAYS", "90")),
+    "day": int(os.getenv("RETENTION_DAY_ROLLUP_DAYS", "0")),
+}
+# 0 disables the scheduled task inside the API
+RETENTION_INTERVAL_HOURS = float(os.getenv("RETENTION_INTERVAL_HOURS", "0"))
+ARCHIVED_TABLES = ("operational_metrics", "ml_metrics", "predictions")
+
+
+def _days_ago(now: datetime.datetime, days: int) -> datetime.datetime:
+    # Cortes em meia-noite, para que cada partição diária fique completa
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return midnight - datetime.timedelta(days=days)
+
+
+def apply_retention(
+    db,
+    now: datetime.datetime = None,
+    raw_days: int = RETENTION_RAW_DAYS,
+    unlabeled_days: int = RETENTION_UNLABELED_DAYS,
+) -> dict:
+    """Archive expired raw rows, drop expired rollups and checkpoint."""
+    now = now or datetime.datetime.now()
+    result = {"archived": {}, "deleted_rollups": {}}
+    if raw_days > 0:
+        cutoff = _days_ago(now, raw_days)
+        for table in ARCHIVED_TABLES:
+            # Previsões sem actual_value ficam na tabela, onde o feedback as encontra
+            result["archived"][table] = db.archive_rows(
+                table, cutoff, labeled_only=table == "predictions"
+            )
+        if unlabeled_days > 0:
+            result["archived"]["predictions"] += db.archive_rows(
+                "predictions", _days_ago(now, max(raw_days, unlabeled_days))
+            )
+    for granularity, days in ROLLUP_RETENTION_DAYS.items():
+        if days > 0:
+            result["deleted_rollups"][granularity] = db.delete_rollups_before(
+                granularity, _days_ago(now, days)
+            )
+    db.checkpoint()
+    logging.info(f"Retention applied: {result}")
+    return result
+
+
+class RetentionTask:
+    """Background thread applying the retention policy periodically."""
+
+    def __init__(self, db, interval_hours: float = RETENTION_INTERVAL_HOURS):
+        self.db = db
+        self.interval = interval_hours * 3600
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start the thread, unless the interval is 0."""
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="retention", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the thread without waiting for the next run."""
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                apply_retention(self.db)
+            except Exception as e:
+                logging.error(f"Error applying retention: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--raw-days",
+        type=int,
+        default=RETENTION_RAW_DAYS,
+        help="days of raw rows to keep (0 keeps everything)",
+    )
+    parser.add_argument(
+        "--unlabeled-days",
+        type=int,
+        default=RETENTION_UNLABELED_DAYS,
+        help="days of predictions without an actual value to keep (0 keeps them)",
+    )
+    args = parser.parse_args()
+
+    db = db_manager.DBManager()
+    db.setup_tables()
+    result = apply_retention(
+        db, raw_days=args.raw_days, unlabeled_days=args.unlabeled_days
+    )
+    db.close()
+    for table, rows in result["archived"].items():
+        print(f"{table}: archived {rows} rows to {db_manager.ARCHIVE_DIR}")
+    for granularity, rows in result["deleted_rollups"].items():
+        print(f"{granularity} rollups: deleted {rows} rows")
+
+
+if __name__ == "__main__":
+    main()
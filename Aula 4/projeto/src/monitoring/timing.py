@@ -0,0 +1,126 @@
+import contextvars
+import functools
+import inspect
+import time
+from contextlib import contextmanager
+
+from starlette.responses import StreamingResponse
+
+# Request stages, in the order they happen
+STAGES = ("validation", "model_load", "inference", "db_write", "serialization")
+STAGE_COLUMNS = [f"{stage}_ms" for stage in STAGES]
+
+_request_timing = contextvars.ContextVar("request_timing", default=None)
+
+
+class RequestTiming:
+    """Nanosecond durations of the stages of one request.
+
+    The middleware creates it and stores it in a context variable; the
+    context is copied into the worker thread of sync endpoints, so stages
+    timed there land on the same object.
+
+    A streaming response sends its body after the middleware has returned,
+    so for those ``streaming`` is set: the total only covers the time until
+    the body starts, serialization is not measured and no ``Server-Timing``
+    header is sent.
+    """
+
+    def __init__(self):
+        self.started_ns = time.perf_counter_ns()
+        self.handler_returned_ns = None
+        self.streaming = False
+        self.stages_ns = {}
+
+    def add(self, stage: str, elapsed_ns: int):
+        self.stages_ns[stage] = self.stages_ns.get(stage, 0) + elapsed_ns
+
+    def stages_ms(self) -> dict:
+        """Return the duration of every stage in ms (None if it did not run)."""
+        return {
+            stage: (self.stages_ns[stage] / 1e6 if stage in self.stages_ns else None)
+            for stage in STAGES
+        }
+
+    def server_timing(self, total_ns: int) -> str:
+        """Format the recorded stages as a ``Server-Timing`` header value."""
+        metrics = [
+            f"{stage};dur={self.stages_ns[stage] / 1e6:.3f}"
+            for stage in STAGES
+            if stage in self.stages_ns
+        ]
+        metrics.append(f"total;dur={total_ns / 1e6:.3f}")
+        return ", ".join(metrics)
+
+
+def start_request() -> RequestTiming:
+    """Start timing the current request."""
+    timing = RequestTiming()
+    _request_timing.set(timing)
+    return timing
+
+
+@contextmanager
+def stage(name: str):
+    """Add the time spent in the block to stage ``name`` of the current request."""
+    timing = _request_timing.get()
+    if timing is None:
+        yield
+        return
+    started = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter_ns() - started)
+
+
+def handler_started():
+    """Close the validation stage: everything since the request arrived."""
+    timing = _request_timing.get()
+    if timing is not None:
+        timing.add("validation", time.perf_counter_ns() - timing.started_ns)
+
+
+def handler_returned(response=None):
+    """Mark the end of the endpoint; what follows until the response is serialization."""
+    timing = _request_timing.get()
+    if timing is not None:
+        timing.handler_returned_ns = time.perf_counter_ns()
+        timing.streaming = isinstance(response, StreamingResponse)
+
+
+def finish_request(timing: RequestTiming) -> int:
+    """Close the serialization stage and return the total duration in ns."""
+    finished = time.perf_counter_ns()
+    if timing.handler_returned_ns is not None and not timing.streaming:
+        timing.add("serialization", finished - timing.handler_returned_ns)
+    return finished - timing.started_ns
+
+
+def timed_endpoint(endpoint):
+    """Wrap an endpoint so the validation and serialization stages are measured."""
+    if inspect.iscoroutinefunction(endpoint):
+
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            handler_started()
+            response = None
+            try:
+                response = await endpoint(*args, **kwargs)
+                return response
+            finally:
+                handler_returned(response)
+
+    else:
+
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            handler_started()
+            response = None
+            try:
+                response = endpoint(*args, **kwargs)
+                return response
+            finally:
+                handler_returned(response)
+
+    return wrapper
@@ -0,0 +1,194 @@
+"""Merge the Parquet segments written by shard-mode workers.
+
+Workers started with ``SHARD_MODE=true uvicorn src.api.api:app --workers N``
+write many small segments; this merges them into one segment per table so
+reads stay fast. With ``--into-db`` the rows are also loaded into the main
+``db`` file (idempotently, so it can run on a schedule). Workers never open
+the main database in shard mode, so both can run while the API is up:
+
+    python -m src.utils.compact_shards
+    python -m src.utils.compact_shards --into-db
+"""
+
+import argparse
+import fcntl
+import os
+import time
+
+import duckdb
+
+from src.utils import db_manager
+from src.utils.sharded_db_manager import (
+    SHARD_DIR,
+    SHARD_TABLES,
+    labeled_predictions_sql,
+    retired_segments,
+    scan_sql,
+    segment_files,
+    write_retired_segments,
+)
+
+# Columns copied into the main database and the sequence feeding their ids
+MAIN_TABLES = {
+    "operational_metrics": (
+        db_manager.TABLE_COLUMNS["operational_metrics"],
+        "seq_operational_metrics_id",
+    ),
+    "ml_metrics": (["id", "timestamp", "rmse", "mae"], "seq_ml_metrics_id"),
+    "predictions": (
+        ["id", "timestamp", "model_type", "input_data", "predicted_value"],
+        "seq_predictions_id",
+    ),
+}
+# IDs of the shard rows already loaded into the main database. Retention
+# deletes loaded rows from the main tables, so those cannot tell what is new.
+LOADED_IDS_TABLE = "shard_loaded_ids"
+
+
+def compact_table(con, table: str) -> int:
+    """Replace every segment of ``table`` by a single merged segment.
+
+    The merged segments are only retired: readers stop listing them at
+    once, but a query that already holds their paths can still read them.
+    They are deleted by the next compaction.
+    """
+    table_dir = os.path.join(SHARD_DIR, table)
+    for name in retired_segments(table):
+        if os.path.exists(os.path.join(table_dir, name)):
+            os.remove(os.path.join(table_dir, name))
+    write_retired_segments(table, [])
+
+    files = segment_files(table)
+    if len(files) < 2:
+        return 0
+    name = f"compacted-{time.time_ns()}.parquet"
+    path = os.path.join(table_dir, name)
+    tmp_path = os.path.join(table_dir, f".{name}.tmp")
+    con.execute(
+        f"COPY (SELECT * FROM {scan_sql(table, files)}) TO '{tmp_path}' (FORMAT PARQUET)"
+    )
+    # Readers deduplicate by key, so overlapping segments are harmless
+    os.replace(tmp_path, path)
+    write_retired_segments(table, [os.path.basename(file) for file in files])
+    return len(files)
+
+
+def _advance_sequence(cursor, sequence: str, max_id: int):
+    # DuckDB 0.8 has no setval: consume values until the sequence passes max_id
+    current = cursor.execute(f"SELECT nextval('{sequence}')").fetchone()[0]
+    if max_id > current:
+        cursor.execute(
+            f"SELECT MAX(nextval('{sequence}')) FROM range(?)", (max_id - current,)
+        )
+
+
+def setup_loaded_ids(db):
+    """Create the ledger of loaded shard rows, if it does not exist yet.
+
+    A new ledger is seeded with the IDs already in the main database,
+    archived rows included, so rows loaded before it existed stay loaded.
+    """
+    cursor = db.cursor()
+    exists = cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.tables WHERE table_name = ?",
+        (LOADED_IDS_TABLE,),
+    ).fetchone()[0]
+    if exists:
+        return
+    cursor.execute("BEGIN TRANSACTION")
+    try:
+        cursor.execute(
+            f"CREATE TABLE {LOADED_IDS_TABLE} "
+            "(table_name VARCHAR, id BIGINT, PRIMARY KEY (table_name, id))"
+        )
+        for table in MAIN_TABLES:
+            sql, params = db._select_sql(table, columns=["id"], include_archive=True)
+            cursor.execute(
+                f"INSERT INTO {LOADED_IDS_TABLE} SELECT DISTINCT '{table}', id FROM ({sql})",
+                params,
+            )
+        cursor.execute("COMMIT")
+    except Exception:
+        cursor.execute("ROLLBACK")
+        raise
+
+
+def load_into_db(db) -> dict:
+    """Copy shard rows not loaded yet into the main database and apply new actuals.
+
+    Loaded IDs are recorded in LOADED_IDS_TABLE in the same transaction as
+    the rows, so rows archived and deleted by retention are not loaded again.
+    """
+    setup_loaded_ids(db)
+    cursor = db.cursor()
+    loaded = {}
+    for table, (columns, sequence) in MAIN_TABLES.items():
+        source = scan_sql(table)
+        if source is None:
+            loaded[table] = 0
+            continue
+        column_list = ", ".join(columns)
+        cursor.execute(
+            f"CREATE OR REPLACE TEMP TABLE shard_new_rows AS "
+            f"SELECT {column_list} FROM {source} s "
+            f"WHERE s.id NOT IN (SELECT id FROM {LOADED_IDS_TABLE} WHERE table_name = '{table}') "
+            f"AND s.id NOT IN (SELECT id FROM {table})"
+        )
+        cursor.execute("BEGIN TRANSACTION")
+        try:
+            if table == "operational_metrics":
+                db.update_operational_rollups("shard_new_rows", cursor)
+            loaded[table] = cursor.execute(
+                f"INSERT INTO {table} ({column_list}) SELECT * FROM shard_new_rows"
+            ).fetchone()[0]
+            cursor.execute(
+                f"INSERT INTO {LOADED_IDS_TABLE} SELECT '{table}', id FROM shard_new_rows"
+            )
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        finally:
+            cursor.execute("DROP TABLE IF EXISTS shard_new_rows")
+        max_id = cursor.execute(f"SELECT MAX(id) FROM {table}").fetchone()[0]
+        _advance_sequence(cursor, sequence, max_id or 0)
+
+    loaded["actuals"] = 0
+    labeled = labeled_predictions_sql()
+    if labeled is not None:
+        changed = cursor.execute(
+            f"SELECT s.id, s.actual_value FROM {labeled} s JOIN predictions p ON p.id = s.id "
+            # IS DISTINCT FROM here is mis-optimized by DuckDB 0.8 (never true)
+            "WHERE s.actual_value IS NOT NULL "
+            "AND (p.actual_value IS NULL OR s.actual_value <> p.actual_value)"
+        ).df()
+        if len(changed):
+            loaded["actuals"] = db.update_actual_values(changed)["updated"]
+    return loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--into-db", action="store_true", help="also load the rows into the main db"
+    )
+    args = parser.parse_args()
+
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    with open(os.path.join(SHARD_DIR, ".compact.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        con = duckdb.connect(database=":memory:")
+        for table in SHARD_TABLES:
+            print(f"{table}: merged {compact_table(con, table)} segments")
+        con.close()
+
+        if args.into_db:
+            db = db_manager.DBManager()
+            db.setup_tables()
+            for table, rows in load_into_db(db).items():
+                print(f"{table}: loaded {rows} rows into the main database")
+            db.close()
+
+
+if __name__ == "__main__":
+    main()
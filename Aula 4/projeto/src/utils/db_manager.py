@@ -1,7 +1,90 @@
 import duckdb
 import datetime
-from ..monitoring.monitor import calculate_rmse, calculate_mae
+import pandas as pd
+import pyarrow as pa
+import threading
+import time
+from collections import deque
+from ..monitoring.histogram import exponential_buckets, quantile_from_counts
+from ..monitoring.timing import STAGE_COLUMNS
+from ..monitoring.monitor import (
+    calculate_rmse_from_aggregates,
+    calculate_mae_from_aggregates,
+)
+import glob
 import logging
+import os
+
+TABLE_COLUMNS = {
+    "operational_metrics": [
+        "id",
+        "timestamp",
+        "method",
+        "url",
+        "response_status",
+        "latency",
+        "route",
+        *STAGE_COLUMNS,
+    ],
+    "ml_metrics": ["id", "timestamp", "rmse", "mae"],
+    "predictions": [
+        "id",
+        "timestamp",
+        "model_type",
+        "input_data",
+        "predicted_value",
+        "actual_value",
+    ],
+}
+STREAM_BATCH_ROWS = int(os.getenv("STREAM_BATCH_ROWS", "10000"))
+# Linhas antigas movidas pela política de retenção (src/monitoring/retention.py)
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join("logs", "archive"))
+# Novas tentativas de uma transação que conflitou com outra (TransactionException)
+TRANSACTION_RETRIES = int(os.getenv("TRANSACTION_RETRIES", "3"))
+TRANSACTION_RETRY_DELAY_S = float(os.getenv("TRANSACTION_RETRY_DELAY_S", "0.01"))
+
+# Rollups de métricas operacionais: cada balde de tempo guarda, por rota e
+# status, um histograma logarítmico da latência (ms), que pode ser somado
+ROLLUP_GRANULARITIES = ("minute", "hour", "day")
+ROLLUP_LATENCY_START_MS = 0.01
+ROLLUP_LATENCY_FACTOR = 2**0.25
+ROLLUP_LATENCY_BOUNDS = exponential_buckets(
+    ROLLUP_LATENCY_START_MS, ROLLUP_LATENCY_FACTOR, 96
+)
+ROLLUP_KEY_COLUMNS = "granularity, bucket_start, route, response_status, latency_bucket"
+
+# Toda transação que altera ml_metrics_aggregates passa por esta trava: as
+# atualizações concorrentes da mesma linha conflitam no DuckDB. É global ao
+# processo porque conexões ao mesmo arquivo compartilham o mesmo banco.
+_aggregates_lock = threading.Lock()
+
+
+def rollup_rows_sql(source):
+    """Return the SELECT turning raw operational metrics into rollup rows."""
+    granularities = ", ".join(f"('{g}')" for g in ROLLUP_GRANULARITIES)
+    # Índice do primeiro limite >= latência (mesma regra de Histogram.observe)
+    latency_bucket = (
+        f"CASE WHEN r.latency <= {ROLLUP_LATENCY_START_MS} THEN 0 "
+        f"ELSE LEAST(CAST(CEIL(LN(r.latency / {ROLLUP_LATENCY_START_MS}) "
+        f"/ LN({ROLLUP_LATENCY_FACTOR})) AS INTEGER), {len(ROLLUP_LATENCY_BOUNDS)}) END"
+    )
+    return f"""
+        SELECT
+            g.granularity,
+            date_trunc(g.granularity, r.timestamp) AS bucket_start,
+            COALESCE(r.route, regexp_extract(r.url, '^[a-z]+://[^/]+(/[^?]*)', 1)) AS route,
+            r.response_status,
+            {latency_bucket} AS latency_bucket,
+            COUNT(*) AS count,
+            COUNT(*) FILTER (WHERE r.response_status >= 500) AS error_count,
+            MIN(r.latency) AS min_latency,
+            MAX(r.latency) AS max_latency,
+            SUM(r.latency) AS sum_latency
+        FROM {source} r
+        CROSS JOIN (VALUES {granularities}) g(granularity)
+        WHERE r.latency IS NOT NULL
+        GROUP BY ALL
+    """
 
 
 class DBManager:
@@ -10,22 +93,56 @@ class DBManager:
         Inicializa o gerenciador do banco de dados.
         """
         logging.info("Initializing DBManager")
-        self.con = duckdb.connect(database="db", read_only=False)
+        self.con = None
+        self._local = threading.local()
+        self._cursors = []
+        self._cursors_lock = threading.Lock()
+        self.connect()
         logging.info("DBManager initialized successfully")
 
+    def connect(self):
+        """
+        Abre a conexão com o banco de dados, se ainda não estiver aberta.
+        """
+        with self._cursors_lock:
+            if self.con is None:
+                self.con = duckdb.connect(database="db", read_only=False)
+
+    def cursor(self):
+        """
+        Retorna o cursor da thread atual, criado na primeira chamada da thread.
+
+        Cada cursor é uma conexão própria sobre o mesmo banco, então threads
+        diferentes podem consultar em paralelo sem compartilhar estado.
+
+        Returns:
+        - duckdb.DuckDBPyConnection: O cursor exclusivo da thread.
+        """
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None:
+            with self._cursors_lock:
+                if self.con is None:
+                    raise RuntimeError("Database connection is closed")
+                cursor = self.con.cursor()
+                self._cursors.append(cursor)
+            self._local.cursor = cursor
+        return cursor
+
     def setup_tables(self):
         """
         Configura as tabelas no banco de dados, criando sequências e tabelas se não existirem.
         """
         logging.info("Setting up tables")
-        self.con.execute(
+        self.cursor().execute(
             "CREATE SEQUENCE IF NOT EXISTS seq_operational_metrics_id START 1"
         )
-        self.con.execute("CREATE SEQUENCE IF NOT EXISTS seq_ml_metrics_id START 1")
-        self.con.execute("CREATE SEQUENCE IF NOT EXISTS seq_predictions_id START 1")
+        self.cursor().execute("CREATE SEQUENCE IF NOT EXISTS seq_ml_metrics_id START 1")
+        self.cursor().execute(
+            "CREATE SEQUENCE IF NOT EXISTS seq_predictions_id START 1"
+        )
 
         # Criar tabelas
-        self.con.execute(
+        self.cursor().execute(
             """
             CREATE TABLE IF NOT EXISTS operational_metrics (
                 id INTEGER PRIMARY KEY DEFAULT NEXTVAL('seq_operational_metrics_id'),
@@ -37,7 +154,7 @@ class DBManager:
             )
         """
         )
-        self.con.execute(
+        self.cursor().execute(
             """
             CREATE TABLE IF NOT EXISTS ml_metrics (
                 id INTEGER PRIMARY KEY DEFAULT NEXTVAL('seq_ml_metrics_id'),
@@ -47,7 +164,7 @@ class DBManager:
             )
         """
         )
-        self.con.execute(
+        self.cursor().execute(
             """
             CREATE TABLE IF NOT EXISTS predictions (
                 id INTEGER PRIMARY KEY DEFAULT NEXTVAL('seq_predictions_id'),
@@ -59,11 +176,66 @@ class DBManager:
             )
         """
         )
+        self.cursor().execute(
+            "ALTER TABLE operational_metrics ADD COLUMN IF NOT EXISTS route TEXT"
+        )
+        # Duração de cada etapa da requisição, em milissegundos
+        for column in STAGE_COLUMNS:
+            self.cursor().execute(
+                f"ALTER TABLE operational_metrics ADD COLUMN IF NOT EXISTS {column} DOUBLE"
+            )
+        self.cursor().execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS operational_metrics_rollups (
+                granularity TEXT,
+                bucket_start TIMESTAMP,
+                route TEXT,
+                response_status INTEGER,
+                latency_bucket INTEGER,
+                count BIGINT,
+                error_count BIGINT,
+                min_latency DOUBLE,
+                max_latency DOUBLE,
+                sum_latency DOUBLE,
+                PRIMARY KEY ({ROLLUP_KEY_COLUMNS})
+            )
+        """
+        )
+        rollups_empty = (
+            self.cursor()
+            .execute("SELECT COUNT(*) = 0 FROM operational_metrics_rollups")
+            .fetchone()[0]
+        )
+        if rollups_empty:
+            # As linhas legadas (sem route) gravaram a latência em segundos
+            # divididos por 1000; nos rollups ela entra em milissegundos
+            self.update_operational_rollups(
+                "(SELECT * REPLACE (CASE WHEN route IS NULL THEN latency * 1e6 "
+                "ELSE latency END AS latency) FROM operational_metrics)"
+            )
+        # Agregados mantidos incrementalmente para o cálculo de RMSE/MAE
+        self.cursor().execute(
+            """
+            CREATE TABLE IF NOT EXISTS ml_metrics_aggregates (
+                model_type TEXT PRIMARY KEY,
+                count BIGINT,
+                sum_abs_error DOUBLE,
+                sum_squared_error DOUBLE
+            )
+        """
+        )
+        aggregates_empty = (
+            self.cursor()
+            .execute("SELECT COUNT(*) = 0 FROM ml_metrics_aggregates")
+            .fetchone()[0]
+        )
+        if aggregates_empty:
+            self.recompute_metric_aggregates(store_metrics=False)
 
     logging.info("Tables set up successfully")
 
     def insert_operational_metric(
-        self, timestamp, method, url, response_status, latency
+        self, timestamp, method, url, response_status, latency, route=None
     ):
         """
         Insere uma métrica operacional na tabela correspondente.
@@ -73,13 +245,184 @@ class DBManager:
         - method (str): O método HTTP utilizado.
         - url (str): A URL acessada.
         - response_status (int): O status da resposta.
-        - latency (float): A latência da requisição.
+        - latency (float): A latência da requisição, em milissegundos.
+        - route (str, opcional): O caminho da rota que atendeu a requisição.
+        """
+        self.insert_operational_metrics(
+            pd.DataFrame(
+                [(timestamp, method, url, response_status, latency, route)],
+                columns=[
+                    "timestamp",
+                    "method",
+                    "url",
+                    "response_status",
+                    "latency",
+                    "route",
+                ],
+            )
+        )
+
+    def insert_operational_metrics(self, metrics):
+        """
+        Insere um lote de métricas operacionais com um único INSERT em massa.
+
+        Os rollups por minuto, hora e dia são atualizados na mesma transação.
+
+        Args:
+        - metrics (pd.DataFrame): As métricas, com as colunas timestamp, method,
+          url, response_status, latency e (opcionalmente) route e as colunas
+          de duração por etapa (validation_ms, model_load_ms, ...).
+        """
+        metrics = metrics.reindex(columns=TABLE_COLUMNS["operational_metrics"][1:])
+        columns = ", ".join(metrics.columns)
+        cursor = self.cursor()
+        cursor.register("operational_metrics_batch", metrics)
+        cursor.execute("BEGIN TRANSACTION")
+        try:
+            cursor.execute(
+                f"INSERT INTO operational_metrics ({columns}) "
+                f"SELECT {columns} FROM operational_metrics_batch"
+            )
+            self.update_operational_rollups("operational_metrics_batch", cursor)
+            cursor.execute("COMMIT")
+        except Exception:
+            cursor.execute("ROLLBACK")
+            raise
+        finally:
+            cursor.unregister("operational_metrics_batch")
+        logging.info(
+            f"Batch of {len(metrics)} operational metrics inserted successfully"
+        )
+
+    def update_operational_rollups(self, source, cursor=None):
+        """
+        Soma aos rollups as métricas operacionais lidas de uma tabela ou subconsulta.
+
+        Args:
+        - source (str): A origem, com as colunas timestamp, url, route,
+          response_status e latency.
+        - cursor (duckdb.DuckDBPyConnection, opcional): O cursor de uma transação
+          em andamento. Default é o cursor da thread.
+        """
+        (cursor or self.cursor()).execute(
+            f"""
+            INSERT INTO operational_metrics_rollups {rollup_rows_sql(source)}
+            ON CONFLICT ({ROLLUP_KEY_COLUMNS}) DO UPDATE SET
+                count = count + excluded.count,
+                error_count = error_count + excluded.error_count,
+                min_latency = LEAST(min_latency, excluded.min_latency),
+                max_latency = GREATEST(max_latency, excluded.max_latency),
+                sum_latency = sum_latency + excluded.sum_latency
+            """
+        )
+
+    def _rollup_source(self):
+        """
+        Retorna a origem dos rollups de métricas operacionais.
+        """
+        return "operational_metrics_rollups"
+
+    def fetch_operational_rollups(
+        self,
+        granularity,
+        start_time=None,
+        end_time=None,
+        route=None,
+        by_status=True,
+    ):
         """
-        self.con.execute(
-            "INSERT INTO operational_metrics (timestamp, method, url, response_status, latency) VALUES (?, ?, ?, ?, ?)",
-            (timestamp, method, url, response_status, latency),
+        Busca os rollups de métricas operacionais com percentis de latência.
+
+        O custo depende apenas do número de baldes no intervalo, não do
+        tamanho da tabela operational_metrics.
+
+        Args:
+        - granularity (str): minute, hour ou day.
+        - start_time (datetime, opcional): Início (inclusivo) do intervalo.
+        - end_time (datetime, opcional): Fim (exclusivo) do intervalo.
+        - route (str, opcional): Filtra por uma rota.
+        - by_status (bool): Se False, soma todos os status de cada rota.
+
+        Returns:
+        - List[Dict]: Um dicionário por balde, rota (e status) com count,
+          error_count, min/max/mean e p50/p95/p99 da latência.
+        """
+        if granularity not in ROLLUP_GRANULARITIES:
+            raise ValueError(f"Granularity {granularity} not supported")
+        conditions, params = ["granularity = ?"], [granularity]
+        if start_time is not None:
+            conditions.append("bucket_start >= ?")
+            params.append(start_time)
+        if end_time is not None:
+            conditions.append("bucket_start < ?")
+            params.append(end_time)
+        if route is not None:
+            conditions.append("route = ?")
+            params.append(route)
+        key_columns = ["bucket_start", "route"]
+        if by_status:
+            key_columns.append("response_status")
+        keys = ", ".join(key_columns)
+        rows = (
+            self.cursor()
+            .execute(
+                f"""
+                SELECT {keys}, latency_bucket, SUM(count), SUM(error_count),
+                       MIN(min_latency), MAX(max_latency), SUM(sum_latency)
+                FROM {self._rollup_source()}
+                WHERE {" AND ".join(conditions)}
+                GROUP BY {keys}, latency_bucket
+                ORDER BY {keys}, latency_bucket
+                """,
+                params,
+            )
+            .fetchall()
         )
-        logging.info("Operational metric inserted successfully")
+
+        rollups = {}
+        n_keys = len(key_columns)
+        for row in rows:
+            key = row[:n_keys]
+            (
+                latency_bucket,
+                count,
+                error_count,
+                min_latency,
+                max_latency,
+                sum_latency,
+            ) = row[n_keys:]
+            rollup = rollups.get(key)
+            if rollup is None:
+                rollup = rollups[key] = {
+                    **dict(zip(key_columns, key)),
+                    "count": 0,
+                    "error_count": 0,
+                    "min_latency": min_latency,
+                    "max_latency": max_latency,
+                    "sum_latency": 0.0,
+                    "latency_counts": [0] * (len(ROLLUP_LATENCY_BOUNDS) + 1),
+                }
+            rollup["count"] += count
+            rollup["error_count"] += error_count
+            rollup["min_latency"] = min(rollup["min_latency"], min_latency)
+            rollup["max_latency"] = max(rollup["max_latency"], max_latency)
+            rollup["sum_latency"] += sum_latency
+            rollup["latency_counts"][latency_bucket] += count
+
+        results = []
+        for rollup in rollups.values():
+            counts = rollup.pop("latency_counts")
+            sum_latency = rollup.pop("sum_latency")
+            rollup["mean_latency"] = sum_latency / rollup["count"]
+            for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+                # Limite superior do balde, sem passar do máximo observado
+                rollup[f"{name}_latency"] = min(
+                    quantile_from_counts(ROLLUP_LATENCY_BOUNDS, counts, q),
+                    rollup["max_latency"],
+                )
+            results.append(rollup)
+        logging.info("Operational rollups fetched successfully")
+        return results
 
     def insert_ml_metric(self, timestamp, rmse, mae):
         """
@@ -90,7 +433,7 @@ class DBManager:
         - rmse (float): O valor do RMSE.
         - mae (float): O valor do MAE.
         """
-        self.con.execute(
+        self.cursor().execute(
             "INSERT INTO ml_metrics (timestamp, rmse, mae) VALUES (?, ?, ?)",
             (timestamp, rmse, mae),
         )
@@ -109,113 +452,601 @@ class DBManager:
         - predicted_value (float): O valor previsto.
         - actual_value (float, opcional): O valor real. Default é None.
         """
-        self.con.execute(
+        self.cursor().execute(
             "INSERT INTO predictions (timestamp, model_type, input_data, predicted_value, actual_value) VALUES (?, ?, ?, ?, ?)",
             (timestamp, model_type, input_data, predicted_value, actual_value),
         )
         logging.info("Prediction inserted successfully")
 
+    def insert_predictions(
+        self, timestamp, model_type, input_data, predicted_values, ids=None
+    ):
+        """
+        Insere um lote de previsões com um único INSERT em massa.
+
+        Args:
+        - timestamp (TIMESTAMP): O timestamp comum a todas as previsões do lote.
+        - model_type (str): O tipo do modelo utilizado.
+        - input_data (List[str]): Os dados de entrada de cada previsão.
+        - predicted_values (List[float]): Os valores previstos, na mesma ordem.
+        - ids (List[int], opcional): IDs já alocados com allocate_prediction_ids.
+        """
+        self.insert_prediction_records(
+            pd.DataFrame(
+                {
+                    "id": ids
+                    if ids is not None
+                    else self.allocate_prediction_ids(len(predicted_values)),
+                    "timestamp": timestamp,
+                    "model_type": model_type,
+                    "input_data": input_data,
+                    "predicted_value": predicted_values,
+                }
+            )
+        )
+
+    def insert_prediction_records(self, predictions):
+        """
+        Insere previsões com IDs já alocados usando um único INSERT em massa.
+
+        Args:
+        - predictions (pd.DataFrame): As previsões, com as colunas id, timestamp,
+          model_type, input_data e predicted_value.
+        """
+        self.cursor().register("predictions_batch", predictions)
+        try:
+            self.cursor().execute(
+                "INSERT INTO predictions (id, timestamp, model_type, input_data, predicted_value) "
+                "SELECT id, timestamp, model_type, input_data, predicted_value FROM predictions_batch"
+            )
+        finally:
+            self.cursor().unregister("predictions_batch")
+        logging.info(f"Batch of {len(predictions)} predictions inserted successfully")
+
+    def allocate_prediction_ids(self, count):
+        """
+        Reserva IDs da sequência seq_predictions_id para previsões ainda não gravadas.
+
+        Args:
+        - count (int): Quantidade de IDs a reservar.
+
+        Returns:
+        - List[int]: Os IDs reservados.
+        """
+        ids = (
+            self.cursor()
+            .execute(
+                "SELECT nextval('seq_predictions_id') AS id FROM range(?)", (count,)
+            )
+            .fetchnumpy()["id"]
+        )
+        return ids.tolist()
+
+    def _aggregates_transaction(self, apply):
+        """
+        Executa apply(cursor) numa transação que altera ml_metrics_aggregates.
+
+        As transações são serializadas por _aggregates_lock e, se ainda assim
+        conflitarem com outra escrita (TransactionException), são desfeitas e
+        repetidas até TRANSACTION_RETRIES vezes. Outros erros não são repetidos.
+
+        Args:
+        - apply (Callable): Função que recebe o cursor e faz as alterações.
+
+        Returns:
+        - O valor retornado por apply.
+        """
+        for attempt in range(TRANSACTION_RETRIES + 1):
+            with _aggregates_lock, self.con.cursor() as cursor:
+                cursor.execute("BEGIN TRANSACTION")
+                try:
+                    result = apply(cursor)
+                    cursor.execute("COMMIT")
+                    return result
+                except duckdb.TransactionException as e:
+                    self._rollback(cursor)
+                    if attempt == TRANSACTION_RETRIES:
+                        raise
+                    logging.warning(f"Transaction conflict, retrying: {e}")
+                except Exception:
+                    self._rollback(cursor)
+                    raise
+            time.sleep(TRANSACTION_RETRY_DELAY_S * 2**attempt)
+
+    @staticmethod
+    def _rollback(cursor):
+        # Um COMMIT que falhou já encerrou a transação
+        try:
+            cursor.execute("ROLLBACK")
+        except duckdb.TransactionException:
+            pass
+
     def update_actual_value_by_id(self, prediction_id, actual_value):
         """
         Atualiza o valor real para uma previsão específica no banco de dados usando seu ID.
 
+        Os agregados de erro do modelo são ajustados na mesma transação: o erro
+        anterior (se o valor real estiver sendo sobrescrito) é removido e o novo
+        erro é somado, sem reler a tabela de previsões.
+
         Args:
         - prediction_id (int): O ID da previsão a ser atualizada.
         - actual_value (float): O valor real a ser atualizado.
         """
-        self.con.execute(
-            "UPDATE predictions SET actual_value = ? WHERE id = ?",
-            (actual_value, prediction_id),
-        )
+
+        def apply(cursor):
+            row = cursor.execute(
+                "SELECT model_type, predicted_value, actual_value FROM predictions WHERE id = ?",
+                (prediction_id,),
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Prediction with ID {prediction_id} not found")
+            model_type, predicted_value, old_actual_value = row
+            cursor.execute(
+                "UPDATE predictions SET actual_value = ? WHERE id = ?",
+                (actual_value, prediction_id),
+            )
+            # O valor gravado (FLOAT) é o que entra nos agregados
+            new_actual_value = cursor.execute(
+                "SELECT actual_value FROM predictions WHERE id = ?",
+                (prediction_id,),
+            ).fetchone()[0]
+
+            count_delta, abs_delta, squared_delta = 1, 0.0, 0.0
+            if old_actual_value is not None:
+                old_error = old_actual_value - predicted_value
+                count_delta = 0
+                abs_delta -= abs(old_error)
+                squared_delta -= old_error**2
+            new_error = new_actual_value - predicted_value
+            abs_delta += abs(new_error)
+            squared_delta += new_error**2
+            cursor.execute(
+                """
+                INSERT INTO ml_metrics_aggregates VALUES (?, ?, ?, ?)
+                ON CONFLICT (model_type) DO UPDATE SET
+                    count = count + excluded.count,
+                    sum_abs_error = sum_abs_error + excluded.sum_abs_error,
+                    sum_squared_error = sum_squared_error + excluded.sum_squared_error
+                """,
+                (model_type, count_delta, abs_delta, squared_delta),
+            )
+
+        self._aggregates_transaction(apply)
         logging.info("Prediction updated successfully")
 
         # Após atualizar o valor real, dispare o cálculo das métricas
         self.calculate_and_store_metrics()
 
-    def calculate_and_store_metrics(self):
+    def update_actual_values(self, updates):
         """
-        Calcula as métricas com base nas previsões e nos valores reais e armazena no banco de dados.
+        Atualiza o valor real de várias previsões com um único UPDATE ... FROM.
+
+        Para IDs repetidos vale o último valor do lote. Os agregados de erro são
+        ajustados com um único INSERT ... SELECT agrupado por modelo na mesma
+        transação, e as métricas são recalculadas uma vez por lote.
+
+        Args:
+        - updates (pd.DataFrame): Os pares, com as colunas id e actual_value.
+
+        Returns:
+        - Dict: Quantos IDs foram recebidos, atualizados, não encontrados
+          (missing) e repetidos no lote (duplicated).
         """
-        # Recuperar todas as previsões que possuem valores reais e previstos
-        predictions_data = self.con.execute(
-            "SELECT predicted_value, actual_value FROM predictions WHERE actual_value IS NOT NULL"
-        ).fetchall()
+        received = len(updates)
+        duplicated = int(updates["id"][updates["id"].duplicated()].nunique())
+        updates = updates.drop_duplicates("id", keep="last")
+
+        def apply(cursor):
+            cursor.register("actual_values_batch", updates)
+            try:
+                updated = cursor.execute(
+                    "SELECT COUNT(*) FROM predictions JOIN actual_values_batch u ON predictions.id = u.id"
+                ).fetchone()[0]
+                # O valor novo é convertido para FLOAT como ficará gravado, e o
+                # erro anterior (se houver) sai dos agregados
+                cursor.execute(
+                    """
+                    INSERT INTO ml_metrics_aggregates
+                    SELECT
+                        p.model_type,
+                        COUNT(*) FILTER (WHERE p.actual_value IS NULL),
+                        SUM(ABS(CAST(CAST(u.actual_value AS FLOAT) AS DOUBLE) - p.predicted_value)
+                            - COALESCE(ABS(CAST(p.actual_value AS DOUBLE) - p.predicted_value), 0)),
+                        SUM(POW(CAST(CAST(u.actual_value AS FLOAT) AS DOUBLE) - p.predicted_value, 2)
+                            - COALESCE(POW(CAST(p.actual_value AS DOUBLE) - p.predicted_value, 2), 0))
+                    FROM predictions p
+                    JOIN actual_values_batch u ON p.id = u.id
+                    GROUP BY p.model_type
+                    ON CONFLICT (model_type) DO UPDATE SET
+                        count = count + excluded.count,
+                        sum_abs_error = sum_abs_error + excluded.sum_abs_error,
+                        sum_squared_error = sum_squared_error + excluded.sum_squared_error
+                    """
+                )
+                cursor.execute(
+                    """
+                    UPDATE predictions SET actual_value = u.actual_value
+                    FROM actual_values_batch u
+                    WHERE predictions.id = u.id
+                    """
+                )
+            finally:
+                cursor.unregister("actual_values_batch")
+            return updated
+
+        updated = self._aggregates_transaction(apply)
+        logging.info(f"Batch of {updated} actual values updated successfully")
+
+        if updated:
+            self.calculate_and_store_metrics()
+        return {
+            "received": received,
+            "updated": updated,
+            "missing": len(updates) - updated,
+            "duplicated": duplicated,
+        }
+
+    def recompute_metric_aggregates(self, store_metrics=True):
+        """
+        Recalcula os agregados de erro a partir de todas as previsões rotuladas.
 
-        true_values = [row[1] for row in predictions_data]
-        predicted_values = [row[0] for row in predictions_data]
+        Serve para reconciliação (por exemplo, após alterações feitas fora da API)
+        e para popular os agregados de um banco já existente. As previsões já
+        arquivadas pela retenção também entram, como nos agregados incrementais.
+
+        Args:
+        - store_metrics (bool): Se True, grava uma nova linha em ml_metrics.
+        """
+        sql, params = self._select_sql(
+            "predictions",
+            columns=["model_type", "predicted_value", "actual_value"],
+            include_archive=True,
+        )
+
+        def apply(cursor):
+            # DELETE + INSERT da mesma chave numa transação viola a PK no
+            # DuckDB 0.8, então os agregados são zerados e sobrescritos
+            cursor.execute(
+                "UPDATE ml_metrics_aggregates SET count = 0, sum_abs_error = 0, sum_squared_error = 0"
+            )
+            cursor.execute(
+                f"""
+                INSERT INTO ml_metrics_aggregates
+                SELECT
+                    model_type,
+                    COUNT(*),
+                    SUM(ABS(CAST(actual_value AS DOUBLE) - predicted_value)),
+                    SUM(POW(CAST(actual_value AS DOUBLE) - predicted_value, 2))
+                FROM ({sql})
+                WHERE actual_value IS NOT NULL
+                GROUP BY model_type
+                ON CONFLICT (model_type) DO UPDATE SET
+                    count = excluded.count,
+                    sum_abs_error = excluded.sum_abs_error,
+                    sum_squared_error = excluded.sum_squared_error
+                """,
+                params,
+            )
+
+        self._aggregates_transaction(apply)
+        logging.info("Metric aggregates recomputed successfully")
+        if store_metrics:
+            self.calculate_and_store_metrics()
+
+    def fetch_metric_aggregates(self):
+        """
+        Busca os agregados de erro e as métricas derivadas por tipo de modelo.
+
+        Returns:
+        - List[Dict]: Uma lista de dicionários com count, rmse e mae por model_type.
+        """
+        aggregates = (
+            self.cursor()
+            .execute(
+                "SELECT model_type, count, sum_abs_error, sum_squared_error FROM ml_metrics_aggregates WHERE count > 0 ORDER BY model_type"
+            )
+            .fetchall()
+        )
+        return [
+            {
+                "model_type": model_type,
+                "count": count,
+                "rmse": calculate_rmse_from_aggregates(count, sum_squared_error),
+                "mae": calculate_mae_from_aggregates(count, sum_abs_error),
+            }
+            for model_type, count, sum_abs_error, sum_squared_error in aggregates
+        ]
+
+    def calculate_and_store_metrics(self):
+        """
+        Calcula as métricas a partir dos agregados de erro e armazena no banco de dados.
+        """
+        count, sum_abs_error, sum_squared_error = (
+            self.cursor()
+            .execute(
+                "SELECT SUM(count), SUM(sum_abs_error), SUM(sum_squared_error) FROM ml_metrics_aggregates"
+            )
+            .fetchone()
+        )
+        if not count:
+            logging.info("No labeled predictions to calculate metrics from")
+            return
 
         # Calcular RMSE e MAE
-        rmse = calculate_rmse(true_values, predicted_values)
-        mae = calculate_mae(true_values, predicted_values)
+        rmse = calculate_rmse_from_aggregates(count, sum_squared_error)
+        mae = calculate_mae_from_aggregates(count, sum_abs_error)
 
         # Armazenar as métricas calculadas no banco de dados
         timestamp = datetime.datetime.now()
         self.insert_ml_metric(timestamp, rmse, mae)
         logging.info("Metrics calculated and stored successfully")
 
-    def fetch_operational_metrics(self):
+    def _source(self, table):
+        """
+        Retorna a origem (tabela ou subconsulta) lida para a tabela informada.
+        """
+        return table
+
+    def _select_sql(
+        self,
+        table,
+        columns=None,
+        after_id=None,
+        limit=None,
+        start_time=None,
+        end_time=None,
+        include_archive=False,
+    ):
         """
-        Busca todas as métricas operacionais do banco de dados.
+        Monta o SELECT paginado por ID (keyset) com os filtros no próprio SQL.
+
+        Args:
+        - table (str): A tabela consultada.
+        - columns (List[str], opcional): As colunas; todas por padrão.
+        - after_id (int, opcional): Retorna apenas linhas com ID maior que este.
+        - limit (int, opcional): Número máximo de linhas.
+        - start_time (datetime, opcional): Início (inclusivo) do intervalo.
+        - end_time (datetime, opcional): Fim (exclusivo) do intervalo.
+        - include_archive (bool): Se True, inclui as linhas já arquivadas em Parquet.
 
         Returns:
-        - List[Dict]: Uma lista de dicionários contendo as métricas operacionais.
+        - Tuple[str, List]: O SQL e seus parâmetros.
         """
-        metrics = self.con.execute("SELECT * FROM operational_metrics").fetchall()
-        metrics_dicts = [
-            dict(
-                zip(
-                    ("id", "timestamp", "method", "url", "response_status", "latency"),
-                    metric,
-                )
+        unknown_columns = set(columns or []) - set(TABLE_COLUMNS[table])
+        if unknown_columns:
+            raise ValueError(f"Unknown columns: {', '.join(sorted(unknown_columns))}")
+        conditions, params = [], []
+        if after_id is not None:
+            conditions.append("id > ?")
+            params.append(after_id)
+        if start_time is not None:
+            conditions.append("timestamp >= ?")
+            params.append(start_time)
+        if end_time is not None:
+            conditions.append("timestamp < ?")
+            params.append(end_time)
+        source = self._source(table)
+        if include_archive and glob.glob(self._archive_glob(table)):
+            source = (
+                f"(SELECT * FROM {source} UNION ALL BY NAME "
+                f"SELECT * FROM read_parquet('{self._archive_glob(table)}', "
+                "hive_partitioning=true, union_by_name=true))"
             )
-            for metric in metrics
-        ]
+        sql = f"SELECT {', '.join(columns or TABLE_COLUMNS[table])} FROM {source}"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return sql, params
+
+    def _fetch_dicts(self, table, **filters):
+        sql, params = self._select_sql(table, **filters)
+        rows = self.cursor().execute(sql, params).fetchall()
+        return [dict(zip(TABLE_COLUMNS[table], row)) for row in rows]
+
+    def fetch_operational_metrics(self, **filters):
+        """
+        Busca as métricas operacionais do banco de dados, ordenadas por ID.
+
+        Args:
+        - filters: after_id, limit, start_time e end_time (ver _select_sql).
+
+        Returns:
+        - List[Dict]: Uma lista de dicionários contendo as métricas operacionais.
+        """
+        metrics_dicts = self._fetch_dicts("operational_metrics", **filters)
         logging.info("Operational metrics fetched successfully")
         return metrics_dicts
 
-    def fetch_ml_metrics(self):
+    def fetch_ml_metrics(self, **filters):
         """
-        Busca todas as métricas de aprendizado de máquina do banco de dados.
+        Busca as métricas de aprendizado de máquina do banco de dados, ordenadas por ID.
+
+        Args:
+        - filters: after_id, limit, start_time e end_time (ver _select_sql).
 
         Returns:
         - List[Dict]: Uma lista de dicionários contendo as métricas de aprendizado de máquina.
         """
-        metrics = self.con.execute("SELECT * FROM ml_metrics").fetchall()
-        metrics_dicts = [
-            dict(zip(("id", "timestamp", "rmse", "mae"), metric)) for metric in metrics
-        ]
+        metrics_dicts = self._fetch_dicts("ml_metrics", **filters)
         logging.info("ML metrics fetched successfully")
         return metrics_dicts
 
-    def fetch_predictions(self):
+    def fetch_predictions(self, **filters):
         """
-        Busca todas as previsões do banco de dados.
+        Busca as previsões do banco de dados, ordenadas por ID.
+
+        Args:
+        - filters: after_id, limit, start_time e end_time (ver _select_sql).
 
         Returns:
         - List[Dict]: Uma lista de dicionários contendo as previsões.
         """
-        predictions = self.con.execute("SELECT * FROM predictions").fetchall()
-        predictions_dicts = [
-            dict(
-                zip(
-                    (
-                        "id",
-                        "timestamp",
-                        "model_type",
-                        "input_data",
-                        "predicted_value",
-                        "actual_value",
-                    ),
-                    prediction,
-                )
-            )
-            for prediction in predictions
-        ]
+        predictions_dicts = self._fetch_dicts("predictions", **filters)
         logging.info("Predictions fetched successfully")
         return predictions_dicts
 
+    def iter_record_batches(self, table, batch_size=STREAM_BATCH_ROWS, **filters):
+        """
+        Lê uma tabela em lotes Arrow, sem materializar o resultado inteiro.
+
+        Usa um cursor próprio, pois o gerador pode ser consumido aos poucos
+        por threads diferentes. Sempre produz ao menos um lote (vazio, se não
+        houver linhas), para que o schema chegue a quem consome.
+
+        Args:
+        - table (str): A tabela lida.
+        - batch_size (int): Número de linhas por lote.
+        - filters: columns, after_id, limit, start_time e end_time (ver _select_sql).
+
+        Yields:
+        - pyarrow.RecordBatch: Os lotes, em ordem de ID.
+        """
+        sql, params = self._select_sql(table, **filters)
+        cursor = self.con.cursor()
+        try:
+            reader = cursor.execute(sql, params).fetch_record_batch(batch_size)
+            empty = True
+            while True:
+                try:
+                    batch = reader.read_next_batch()
+                except StopIteration:
+                    break
+                empty = False
+                yield batch
+            if empty:
+                yield pa.RecordBatch.from_pylist([], schema=reader.schema)
+        finally:
+            cursor.close()
+
+    def _archive_glob(self, table):
+        return os.path.join(ARCHIVE_DIR, table, "*", "*.parquet")
+
+    def archive_rows(self, table, cutoff, labeled_only=False):
+        """
+        Move as linhas anteriores a ``cutoff`` para arquivos Parquet por data.
+
+        Cada dia vira um arquivo em ARCHIVE_DIR/<tabela>/date=AAAA-MM-DD/, com
+        o intervalo de IDs no nome (repetir o arquivamento sobrescreve o mesmo
+        arquivo). O arquivo é gravado antes de as linhas serem apagadas.
+
+        Args:
+        - table (str): operational_metrics, ml_metrics ou predictions.
+        - cutoff (datetime): Linhas com timestamp anterior a este são arquivadas.
+        - labeled_only (bool): Se True, só arquiva previsões que já têm
+          actual_value; as demais ainda podem receber o valor real.
+
+        Returns:
+        - int: Número de linhas arquivadas.
+        """
+        cursor = self.cursor()
+        row_filter = "timestamp < ?"
+        if labeled_only:
+            row_filter += " AND actual_value IS NOT NULL"
+        days = cursor.execute(
+            f"SELECT CAST(timestamp AS DATE) AS day, MIN(id), MAX(id), COUNT(*) "
+            f"FROM {table} WHERE {row_filter} GROUP BY day ORDER BY day",
+            (cutoff,),
+        ).fetchall()
+        columns = ", ".join(TABLE_COLUMNS[table])
+        archived = 0
+        for day, min_id, max_id, count in days:
+            partition_dir = os.path.join(ARCHIVE_DIR, table, f"date={day.isoformat()}")
+            os.makedirs(partition_dir, exist_ok=True)
+            file_name = f"part-{min_id}-{max_id}.parquet"
+            tmp_path = os.path.join(partition_dir, f".{file_name}.tmp")
+            day_filter = f"{row_filter} AND CAST(timestamp AS DATE) = ?"
+            cursor.execute(
+                f"COPY (SELECT {columns} FROM {table} WHERE {day_filter} ORDER BY id) "
+                f"TO '{tmp_path}' (FORMAT PARQUET)",
+                (cutoff, day),
+            )
+            os.replace(tmp_path, os.path.join(partition_dir, file_name))
+            cursor.execute(f"DELETE FROM {table} WHERE {day_filter}", (cutoff, day))
+            archived += count
+        logging.info(f"{archived} rows of {table} archived to {ARCHIVE_DIR}")
+        return archived
+
+    def delete_rollups_before(self, granularity, cutoff):
+        """
+        Apaga os rollups de uma granularidade anteriores a ``cutoff``.
+
+        Args:
+        - granularity (str): minute, hour ou day.
+        - cutoff (datetime): Baldes que começam antes deste instante são apagados.
+
+        Returns:
+        - int: Número de linhas apagadas.
+        """
+        deleted = (
+            self.cursor()
+            .execute(
+                "DELETE FROM operational_metrics_rollups WHERE granularity = ? AND bucket_start < ?",
+                (granularity, cutoff),
+            )
+            .fetchone()[0]
+        )
+        logging.info(f"{deleted} {granularity} rollups deleted")
+        return deleted
+
+    def checkpoint(self):
+        """
+        Grava o WAL no arquivo do banco e libera o espaço das linhas apagadas.
+        """
+        self.cursor().execute("CHECKPOINT")
+        self.cursor().execute("VACUUM")
+        logging.info("Database checkpointed successfully")
+
     def close(self):
         """
-        Fecha a conexão com o banco de dados.
+        Fecha os cursores de todas as threads e a conexão com o banco de dados.
         """
-        self.con.close()
+        with self._cursors_lock:
+            for cursor in self._cursors:
+                cursor.close()
+            self._cursors = []
+            self._local = threading.local()
+            if self.con is not None:
+                self.con.close()
+                self.con = None
+
+
+_db_manager = None
+_db_manager_lock = threading.Lock()
+
+
+def get_db_manager():
+    """Return the DBManager shared by the whole application.
+
+    With SHARD_MODE=true this is a ShardedDBManager writing Parquet segments,
+    so several worker processes can run side by side.
+    """
+    global _db_manager
+    if _db_manager is None:
+        with _db_manager_lock:
+            if _db_manager is None:
+                # Importado aqui porque ShardedDBManager herda de DBManager
+                from .sharded_db_manager import SHARD_MODE, ShardedDBManager
+
+                _db_manager = ShardedDBManager() if SHARD_MODE else DBManager()
+    return _db_manager
+
+
+class IdBlockAllocator:
+    """Hand out IDs from a sequence, reserving them from the database in blocks."""
+
+    def __init__(self, allocate_fn, block_size):
+        self.allocate_fn = allocate_fn
+        self.block_size = block_size
+        self._ids = deque()
+        self._lock = threading.Lock()
+
+    def next_id(self):
+        """Return the next reserved ID, fetching a new block when exhausted."""
+        with self._lock:
+            if not self._ids:
+                self._ids.extend(self.allocate_fn(self.block_size))
+            return self._ids.popleft()
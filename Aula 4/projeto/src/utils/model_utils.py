@@ -2,33 +2,265 @@
 
 import os
 import json
+import datetime
+import hashlib
+import tempfile
+import threading
 import xgboost as xgb
+from src.models.tree_engine import TreeEnsemble
 
 MODEL_DIR = "model_artifacts"
+# Artifacts written before the versioned registry existed (read-only fallback)
 XGBOOST_MODEL_PATH = os.path.join(MODEL_DIR, "xgboost_model.json")
 BASELINE_MODEL_PATH = os.path.join(MODEL_DIR, "baseline_model.json")
+LEGACY_MODEL_PATHS = {"xgboost": XGBOOST_MODEL_PATH, "baseline": BASELINE_MODEL_PATH}
+MODEL_TYPES = tuple(LEGACY_MODEL_PATHS)
 
+# Versioned registry: immutable version directories plus an atomic pointer
+REGISTRY_DIR = os.path.join(MODEL_DIR, "registry")
+VERSIONS_DIR = os.path.join(REGISTRY_DIR, "versions")
+CURRENT_POINTER_PATH = os.path.join(REGISTRY_DIR, "CURRENT")
+MANIFEST_FILE = "manifest.json"
+ARTIFACT_FILES = {"xgboost": "xgboost_model.ubj", "baseline": "baseline_model.json"}
 
-def save_xgboost_model(model: xgb.XGBRegressor):
-    """Save the XGBoost model to a file."""
-    model.save_model(XGBOOST_MODEL_PATH)
+# Up to this many rows the NumPy tree engine is faster than XGBRegressor.predict
+# (see benchmarks/bench_tree_engine.py); 0 disables the engine.
+TREE_ENGINE_MAX_ROWS = int(os.getenv("TREE_ENGINE_MAX_ROWS", "32"))
 
 
-def load_xgboost_model() -> xgb.XGBRegressor:
-    """Load the XGBoost model from a file."""
+def _file_signature(path: str) -> tuple:
+    stat = os.stat(path)
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+class ModelCache:
+    """Process-wide cache of loaded models keyed by artifact path and loader.
+
+    Each entry remembers the signature of the artifact it was loaded from,
+    so a single ``os.stat`` per lookup is enough to notice a retrain. Only
+    the most recent artifact is kept per loader.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._reloads = 0
+
+    def get(self, path: str, loader):
+        """Return the model stored at ``path``, loading it only when it changed."""
+        key = (path, loader)
+        signature = _file_signature(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self._hits += 1
+                return entry[1]
+            model = loader(path)
+            stale_keys = [k for k in self._entries if k[1] is loader]
+            if stale_keys:
+                self._reloads += 1
+            else:
+                self._misses += 1
+            for stale_key in stale_keys:
+                del self._entries[stale_key]
+            self._entries[key] = (signature, model)
+            return model
+
+    def stats(self) -> dict:
+        """Return hit/miss/reload counters."""
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "reloads": self._reloads,
+                "cached_models": len(self._entries),
+            }
+
+
+_model_cache = ModelCache()
+_registry_lock = threading.Lock()
+_current_pointer = (None, None)
+
+
+def get_current_version() -> str:
+    """Return the version the CURRENT pointer refers to, or None without a registry."""
+    global _current_pointer
+    try:
+        signature = _file_signature(CURRENT_POINTER_PATH)
+    except FileNotFoundError:
+        return None
+    cached_signature, version = _current_pointer
+    if cached_signature != signature:
+        with open(CURRENT_POINTER_PATH, "r") as f:
+            version = f.read().strip()
+        _current_pointer = (signature, version)
+    return version
+
+
+def _set_current_version(version: str):
+    """Atomically point CURRENT to ``version``."""
+    tmp_path = f"{CURRENT_POINTER_PATH}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, CURRENT_POINTER_PATH)
+
+
+def get_artifact_path(model_type: str) -> str:
+    """Return the artifact file serving ``model_type`` right now."""
+    version = get_current_version()
+    if version is None:
+        return LEGACY_MODEL_PATHS[model_type]
+    return os.path.join(VERSIONS_DIR, version, ARTIFACT_FILES[model_type])
+
+
+def read_manifest(version: str) -> dict:
+    """Read the manifest of a published version."""
+    with open(os.path.join(VERSIONS_DIR, version, MANIFEST_FILE), "r") as f:
+        return json.load(f)
+
+
+def list_model_versions() -> list:
+    """Return the manifests of every published version, newest first."""
+    if not os.path.isdir(VERSIONS_DIR):
+        return []
+    versions = sorted(
+        (name for name in os.listdir(VERSIONS_DIR) if not name.startswith(".")),
+        reverse=True,
+    )
+    return [read_manifest(version) for version in versions]
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def publish_models(
+    xgb_model: xgb.XGBRegressor, baseline_value: float, metadata: dict = None
+) -> dict:
+    """Save both models as a new immutable version and make it current.
+
+    Artifacts are written to a hidden staging directory that is renamed into
+    place, then the CURRENT pointer is swapped with ``os.replace``. Readers
+    therefore only ever see complete versions, and requests already holding
+    the previous models keep using them until they finish.
+    """
+    with _registry_lock:
+        previous_version = get_current_version()
+        created_at = datetime.datetime.now(datetime.timezone.utc)
+        version = created_at.strftime("%Y%m%dT%H%M%S%fZ")
+        os.makedirs(VERSIONS_DIR, exist_ok=True)
+        staging_dir = tempfile.mkdtemp(prefix=f".{version}-", dir=VERSIONS_DIR)
+        os.chmod(staging_dir, 0o755)
+
+        xgb_model.save_model(os.path.join(staging_dir, ARTIFACT_FILES["xgboost"]))
+        with open(os.path.join(staging_dir, ARTIFACT_FILES["baseline"]), "w") as f:
+            json.dump({"baseline_value": float(baseline_value)}, f)
+
+        manifest = {
+            "version": version,
+            "created_at": created_at.isoformat(),
+            "previous_version": previous_version,
+            "xgboost_version": xgb.__version__,
+            "artifacts": {
+                model_type: {
+                    "file": file_name,
+                    "size": os.path.getsize(os.path.join(staging_dir, file_name)),
+                    "sha256": _sha256(os.path.join(staging_dir, file_name)),
+                }
+                for model_type, file_name in ARTIFACT_FILES.items()
+            },
+            "metadata": metadata or {},
+        }
+        with open(os.path.join(staging_dir, MANIFEST_FILE), "w") as f:
+            json.dump(manifest, f, indent=2, default=str)
+
+        os.rename(staging_dir, os.path.join(VERSIONS_DIR, version))
+        _set_current_version(version)
+
+    # Load the new version now instead of on the next request
+    get_xgboost_model()
+    get_xgboost_engine()
+    get_baseline_model()
+    return manifest
+
+
+def rollback_models() -> dict:
+    """Point CURRENT back to the version that preceded the current one."""
+    with _registry_lock:
+        current_version = get_current_version()
+        if current_version is None:
+            raise ValueError("No model version has been published yet")
+        previous_version = read_manifest(current_version)["previous_version"]
+        if previous_version is None:
+            raise ValueError(f"Version {current_version} has no previous version")
+        _set_current_version(previous_version)
+    return read_manifest(previous_version)
+
+
+def load_xgboost_model(path: str = None) -> xgb.XGBRegressor:
+    """Load the XGBoost model from a file (JSON or UBJ)."""
     model = xgb.XGBRegressor()
-    model.load_model(XGBOOST_MODEL_PATH)
+    model.load_model(path or get_artifact_path("xgboost"))
     return model
 
 
-def save_baseline_model(value: float):
-    """Save the baseline model value to a file."""
-    with open(BASELINE_MODEL_PATH, "w") as f:
-        json.dump({"baseline_value": value}, f)
+def load_xgboost_engine(path: str = None) -> TreeEnsemble:
+    """Load the XGBoost model file into the NumPy tree engine."""
+    path = path or get_artifact_path("xgboost")
+    if path.endswith(".json"):
+        return TreeEnsemble.load(path)
+    return TreeEnsemble.from_booster(load_xgboost_model(path).get_booster())
 
 
-def load_baseline_model() -> float:
+def load_baseline_model(path: str = None) -> float:
     """Load the baseline model value from a file."""
-    with open(BASELINE_MODEL_PATH, "r") as f:
+    with open(path or get_artifact_path("baseline"), "r") as f:
         data = json.load(f)
     return data["baseline_value"]
+
+
+def get_xgboost_model() -> xgb.XGBRegressor:
+    """Return the cached XGBoost model of the current version."""
+    return _model_cache.get(get_artifact_path("xgboost"), load_xgboost_model)
+
+
+def get_xgboost_engine() -> TreeEnsemble:
+    """Return the cached NumPy tree engine of the current version."""
+    return _model_cache.get(get_artifact_path("xgboost"), load_xgboost_engine)
+
+
+def get_xgboost_predictor(n_rows: int = 1):
+    """Return the fastest XGBoost predictor for a batch of ``n_rows`` rows.
+
+    Both the tree engine and ``XGBRegressor`` expose ``predict(features)``.
+    """
+    if n_rows <= TREE_ENGINE_MAX_ROWS:
+        return get_xgboost_engine()
+    return get_xgboost_model()
+
+
+def get_baseline_model() -> float:
+    """Return the cached baseline value of the current version."""
+    return _model_cache.get(get_artifact_path("baseline"), load_baseline_model)
+
+
+def get_model_version(model_type: str) -> str:
+    """Return an identifier of the artifact currently serving ``model_type``."""
+    version = get_current_version()
+    if version is not None:
+        return version
+    _, mtime_ns, size = _file_signature(LEGACY_MODEL_PATHS[model_type])
+    return f"legacy-{mtime_ns}-{size}"
+
+
+def get_model_cache_stats() -> dict:
+    """Return the model cache counters."""
+    return _model_cache.stats()
@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from src.models.predict import FEATURE_COLUMNS
+
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "10000"))
+PREDICTION_CACHE_TTL_SECONDS = float(os.getenv("PREDICTION_CACHE_TTL_SECONDS", "300"))
+PREDICTION_CACHE_DECIMALS = int(os.getenv("PREDICTION_CACHE_DECIMALS", "4"))
+
+
+class PredictionCache:
+    """Bounded LRU cache of prediction results with a per-entry TTL.
+
+    A ``max_size`` of 0 disables the cache.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._invalidations = 0
+
+    @staticmethod
+    def make_key(model_type: str, model_version: str, data: dict) -> tuple:
+        """Build the cache key from the model and the rounded feature vector.
+
+        The baseline prediction does not depend on the input, so its key has
+        no features; for the other models ``data`` must hold every feature as
+        a number (see predict.validate_features).
+        """
+        if model_type == "baseline":
+            return (model_type, model_version)
+        features = tuple(
+            round(float(data[column]), PREDICTION_CACHE_DECIMALS)
+            for column in FEATURE_COLUMNS
+        )
+        return (model_type, model_version, features)
+
+    def get(self, key: tuple):
+        """Return the cached prediction for ``key`` or None."""
+        if self.max_size <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self._expirations += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def put(self, key: tuple, value: float):
+        """Store a prediction, evicting the least recently used entries if full."""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def clear(self):
+        """Drop every cached prediction (e.g. after new models are saved)."""
+        with self._lock:
+            self._entries.clear()
+            self._invalidations += 1
+
+    def stats(self) -> dict:
+        """Return size, hit rate and eviction counters."""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "invalidations": self._invalidations,
+            }
+
+
+prediction_cache = PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL_SECONDS)
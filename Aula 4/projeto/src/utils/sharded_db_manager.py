@@ -0,0 +1,424 @@
+import datetime
+import fcntl
+import glob
+import itertools
+import json
+import logging
+import os
+import socket
+import time
+
+import duckdb
+import pandas as pd
+
+from .db_manager import DBManager, TABLE_COLUMNS, rollup_rows_sql
+from ..monitoring.timing import STAGE_COLUMNS
+from ..monitoring.monitor import (
+    calculate_rmse_from_aggregates,
+    calculate_mae_from_aggregates,
+)
+
+# Shard mode lets several worker processes (uvicorn --workers N) share the
+# metrics store: each worker only appends Parquet segments to SHARD_DIR and
+# never opens the main "db" file, which DuckDB allows a single writer for.
+SHARD_MODE = os.getenv("SHARD_MODE", "false").lower() == "true"
+SHARD_DIR = os.getenv("SHARD_DIR", "shards")
+# Retention runs on the main database, which shard workers never open
+SHARD_RETENTION_ERROR = (
+    "RETENTION_INTERVAL_HOURS is not supported with SHARD_MODE=true: "
+    "unset it and run 'python -m src.utils.compact_shards --into-db' "
+    "followed by 'python -m src.monitoring.retention' instead"
+)
+SHARD_TABLES = ("operational_metrics", "ml_metrics", "predictions", "actuals")
+# Columns identifying a row; the same row may briefly exist in two segments
+# while the compactor replaces small segments by a merged one
+SHARD_KEYS = {
+    "operational_metrics": "id",
+    "ml_metrics": "id",
+    "predictions": "id",
+    "actuals": "id, updated_at",
+}
+MAIN_DATABASE = "db"
+# Segments already merged by the compactor. They stay on disk until the next
+# compaction, because readers may still hold a file list that includes them.
+RETIRED_FILE = "_retired.json"
+
+
+def retired_segments(table: str) -> list:
+    """Return the names of the merged segments of ``table`` awaiting deletion."""
+    path = os.path.join(SHARD_DIR, table, RETIRED_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def write_retired_segments(table: str, names: list):
+    path = os.path.join(SHARD_DIR, table, RETIRED_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump(names, f)
+    os.replace(path + ".tmp", path)
+
+
+def segment_files(table: str) -> list:
+    """Return the Parquet segments currently published for ``table``."""
+    retired = set(retired_segments(table))
+    return sorted(
+        path
+        for path in glob.glob(os.path.join(SHARD_DIR, table, "*.parquet"))
+        if os.path.basename(path) not in retired
+    )
+
+
+def scan_sql(table: str, files: list = None) -> str:
+    """Return a subquery reading every segment of ``table``, or None if empty."""
+    files = segment_files(table) if files is None else files
+    if not files:
+        return None
+    file_list = ", ".join("'" + path.replace("'", "''") + "'" for path in files)
+    return (
+        f"(SELECT DISTINCT ON ({SHARD_KEYS[table]}) * "
+        f"FROM read_parquet([{file_list}], union_by_name=true))"
+    )
+
+
+def labeled_predictions_sql() -> str:
+    """Return a subquery of the predictions with their latest actual value."""
+    predictions = scan_sql("predictions")
+    if predictions is None:
+        return None
+    actuals = scan_sql("actuals")
+    if actuals is None:
+        return (
+            "(SELECT id, timestamp, model_type, input_data, predicted_value, "
+            f"CAST(NULL AS FLOAT) AS actual_value FROM {predictions})"
+        )
+    return f"""(
+        SELECT p.id, p.timestamp, p.model_type, p.input_data, p.predicted_value,
+               CAST(a.actual_value AS FLOAT) AS actual_value
+        FROM {predictions} p
+        LEFT JOIN (
+            SELECT id, arg_max(actual_value, updated_at) AS actual_value
+            FROM {actuals}
+            GROUP BY id
+        ) a ON p.id = a.id
+    )"""
+
+
+class ShardedDBManager(DBManager):
+    """DBManager that writes one Parquet segment per bulk insert.
+
+    Every worker keeps an in-memory DuckDB connection to query the segments
+    of all workers, so the ``/metrics`` endpoints see the whole deployment.
+    IDs come from counter files guarded by ``flock`` and are reserved in
+    blocks, which keeps them unique across workers. Actual values are
+    appended as their own segments and the latest one wins.
+    """
+
+    def __init__(self):
+        self.worker = f"{socket.gethostname()}-{os.getpid()}"
+        self._segment_seq = itertools.count()
+        super().__init__()
+
+    def connect(self):
+        """
+        Abre a conexão em memória usada para consultar os segmentos.
+        """
+        with self._cursors_lock:
+            if self.con is None:
+                self.con = duckdb.connect(database=":memory:")
+
+    def setup_tables(self):
+        """
+        Cria os diretórios dos segmentos de cada tabela e dos contadores de ID.
+        """
+        for table in SHARD_TABLES + ("ids",):
+            os.makedirs(os.path.join(SHARD_DIR, table), exist_ok=True)
+        logging.info(f"Shard directories set up in {SHARD_DIR}")
+
+    def _write_segment(self, table, df):
+        name = f"{self.worker}-{time.time_ns()}-{next(self._segment_seq)}.parquet"
+        path = os.path.join(SHARD_DIR, table, name)
+        tmp_path = os.path.join(SHARD_DIR, table, f".{name}.tmp")
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    def _allocate_ids(self, table, count):
+        counter_path = os.path.join(SHARD_DIR, "ids", table)
+        with open(f"{counter_path}.lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if os.path.exists(counter_path):
+                with open(counter_path, "r") as f:
+                    last_id = int(f.read())
+            else:
+                last_id = self._max_existing_id(table)
+            tmp_path = f"{counter_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(str(last_id + count))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, counter_path)
+        return list(range(last_id + 1, last_id + count + 1))
+
+    def _max_existing_id(self, table):
+        # Continua depois dos IDs do banco principal e dos segmentos existentes
+        max_id = 0
+        if os.path.exists(MAIN_DATABASE):
+            con = duckdb.connect(database=MAIN_DATABASE, read_only=True)
+            try:
+                max_id = con.execute(f"SELECT MAX(id) FROM {table}").fetchone()[0] or 0
+            except duckdb.CatalogException:
+                pass
+            finally:
+                con.close()
+        segments = scan_sql(table)
+        if segments is not None:
+            segment_max_id = (
+                self.cursor().execute(f"SELECT MAX(id) FROM {segments}").fetchone()[0]
+            )
+            max_id = max(max_id, segment_max_id or 0)
+        return max_id
+
+    def insert_operational_metrics(self, metrics):
+        """
+        Grava um lote de métricas operacionais como um novo segmento.
+
+        Args:
+        - metrics (pd.DataFrame): As métricas, com as colunas timestamp, method,
+          url, response_status, latency e (opcionalmente) route e as colunas
+          de duração por etapa (validation_ms, model_load_ms, ...).
+        """
+        metrics = metrics.reindex(columns=TABLE_COLUMNS["operational_metrics"][1:])
+        metrics[STAGE_COLUMNS] = metrics[STAGE_COLUMNS].astype("float64")
+        metrics = metrics.assign(
+            id=self._allocate_ids("operational_metrics", len(metrics))
+        )
+        self._write_segment("operational_metrics", metrics)
+        logging.info(
+            f"Batch of {len(metrics)} operational metrics written to a segment"
+        )
+
+    def insert_ml_metric(self, timestamp, rmse, mae):
+        """
+        Grava uma métrica de aprendizado de máquina como um segmento.
+        """
+        self._write_segment(
+            "ml_metrics",
+            pd.DataFrame(
+                {
+                    "id": self._allocate_ids("ml_metrics", 1),
+                    "timestamp": [timestamp],
+                    "rmse": [rmse],
+                    "mae": [mae],
+                }
+            ),
+        )
+        logging.info("ML metric written to a segment")
+
+    def insert_prediction(
+        self, timestamp, model_type, input_data, predicted_value, actual_value=None
+    ):
+        """
+        Grava uma previsão como um segmento de uma linha.
+        """
+        prediction_id = self.allocate_prediction_ids(1)[0]
+        self.insert_prediction_records(
+            pd.DataFrame(
+                {
+                    "id": [prediction_id],
+                    "timestamp": [timestamp],
+                    "model_type": [model_type],
+                    "input_data": [input_data],
+                    "predicted_value": [predicted_value],
+                }
+            )
+        )
+        if actual_value is not None:
+            self.update_actual_value_by_id(prediction_id, actual_value)
+
+    def insert_prediction_records(self, predictions):
+        """
+        Grava previsões com IDs já alocados como um novo segmento.
+
+        Args:
+        - predictions (pd.DataFrame): As previsões, com as colunas id, timestamp,
+          model_type, input_data e predicted_value.
+        """
+        predictions = predictions.astype({"predicted_value": "float32"})
+        self._write_segment("predictions", predictions)
+        logging.info(f"Batch of {len(predictions)} predictions written to a segment")
+
+    def allocate_prediction_ids(self, count):
+        """
+        Reserva IDs de previsão únicos entre todos os workers.
+
+        Args:
+        - count (int): Quantidade de IDs a reservar.
+
+        Returns:
+        - List[int]: Os IDs reservados.
+        """
+        return self._allocate_ids("predictions", count)
+
+    def update_actual_value_by_id(self, prediction_id, actual_value):
+        """
+        Registra o valor real de uma previsão específica.
+
+        Args:
+        - prediction_id (int): O ID da previsão a ser atualizada.
+        - actual_value (float): O valor real a ser atualizado.
+        """
+        result = self.update_actual_values(
+            pd.DataFrame({"id": [prediction_id], "actual_value": [actual_value]})
+        )
+        if not result["updated"]:
+            raise ValueError(f"Prediction with ID {prediction_id} not found")
+
+    def update_actual_values(self, updates):
+        """
+        Registra os valores reais de várias previsões como um novo segmento.
+
+        Apenas IDs de previsões existentes são gravados; para IDs repetidos vale
+        o último valor do lote.
+
+        Args:
+        - updates (pd.DataFrame): Os pares, com as colunas id e actual_value.
+
+        Returns:
+        - Dict: Quantos IDs foram recebidos, atualizados, não encontrados
+          (missing) e repetidos no lote (duplicated).
+        """
+        received = len(updates)
+        duplicated = int(updates["id"][updates["id"].duplicated()].nunique())
+        updates = updates.drop_duplicates("id", keep="last")
+        predictions = scan_sql("predictions")
+        matched = updates.iloc[0:0]
+        if predictions is not None:
+            cursor = self.cursor()
+            cursor.register("actual_values_batch", updates)
+            try:
+                matched = cursor.execute(
+                    f"SELECT id, actual_value FROM actual_values_batch "
+                    f"WHERE id IN (SELECT id FROM {predictions})"
+                ).df()
+            finally:
+                cursor.unregister("actual_values_batch")
+        if len(matched):
+            self._write_segment(
+                "actuals",
+                matched.astype({"actual_value": "float32"}).assign(
+                    updated_at=datetime.datetime.now()
+                ),
+            )
+            logging.info(f"Batch of {len(matched)} actual values written to a segment")
+            self.calculate_and_store_metrics()
+        return {
+            "received": received,
+            "updated": len(matched),
+            "missing": len(updates) - len(matched),
+            "duplicated": duplicated,
+        }
+
+    def recompute_metric_aggregates(self, store_metrics=True):
+        """
+        No modo shard os agregados são sempre calculados a partir dos segmentos.
+
+        Args:
+        - store_metrics (bool): Se True, grava uma nova linha em ml_metrics.
+        """
+        if store_metrics:
+            self.calculate_and_store_metrics()
+
+    def _fetch_aggregates(self):
+        labeled = labeled_predictions_sql()
+        if labeled is None:
+            return []
+        return (
+            self.cursor()
+            .execute(
+                f"""
+                SELECT
+                    model_type,
+                    COUNT(*),
+                    SUM(ABS(CAST(actual_value AS DOUBLE) - predicted_value)),
+                    SUM(POW(CAST(actual_value AS DOUBLE) - predicted_value, 2))
+                FROM {labeled}
+                WHERE actual_value IS NOT NULL
+                GROUP BY model_type
+                ORDER BY model_type
+                """
+            )
+            .fetchall()
+        )
+
+    def fetch_metric_aggregates(self):
+        """
+        Calcula count, RMSE e MAE por tipo de modelo a partir dos segmentos.
+
+        Returns:
+        - List[Dict]: Uma lista de dicionários com count, rmse e mae por model_type.
+        """
+        return [
+            {
+                "model_type": model_type,
+                "count": count,
+                "rmse": calculate_rmse_from_aggregates(count, sum_squared_error),
+                "mae": calculate_mae_from_aggregates(count, sum_abs_error),
+            }
+            for model_type, count, sum_abs_error, sum_squared_error in self._fetch_aggregates()
+        ]
+
+    def calculate_and_store_metrics(self):
+        """
+        Calcula as métricas de todos os workers e grava como um segmento.
+        """
+        aggregates = self._fetch_aggregates()
+        count = sum(aggregate[1] for aggregate in aggregates)
+        if not count:
+            logging.info("No labeled predictions to calculate metrics from")
+            return
+        rmse = calculate_rmse_from_aggregates(
+            count, sum(aggregate[3] for aggregate in aggregates)
+        )
+        mae = calculate_mae_from_aggregates(
+            count, sum(aggregate[2] for aggregate in aggregates)
+        )
+        self.insert_ml_metric(datetime.datetime.now(), rmse, mae)
+        logging.info("Metrics calculated and stored successfully")
+
+    def _source(self, table):
+        """
+        Retorna a subconsulta que lê os segmentos de todos os workers.
+        """
+        if table == "predictions":
+            source = labeled_predictions_sql()
+        else:
+            source = scan_sql(table)
+        if source is None:
+            # Nenhum segmento ainda: mesmas colunas, nenhuma linha
+            columns = ", ".join(f"NULL AS {column}" for column in TABLE_COLUMNS[table])
+            return f"(SELECT {columns} LIMIT 0)"
+        return source
+
+    def _rollup_source(self):
+        """
+        Calcula os rollups na hora a partir dos segmentos de todos os workers.
+        """
+        return f"({rollup_rows_sql(self._source('operational_metrics'))})"
+
+    def archive_rows(self, table, cutoff, labeled_only=False):
+        """
+        A retenção roda sobre o banco principal, após compact_shards --into-db.
+        """
+        raise RuntimeError(SHARD_RETENTION_ERROR)
+
+    def delete_rollups_before(self, granularity, cutoff):
+        """
+        No modo shard os rollups são calculados na hora e não ficam gravados.
+        """
+        raise RuntimeError(SHARD_RETENTION_ERROR)
+
+    def checkpoint(self):
+        """
+        Não há banco em arquivo para consolidar no modo shard.
+        """
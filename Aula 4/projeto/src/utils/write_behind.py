@@ -0,0 +1,209 @@
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+
+from src.monitoring.prometheus import REGISTRY
+
+WRITE_BEHIND_MAX_ROWS = int(os.getenv("WRITE_BEHIND_MAX_ROWS", "10000"))
+WRITE_BEHIND_FLUSH_ROWS = int(os.getenv("WRITE_BEHIND_FLUSH_ROWS", "500"))
+WRITE_BEHIND_FLUSH_INTERVAL_MS = float(
+    os.getenv("WRITE_BEHIND_FLUSH_INTERVAL_MS", "1000")
+)
+WRITE_BEHIND_MAX_RETRIES = int(os.getenv("WRITE_BEHIND_MAX_RETRIES", "5"))
+WRITE_BEHIND_SPILL_DIR = os.getenv("WRITE_BEHIND_SPILL_DIR", "logs/write_behind")
+
+_buffers = {}
+
+FLUSH_DURATION = REGISTRY.histogram(
+    "db_flush_duration_seconds",
+    "Time spent writing one write-behind batch to the database.",
+    ("buffer",),
+)
+FLUSHED_ROWS = REGISTRY.counter(
+    "db_flushed_rows_total", "Rows written by write-behind buffers.", ("buffer",)
+)
+
+
+class WriteBehindBuffer:
+    """Bounded in-memory buffer of rows written to the database in bulk.
+
+    ``append`` never touches the database: it only takes a short lock to add
+    the row, and drops (and counts) it when the buffer is full. With
+    ``flush_when_full`` the caller flushes synchronously instead, trading
+    latency for not losing the row under backpressure. A background
+    thread hands everything buffered to ``flush_fn`` as one DataFrame every
+    ``flush_interval_ms`` or as soon as ``flush_rows`` rows are waiting.
+
+    A batch that ``flush_fn`` rejects goes back to the front of the buffer
+    and is retried with exponential backoff. After ``max_retries``
+    consecutive failures, or when the failure happens on ``stop``, it is
+    written to a Parquet file in ``WRITE_BEHIND_SPILL_DIR`` instead, so rows
+    whose ids were already handed out are never silently lost.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        columns: list,
+        flush_fn,
+        max_rows: int = WRITE_BEHIND_MAX_ROWS,
+        flush_rows: int = WRITE_BEHIND_FLUSH_ROWS,
+        flush_interval_ms: float = WRITE_BEHIND_FLUSH_INTERVAL_MS,
+        flush_when_full: bool = False,
+        max_retries: int = WRITE_BEHIND_MAX_RETRIES,
+    ):
+        self.name = name
+        self.columns = columns
+        self.flush_fn = flush_fn
+        self.max_rows = max_rows
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval_ms / 1000
+        self.flush_when_full = flush_when_full
+        self.max_retries = max_retries
+        self._rows = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._dropped_rows = 0
+        self._overflow_flushes = 0
+        self._flushed_rows = 0
+        self._failed_rows = 0
+        self._spilled_rows = 0
+        self._consecutive_failures = 0
+        self._flushes = 0
+        self._last_flush_ms = 0.0
+        _buffers[name] = self
+
+    def append(self, row: tuple) -> bool:
+        """Buffer one row; returns False if it was dropped because the buffer is full."""
+        with self._lock:
+            full = len(self._rows) >= self.max_rows
+            if full and not self.flush_when_full:
+                self._dropped_rows += 1
+                return False
+            if full:
+                self._overflow_flushes += 1
+        if full:
+            self.flush()
+        with self._lock:
+            self._rows.append(row)
+            pending = len(self._rows)
+        if pending >= self.flush_rows:
+            self._wakeup.set()
+        return True
+
+    def flush(self) -> int:
+        """Write every buffered row now and return how many were written."""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+            if not rows:
+                return 0
+            df = pd.DataFrame.from_records(rows, columns=self.columns)
+            started = time.perf_counter()
+            try:
+                self.flush_fn(df)
+            except Exception as e:
+                self._failed_rows += len(rows)
+                self._consecutive_failures += 1
+                if (
+                    self._consecutive_failures >= self.max_retries
+                    or self._stopping.is_set()
+                ):
+                    self._spill(df, e)
+                    self._consecutive_failures = 0
+                else:
+                    # Back to the front of the buffer, keeping the row order
+                    with self._lock:
+                        self._rows[:0] = rows
+                    logging.error(
+                        f"Error flushing {len(rows)} rows from {self.name} "
+                        f"(attempt {self._consecutive_failures} of "
+                        f"{self.max_retries}), retrying: {e}"
+                    )
+                return 0
+            self._consecutive_failures = 0
+            elapsed = time.perf_counter() - started
+            FLUSH_DURATION.observe(elapsed, self.name)
+            FLUSHED_ROWS.inc(len(rows), self.name)
+            self._last_flush_ms = elapsed * 1000
+            self._flushed_rows += len(rows)
+            self._flushes += 1
+            return len(rows)
+
+    def _spill(self, df: pd.DataFrame, error: Exception):
+        path = os.path.join(
+            WRITE_BEHIND_SPILL_DIR, f"{self.name}-{time.time_ns()}.parquet"
+        )
+        try:
+            os.makedirs(WRITE_BEHIND_SPILL_DIR, exist_ok=True)
+            df.to_parquet(path, index=False)
+        except Exception as e:
+            logging.error(
+                f"Error flushing {len(df)} rows from {self.name}: {error}; "
+                f"could not spill them to {path}: {e}"
+            )
+            return
+        self._spilled_rows += len(df)
+        logging.error(
+            f"Error flushing {len(df)} rows from {self.name}: {error}; "
+            f"spilled them to {path}"
+        )
+
+    def start(self):
+        """Start the background flusher thread."""
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name=f"write-behind-{self.name}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flusher thread and write whatever is still buffered."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._wakeup.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def stats(self) -> dict:
+        """Return buffer occupancy and flush/drop counters."""
+        with self._lock:
+            pending = len(self._rows)
+        return {
+            "pending_rows": pending,
+            "max_rows": self.max_rows,
+            "flushed_rows": self._flushed_rows,
+            "dropped_rows": self._dropped_rows,
+            "overflow_flushes": self._overflow_flushes,
+            "failed_rows": self._failed_rows,
+            "spilled_rows": self._spilled_rows,
+            "flushes": self._flushes,
+            "last_flush_ms": self._last_flush_ms,
+        }
+
+    def _run(self):
+        while not self._stopping.is_set():
+            if self._consecutive_failures:
+                # Back off: appends keep setting _wakeup while the failed
+                # batch is still buffered
+                self._stopping.wait(
+                    self.flush_interval * 2**self._consecutive_failures
+                )
+            else:
+                self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+def get_buffer_stats() -> dict:
+    """Return the stats of every write-behind buffer, keyed by name."""
+    return {name: buffer.stats() for name, buffer in _buffers.items()}
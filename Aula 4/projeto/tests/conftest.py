@@ -0,0 +1,33 @@
+"""Shared fixtures. Run the suite from the project root: python -m pytest tests"""
+
+import numpy as np
+import pytest
+import xgboost as xgb
+
+from src.models.predict import FEATURE_COLUMNS
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run the test inside an empty directory.
+
+    The database ("db"), the archive, the shard segments and the model
+    registry all live at paths relative to the working directory.
+    """
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture(scope="session")
+def training_data():
+    rng = np.random.default_rng(0)
+    features = rng.uniform(0, [5e7, 5e6, 2e6], size=(500, len(FEATURE_COLUMNS)))
+    target = features @ np.array([1e-3, 2e-3, 5e-3]) + rng.normal(0, 100, 500)
+    return features.astype(np.float32), target
+
+
+@pytest.fixture(scope="session")
+def xgb_model(training_data):
+    model = xgb.XGBRegressor(n_estimators=20, max_depth=4, random_state=0)
+    model.fit(*training_data)
+    return model
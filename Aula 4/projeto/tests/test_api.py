@@ -0,0 +1,274 @@
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from fastapi.testclient import TestClient
+
+# Importado na raiz do projeto: lê src/data/config.ini relativo ao diretório atual
+from src.data import process_data  # noqa: F401
+from src.utils import model_utils
+
+DATA = {"ASK": 2397890.0, "ATK": 277088.0, "COMBUSTIVEL_LITROS": 5.0}
+BATCH = {
+    "ASK": [2397890.0, 1432100.0, 52000.0],
+    "ATK": [277088.0, 160025.0, 9000.0],
+    "COMBUSTIVEL_LITROS": [85952.0, 51200.0, 700.0],
+}
+
+
+@pytest.fixture(scope="module")
+def api(tmp_path_factory, xgb_model):
+    # O banco, os logs e os modelos ficam num diretório temporário
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("api"))
+    try:
+        model_utils.publish_models(xgb_model, 1.0)
+        from src.api import api
+
+        yield api
+    finally:
+        os.chdir(cwd)
+
+
+@pytest.fixture(scope="module")
+def client(api):
+    with TestClient(api.app) as client:
+        yield client
+
+
+def test_batch_prediction(client, api, xgb_model):
+    response = client.post("/predict/batch", json={**BATCH, "model_type": "xgboost"})
+    assert response.status_code == 200
+    body = response.json()
+    features = np.column_stack([BATCH[column] for column in DATA])
+    np.testing.assert_allclose(
+        body["predictions"], xgb_model.predict(features), rtol=1e-5
+    )
+    assert len(set(body["prediction_ids"])) == 3
+    stored = {
+        row["id"]: row["predicted_value"]
+        for row in api.db.fetch_predictions()
+        if row["id"] in body["prediction_ids"]
+    }
+    assert [stored[i] for i in body["prediction_ids"]] == pytest.approx(
+        body["predictions"], rel=1e-6
+    )
+
+    response = client.post("/predict/batch", json={**BATCH, "model_type": "baseline"})
+    assert response.json()["predictions"] == [1.0] * 3
+
+
+def test_batch_columns_must_have_the_same_length(client):
+    response = client.post("/predict/batch", json={**BATCH, "ATK": [1.0]})
+    assert response.status_code == 400
+    assert "same length" in response.json()["detail"]
+
+
+def test_batch_size_limit(client, monkeypatch):
+    from src.api import routes
+
+    monkeypatch.setattr(routes, "MAX_BATCH_SIZE", 2)
+    response = client.post("/predict/batch", json=BATCH)
+    assert response.status_code == 400
+    assert "must not exceed 2 rows" in response.json()["detail"]
+
+
+def test_batch_unknown_model(client):
+    response = client.post("/predict/batch", json={**BATCH, "model_type": "linear"})
+    assert response.status_code == 400
+
+
+def test_baseline_does_not_need_features(client):
+    response = client.post("/predict", json={"model_type": "baseline", "data": {}})
+    assert response.status_code == 200
+    assert response.json()["prediction"] == 1.0
+
+
+@pytest.mark.parametrize("data", [{}, {**DATA, "ASK": "abc"}, {"ASK": 1.0, "ATK": 2.0}])
+def test_invalid_xgboost_input_is_a_client_error(client, data):
+    response = client.post("/predict", json={"model_type": "xgboost", "data": data})
+    assert response.status_code == 400
+
+
+def test_xgboost_prediction_is_cached(client, xgb_model):
+    first = client.post("/predict", json={"model_type": "xgboost", "data": DATA})
+    second = client.post("/predict", json={"model_type": "xgboost", "data": DATA})
+    assert first.status_code == second.status_code == 200
+    assert first.json()["prediction"] == second.json()["prediction"]
+    assert first.json()["prediction_id"] != second.json()["prediction_id"]
+    expected = xgb_model.predict([list(DATA.values())])[0]
+    assert first.json()["prediction"] == pytest.approx(expected, rel=1e-5)
+
+
+def test_concurrent_feedback(client):
+    ids = [
+        client.post("/predict", json={"model_type": "xgboost", "data": DATA}).json()[
+            "prediction_id"
+        ]
+        for _ in range(64)
+    ]
+
+    def send(prediction_id):
+        return client.put(
+            f"/prediction/{prediction_id}", json={"actual_value": 100.0}
+        ).status_code
+
+    with ThreadPoolExecutor(8) as pool:
+        assert set(pool.map(send, ids)) == {200}
+    assert (
+        client.put("/prediction/999999999", json={"actual_value": 1.0}).status_code
+        == 400
+    )
+
+
+def test_actual_values_in_bulk(client):
+    ids = client.post("/predict/batch", json=BATCH).json()["prediction_ids"]
+    csv = "id,actual_value\n" + "".join(f"{i},100.0\n" for i in ids[:2])
+    response = client.post(
+        "/predictions/actuals", content=csv, headers={"Content-Type": "text/csv"}
+    )
+    assert response.status_code == 200
+    assert response.json()["updated"] == 2
+
+    # Um ID fracionário não pode ser truncado para o de outra previsão
+    response = client.post("/predictions/actuals", json=[[ids[2] + 0.5, 1.0]])
+    assert response.status_code == 400
+    assert "id must be an integer" in response.json()["detail"]
+
+
+def test_shard_mode_refuses_scheduled_retention(api, monkeypatch):
+    monkeypatch.setattr(api, "SHARD_MODE", True)
+    monkeypatch.setattr(api.retention_task, "interval", 3600)
+    with pytest.raises(RuntimeError, match="RETENTION_INTERVAL_HOURS"):
+        with TestClient(api.app):
+            pass
+
+
+def test_model_metrics_pages(client, api):
+    client.post("/predict/batch", json=BATCH)
+    api.routes.prediction_buffer.flush()
+    ids, after_id = [], None
+    while True:
+        params = (
+            {"limit": 2} if after_id is None else {"limit": 2, "after_id": after_id}
+        )
+        body = client.get("/metrics/model", params=params).json()
+        assert len(body["predictions"]) <= 2
+        ids += [row["id"] for row in body["predictions"]]
+        after_id = body["next_after_id"]
+        if after_id is None:
+            break
+    assert ids == [row["id"] for row in api.db.fetch_predictions()]
+
+    response = client.get("/metrics/operational", params={"limit": 10**6})
+    assert response.status_code == 422
+
+
+def test_export_arrow_and_parquet(client, api):
+    client.post("/predict/batch", json=BATCH)
+    api.routes.prediction_buffer.flush()
+    expected = [row["id"] for row in api.db.fetch_predictions()]
+
+    response = client.get(
+        "/metrics/export/predictions",
+        params={"columns": "id,predicted_value"},
+        headers={"Accept": "application/vnd.apache.arrow.stream"},
+    )
+    assert response.headers["content-type"] == "application/vnd.apache.arrow.stream"
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.column_names == ["id", "predicted_value"]
+    assert table.column("id").to_pylist() == expected
+
+    response = client.get("/metrics/export/predictions", params={"format": "parquet"})
+    assert pq.read_table(io.BytesIO(response.content)).column("id").to_pylist() == (
+        expected
+    )
+
+    # Sem linhas: o arquivo ainda traz o schema
+    response = client.get(
+        "/metrics/export/predictions",
+        params={"format": "parquet", "after_id": expected[-1]},
+    )
+    table = pq.read_table(io.BytesIO(response.content))
+    assert table.num_rows == 0
+    assert "predicted_value" in table.column_names
+
+
+def test_export_errors(client):
+    assert client.get("/metrics/export/users").status_code == 404
+    response = client.get("/metrics/export/predictions", params={"format": "xml"})
+    assert response.status_code == 400
+    response = client.get("/metrics/export/predictions", params={"columns": "id,nope"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Unknown columns: nope"
+
+
+def test_prometheus_metrics(client):
+    client.post("/predict", json={"model_type": "baseline", "data": {}})
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = response.text.splitlines()
+    assert "# TYPE http_request_duration_seconds histogram" in lines
+    assert any(
+        line.startswith(
+            'http_request_duration_seconds_count{method="POST",route="/predict",'
+            'status="200"}'
+        )
+        for line in lines
+    )
+
+
+def test_server_timing_is_not_sent_for_streaming_responses(client):
+    response = client.post("/predict", json={"model_type": "baseline", "data": {}})
+    assert "total;dur=" in response.headers["Server-Timing"]
+    response = client.get("/metrics/export/predictions")
+    assert response.status_code == 200
+    assert "Server-Timing" not in response.headers
+
+
+def test_request_stages_are_stored_in_milliseconds(client, api):
+    # Uma entrada nova, que não está no cache de previsões
+    data = {**DATA, "ASK": 1234567.0}
+    response = client.post("/predict", json={"model_type": "xgboost", "data": data})
+    assert "inference;dur=" in response.headers["Server-Timing"]
+    api.operational_metrics_buffer.flush()
+    row = [
+        row for row in api.db.fetch_operational_metrics() if row["route"] == "/predict"
+    ][-1]
+    # O teste leva bem mais que 1 µs e bem menos que 10 s
+    assert 0.001 < row["latency"] < 10_000
+    assert 0 < row["inference_ms"] <= row["latency"]
+
+
+def test_profiling_requires_the_token(client, api, monkeypatch, tmp_path):
+    monkeypatch.setattr(api.profiler, "token", "secret")
+    monkeypatch.setattr(api.profiler, "profile_dir", str(tmp_path))
+    admin = {"X-Profile-Token": "secret"}
+
+    for headers in ({}, {"X-Profile-Token": "wrong"}):
+        assert client.get("/admin/profiles", headers=headers).status_code == 403
+        assert client.get("/admin/profiles/r1", headers=headers).status_code == 403
+
+    client.post(
+        "/predict",
+        json={"model_type": "baseline", "data": {}},
+        headers={"X-Profile": "secret", "X-Request-ID": "r1"},
+    )
+    profiles = client.get("/admin/profiles", headers=admin).json()["profiles"]
+    assert [p["request_id"] for p in profiles] == ["r1"]
+    response = client.get("/admin/profiles/r1", headers=admin)
+    assert response.status_code == 200
+    assert response.content == (tmp_path / "r1.prof").read_bytes()
+
+    # Só nomes [A-Za-z0-9_-]: nada fora de PROFILE_DIR pode ser baixado
+    for request_id in ("..db", "r1.prof", "%2e%2e%2fdb", "..%2F..%2Fdb"):
+        response = client.get(f"/admin/profiles/{request_id}", headers=admin)
+        assert response.status_code in (400, 404)
+        assert response.content != (tmp_path / "r1.prof").read_bytes()
+    assert client.get("/admin/profiles/..db", headers=admin).status_code == 400
+    assert client.get("/admin/profiles/r2", headers=admin).status_code == 404
@@ -0,0 +1,61 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.models.batcher import MicroBatcher
+
+DATA = {"ASK": 1.0, "ATK": 2.0, "COMBUSTIVEL_LITROS": 3.0}
+
+
+def test_concurrent_requests_share_batches():
+    batcher = MicroBatcher(lambda features: features.sum(axis=1), 20, 8)
+    rows = [{**DATA, "ASK": float(i)} for i in range(16)]
+    with ThreadPoolExecutor(16) as pool:
+        results = list(pool.map(batcher.predict, rows))
+    batcher.close()
+    assert results == [i + 5.0 for i in range(16)]
+    assert batcher.stats()["batch_size"]["count"] < 16
+
+
+def test_failed_batch_fails_every_caller_and_worker_survives():
+    calls = []
+
+    def predict_fn(features):
+        calls.append(len(features))
+        if len(calls) == 1:
+            raise RuntimeError("model failed")
+        return features.sum(axis=1)
+
+    batcher = MicroBatcher(predict_fn, 1, 8)
+    with pytest.raises(RuntimeError, match="model failed"):
+        batcher.predict(DATA)
+    assert batcher.predict(DATA) == 6.0
+    batcher.close()
+
+
+def test_wrong_number_of_predictions():
+    batcher = MicroBatcher(lambda features: features[:0, 0], 1, 8)
+    with pytest.raises(ValueError, match="0 predictions for a batch of 1 rows"):
+        batcher.predict(DATA)
+    batcher.close()
+
+
+def test_invalid_row_fails_only_its_caller():
+    batcher = MicroBatcher(lambda features: features.sum(axis=1), 1, 8)
+    with pytest.raises(ValueError):
+        batcher.predict({**DATA, "ASK": "abc"})
+    assert batcher.predict(DATA) == 6.0
+    batcher.close()
+
+
+def test_result_timeout():
+    batcher = MicroBatcher(
+        lambda features: time.sleep(0.5) or features.sum(axis=1),
+        1,
+        8,
+        result_timeout_s=0.05,
+    )
+    with pytest.raises(TimeoutError):
+        batcher.predict(DATA)
+    batcher.close()
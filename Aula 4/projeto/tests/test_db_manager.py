@@ -0,0 +1,289 @@
+import datetime
+import math
+import threading
+
+import duckdb
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.monitoring.retention import apply_retention
+from src.utils import db_manager
+from src.utils.db_manager import DBManager
+
+
+@pytest.fixture
+def db(workdir):
+    db = DBManager()
+    db.setup_tables()
+    yield db
+    db.close()
+
+
+def insert(db, predicted_values, model_type="xgboost", timestamp=None):
+    db.insert_predictions(
+        timestamp or datetime.datetime.now(),
+        model_type,
+        ["{}"] * len(predicted_values),
+        predicted_values,
+    )
+    return [
+        row["id"] for row in db.fetch_predictions() if row["model_type"] == model_type
+    ][-len(predicted_values) :]
+
+
+def aggregates(db):
+    return {row["model_type"]: row for row in db.fetch_metric_aggregates()}
+
+
+def assert_same_aggregates(actual, expected):
+    assert actual.keys() == expected.keys()
+    for model_type, row in expected.items():
+        assert actual[model_type]["count"] == row["count"]
+        assert actual[model_type]["rmse"] == pytest.approx(row["rmse"])
+        assert actual[model_type]["mae"] == pytest.approx(row["mae"])
+
+
+def test_incremental_aggregates(db):
+    ids = insert(db, [10.0, 20.0, 30.0])
+    baseline_ids = insert(db, [5.0], model_type="baseline")
+    db.update_actual_value_by_id(ids[0], 12.0)
+    db.update_actual_value_by_id(ids[1], 25.0)
+    # Sobrescrever um valor real troca o erro antigo pelo novo
+    db.update_actual_value_by_id(ids[1], 16.0)
+    db.update_actual_value_by_id(baseline_ids[0], 7.0)
+
+    errors = np.array([2.0, -4.0])
+    xgboost = aggregates(db)["xgboost"]
+    assert xgboost["count"] == 2
+    assert xgboost["rmse"] == pytest.approx(math.sqrt(np.mean(errors**2)))
+    assert xgboost["mae"] == pytest.approx(np.mean(np.abs(errors)))
+    assert aggregates(db)["baseline"]["count"] == 1
+
+    incremental = aggregates(db)
+    db.recompute_metric_aggregates()
+    assert_same_aggregates(aggregates(db), incremental)
+
+
+def test_batch_update(db):
+    ids = insert(db, [10.0, 20.0, 30.0])
+    db.update_actual_value_by_id(ids[0], 11.0)
+    result = db.update_actual_values(
+        pd.DataFrame(
+            {
+                "id": [ids[0], ids[1], ids[1], 10**9],
+                "actual_value": [13.0, 1.0, 22.0, 0.0],
+            }
+        )
+    )
+    assert result == {"received": 4, "updated": 2, "missing": 1, "duplicated": 1}
+
+    actual_values = {row["id"]: row["actual_value"] for row in db.fetch_predictions()}
+    assert actual_values[ids[0]] == 13.0
+    assert actual_values[ids[1]] == 22.0  # o último valor do lote vale
+    xgboost = aggregates(db)["xgboost"]
+    assert xgboost["count"] == 2
+    assert xgboost["mae"] == pytest.approx(2.5)
+
+    incremental = aggregates(db)
+    db.recompute_metric_aggregates()
+    assert_same_aggregates(aggregates(db), incremental)
+
+
+def test_unknown_prediction(db):
+    with pytest.raises(ValueError, match="not found"):
+        db.update_actual_value_by_id(10**9, 1.0)
+    assert aggregates(db) == {}
+
+
+def test_concurrent_feedback(db):
+    ids = insert(db, [float(i) for i in range(320)])
+    errors = []
+
+    def send(chunk):
+        for prediction_id in chunk:
+            try:
+                db.update_actual_value_by_id(prediction_id, prediction_id + 1.5)
+            except Exception as e:
+                errors.append(e)
+
+    def send_batch():
+        try:
+            db.update_actual_values(
+                pd.DataFrame({"id": ids[:50], "actual_value": [0.0] * 50})
+            )
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=send, args=(ids[k::16],)) for k in range(16)]
+    threads.append(threading.Thread(target=send_batch))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    incremental = aggregates(db)
+    assert incremental["xgboost"]["count"] == len(ids)
+    db.recompute_metric_aggregates()
+    assert_same_aggregates(aggregates(db), incremental)
+
+
+def test_transaction_conflicts_are_retried(db, monkeypatch):
+    monkeypatch.setattr(db_manager, "TRANSACTION_RETRY_DELAY_S", 0)
+    attempts = []
+
+    def apply(cursor):
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise duckdb.TransactionException("Conflict on update!")
+        return "done"
+
+    assert db._aggregates_transaction(apply) == "done"
+    assert len(attempts) == 3
+
+    attempts.clear()
+    monkeypatch.setattr(db_manager, "TRANSACTION_RETRIES", 1)
+    with pytest.raises(duckdb.TransactionException):
+        db._aggregates_transaction(apply)
+    assert len(attempts) == 2
+
+
+def test_keyset_pagination(db):
+    start = datetime.datetime(2024, 1, 1)
+    for day in range(7):
+        insert(db, [float(day)], timestamp=start + datetime.timedelta(days=day))
+    ids = [row["id"] for row in db.fetch_predictions()]
+
+    pages, after_id = [], None
+    while True:
+        page = db.fetch_predictions(after_id=after_id, limit=3)
+        pages.append([row["id"] for row in page])
+        if len(page) < 3:
+            break
+        after_id = page[-1]["id"]
+    assert pages == [ids[:3], ids[3:6], ids[6:]]
+
+    # Início inclusivo, fim exclusivo
+    in_range = db.fetch_predictions(
+        start_time=start + datetime.timedelta(days=2),
+        end_time=start + datetime.timedelta(days=4),
+    )
+    assert [row["predicted_value"] for row in in_range] == [2.0, 3.0]
+
+
+def operational_metrics(latencies, route="/predict", status=200, timestamp=None):
+    return pd.DataFrame(
+        {
+            "timestamp": timestamp or datetime.datetime(2024, 1, 1, 12, 30),
+            "method": "POST",
+            "url": f"http://testserver{route}",
+            "response_status": status,
+            "latency": latencies,
+            "route": route,
+        }
+    )
+
+
+def test_rollup_percentiles(db):
+    latencies = np.arange(1.0, 101.0)
+    db.insert_operational_metrics(operational_metrics(latencies))
+    db.insert_operational_metrics(operational_metrics([250.0] * 4, status=500))
+    db.insert_operational_metrics(operational_metrics([3.0], route="/metrics"))
+
+    (rollup,) = db.fetch_operational_rollups("hour", route="/predict", by_status=False)
+    assert rollup["bucket_start"] == datetime.datetime(2024, 1, 1, 12)
+    assert rollup["count"] == 104
+    assert rollup["error_count"] == 4
+    assert rollup["min_latency"] == 1.0
+    assert rollup["max_latency"] == 250.0
+    assert rollup["mean_latency"] == pytest.approx((latencies.sum() + 1000) / 104)
+    # Cada percentil é o limite superior do balde: até 2**0.25 acima do exato
+    expected = np.percentile(np.concatenate([latencies, [250.0] * 4]), [50, 95, 99])
+    for name, value in zip(("p50", "p95", "p99"), expected):
+        assert value <= rollup[f"{name}_latency"] <= value * 2**0.25
+
+    by_status = db.fetch_operational_rollups("day", route="/predict")
+    assert [(r["response_status"], r["count"]) for r in by_status] == [
+        (200, 100),
+        (500, 4),
+    ]
+    assert by_status[1]["p50_latency"] == 250.0
+    assert len(db.fetch_operational_rollups("minute")) == 3
+    with pytest.raises(ValueError, match="not supported"):
+        db.fetch_operational_rollups("week")
+
+
+def test_rollup_backfill_of_legacy_metrics(workdir):
+    # Banco anterior aos rollups: sem a coluna route, latência em segundos / 1000
+    con = duckdb.connect("db")
+    con.execute("CREATE SEQUENCE seq_operational_metrics_id START 1")
+    con.execute(
+        """
+        CREATE TABLE operational_metrics (
+            id INTEGER PRIMARY KEY DEFAULT NEXTVAL('seq_operational_metrics_id'),
+            timestamp TIMESTAMP,
+            method TEXT,
+            url TEXT,
+            response_status INTEGER,
+            latency FLOAT
+        )
+        """
+    )
+    con.execute(
+        "INSERT INTO operational_metrics (timestamp, method, url, response_status, "
+        "latency) VALUES ('2024-01-01 10:00:00', 'POST', "
+        "'http://localhost:8000/predict?x=1', 200, 0.000008)"
+    )
+    con.close()
+
+    db = DBManager()
+    try:
+        db.setup_tables()
+        db.insert_operational_metrics(operational_metrics([2.0]))
+        (rollup,) = db.fetch_operational_rollups("day", route="/predict")
+    finally:
+        db.close()
+    assert rollup["count"] == 2
+    assert rollup["min_latency"] == 2.0
+    assert rollup["max_latency"] == pytest.approx(8.0, rel=1e-6)
+
+
+def test_recompute_includes_archived_predictions(db):
+    old = datetime.datetime(2020, 1, 1)
+    old_ids = insert(db, [10.0, 20.0], timestamp=old)
+    new_ids = insert(db, [30.0])
+    for prediction_id, actual_value in zip(old_ids + new_ids, [11.0, 22.0, 33.0]):
+        db.update_actual_value_by_id(prediction_id, actual_value)
+    before = aggregates(db)
+
+    assert db.archive_rows("predictions", datetime.datetime(2021, 1, 1)) == 2
+    assert len(db.fetch_predictions()) == 1
+    db.recompute_metric_aggregates()
+    assert_same_aggregates(aggregates(db), before)
+    assert aggregates(db)["xgboost"]["count"] == 3
+
+
+def test_retention_keeps_predictions_waiting_for_feedback(db):
+    now = datetime.datetime(2024, 6, 1)
+    labeled, unlabeled = insert(
+        db, [10.0, 20.0], timestamp=now - datetime.timedelta(days=40)
+    )
+    db.update_actual_value_by_id(labeled, 11.0)
+
+    result = apply_retention(db, now, raw_days=30, unlabeled_days=90)
+    assert result["archived"]["predictions"] == 1
+    assert [row["id"] for row in db.fetch_predictions()] == [unlabeled]
+    assert db.update_actual_values(
+        pd.DataFrame({"id": [unlabeled], "actual_value": [22.0]})
+    ) == {"received": 1, "updated": 1, "missing": 0, "duplicated": 0}
+
+    # Passada a janela das previsões sem valor real, elas também são arquivadas
+    late = insert(db, [30.0], timestamp=now - datetime.timedelta(days=40))
+    later = now + datetime.timedelta(days=60)
+    result = apply_retention(db, later, raw_days=30, unlabeled_days=90)
+    assert result["archived"]["predictions"] == 2
+    assert db.fetch_predictions() == []
+    archived = db.fetch_predictions(include_archive=True)
+    assert {row["id"] for row in archived} == {labeled, unlabeled, *late}
+    assert aggregates(db)["xgboost"]["count"] == 2
@@ -0,0 +1,286 @@
+import gzip
+import os
+
+import duckdb
+import pandas as pd
+import pytest
+
+from src.data import parallel_etl
+from src.data.ingest_csv import ingest_csv
+from src.data import process_data as processing
+from src.data.process_data import quote
+
+
+def write_raw(path, months, ask="1,5"):
+    """Write a raw ANAC-like Parquet file with two rows per (ano, mes)."""
+    rows = [
+        {
+            "EMPRESA_SIGLA": "ABC",
+            "ANO": year,
+            "MES": month,
+            "ASK": ask,
+            "ATK": "2,25",
+            "COMBUSTIVEL_LITROS": "",
+        }
+        for year, month in months
+        for _ in range(2)
+    ]
+    pd.DataFrame(rows).to_parquet(path, index=False)
+    return str(path)
+
+
+def read_output(output_dir):
+    return (
+        duckdb.connect()
+        .execute(
+            f"SELECT * FROM read_parquet('{output_dir}/*/*/*.parquet', "
+            "hive_partitioning=false) ORDER BY ANO, MES"
+        )
+        .df()
+    )
+
+
+def update_path(con, input_path):
+    """The former per-column UPDATEs on a table (identifiers quoted).
+
+    As in transform_sql, only the text columns present in the file are
+    updated; DECOLAGENS below is already numeric.
+    """
+    con.execute(
+        f"CREATE TABLE raw_dataset AS SELECT * FROM parquet_scan('{input_path}')"
+    )
+    text_columns = {
+        name
+        for name, column_type in processing.source_schema(con, "raw_dataset")
+        if column_type == "VARCHAR"
+    }
+
+    def present(columns):
+        return [quote(column) for column in columns if column in text_columns]
+
+    for column in processing.DROP_COLUMNS:
+        con.execute(f"ALTER TABLE raw_dataset DROP COLUMN {quote(column)}")
+    for column in present(processing.REPLACE_COMMA_WITH_DOT_COLUMNS):
+        con.execute(f"UPDATE raw_dataset SET {column} = REPLACE({column}, ',', '.')")
+    for column in present(processing.SET_EMPTY_TO_NULL_COLUMNS):
+        con.execute(
+            f"UPDATE raw_dataset SET {column} = NULL WHERE LENGTH(TRIM({column})) = 0"
+        )
+    for column in present(processing.NUMERIC_COLUMNS):
+        con.execute(
+            f"UPDATE raw_dataset SET {column} = TRY_CAST({column} AS REAL) "
+            f"WHERE {column} IS NOT NULL"
+        )
+    date_column = quote(processing.NEW_DATE_COLUMN)
+    year, month = map(quote, processing.DATE_COLUMNS)
+    con.execute(f"ALTER TABLE raw_dataset ADD COLUMN {date_column} DATE")
+    con.execute(
+        f"UPDATE raw_dataset SET {date_column} = CAST({year} || '-' || "
+        f"LPAD({month}, 2, '0') || '{processing.DATE_CONCAT_FORMAT}' AS DATE)"
+    )
+    return con.execute("SELECT * FROM raw_dataset").df()
+
+
+@pytest.fixture
+def odd_columns(monkeypatch):
+    # "PESO KG" é numérico na configuração; as demais passam como estão
+    for name in ("NUMERIC_COLUMNS", "REPLACE_COMMA_WITH_DOT_COLUMNS"):
+        monkeypatch.setattr(processing, name, getattr(processing, name) + ["PESO KG"])
+    monkeypatch.setattr(
+        processing,
+        "SET_EMPTY_TO_NULL_COLUMNS",
+        processing.SET_EMPTY_TO_NULL_COLUMNS + ["PESO KG"],
+    )
+
+
+def test_single_pass_matches_the_former_updates(tmp_path, odd_columns):
+    raw = pd.DataFrame(
+        {
+            "EMPRESA_SIGLA": ["ABC", "DEF", "GHI", "JKL"],
+            "ANO": ["2020", "2020", "2021", "2021"],
+            "MES": ["1", "12", "3", "3"],
+            "ASK": ["1,5", " ", "abc", None],
+            "ATK": ["2,25", "", "3", "4,0"],
+            "CLASSE IDA": ["REGULAR", "FRETE", "", None],
+            'NOME "AERONAVE"': ["A320", "B737", "E195", "ATR"],
+            "PESO KG": ["10,5", "", "x", "7"],
+            "DECOLAGENS": [1.0, 2.0, None, 4.0],
+        }
+    )
+    raw_path = str(tmp_path / "raw.parquet")
+    raw.to_parquet(raw_path, index=False)
+    output_path = str(tmp_path / "out.parquet")
+
+    con = duckdb.connect()
+    processing.process_data(con, raw_path, output_path)
+    output = con.execute(f"SELECT * FROM parquet_scan('{output_path}')").df()
+    expected = update_path(duckdb.connect(), raw_path)
+    pd.testing.assert_frame_equal(output, expected)
+    assert output["PESO KG"].fillna("").tolist() == ["10.5", "", "", "7.0"]
+    assert output["CLASSE IDA"].tolist()[:2] == ["REGULAR", "FRETE"]
+
+
+def test_partitioned_outputs_with_odd_column_names(tmp_path, odd_columns):
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    files = []
+    for month in (1, 2):
+        path = write_raw(raw_dir / f"f{month}.parquet", [(2020, month)])
+        df = pd.read_parquet(path).assign(**{"CLASSE IDA": "REGULAR", "PESO KG": "1,5"})
+        df.to_parquet(path, index=False)
+        files.append(path)
+
+    con = duckdb.connect()
+    result = processing.process_partitions(con, files[0], str(tmp_path / "single"))
+    assert result["processed"] == ["2020/1"]
+    parallel_etl.run(files, str(tmp_path / "out"), str(tmp_path / "stage"), workers=1)
+    output = read_output(tmp_path / "out")
+    assert output["CLASSE IDA"].tolist() == ["REGULAR"] * 4
+    assert output["ASK"].tolist() == ["1.5"] * 4
+
+
+def test_process_partitions_incremental(tmp_path):
+    raw = write_raw(tmp_path / "raw.parquet", [(2020, 1), (2020, 2), (2020, 3)])
+    output_dir = str(tmp_path / "out")
+    con = duckdb.connect()
+
+    result = processing.process_partitions(con, raw, output_dir)
+    assert len(result["processed"]) == 3
+    output = read_output(output_dir)
+    assert len(output) == 6
+    assert "EMPRESA_SIGLA" not in output.columns
+    # Como nos UPDATEs originais, o valor convertido volta ao tipo da coluna
+    assert output["ASK"].tolist() == ["1.5"] * 6
+    assert output["COMBUSTIVEL_LITROS"].isna().all()
+
+    result = processing.process_partitions(con, raw, output_dir)
+    assert result == {"processed": [], "skipped": 3, "removed": []}
+
+    # Fevereiro muda, março sai e janeiro fica igual
+    jan = pd.read_parquet(write_raw(tmp_path / "jan.parquet", [(2020, 1)]))
+    feb = pd.read_parquet(write_raw(tmp_path / "feb.parquet", [(2020, 2)], ask="9"))
+    pd.concat([jan, feb]).to_parquet(raw, index=False)
+    result = processing.process_partitions(con, raw, output_dir)
+    assert result["processed"] == ["2020/2"]
+    assert result["skipped"] == 1
+    assert result["removed"] == ["2020/3"]
+    assert read_output(output_dir)["ASK"].tolist() == ["1.5", "1.5", "9.0", "9.0"]
+
+
+CSV_HEADER = "ANO;MES;EMPRESA;CLASSE IDA;TARIFA;ASK\n"
+
+
+def write_csv(path, rows, header=CSV_HEADER, encoding="utf-8"):
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, "wt", encoding=encoding) as f:
+        f.write(header + "".join(rows))
+    return str(path)
+
+
+def test_ingest_gzip_and_glob(tmp_path):
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    write_csv(raw_dir / "a.CSV", ["2023;4;AAL;J;2780,00;1,5\n"])
+    write_csv(raw_dir / "b.CSV.gz", ["2023;5;GLO;Y;1092,50;\n", "2023;5;AZU;Y;10;2\n"])
+    # Um arquivo sem a coluna ASK: as colunas são combinadas por nome
+    write_csv(
+        raw_dir / "c.CSV", ["2023;6;TAM;Y;99,9\n"], CSV_HEADER.replace(";ASK", "")
+    )
+    output_path = str(tmp_path / "dataset.parquet")
+
+    con = duckdb.connect()
+    assert ingest_csv(con, str(raw_dir / "*.CSV*"), output_path) == 4
+    output = con.execute(
+        f"SELECT * FROM parquet_scan('{output_path}') ORDER BY MES, EMPRESA"
+    ).df()
+    assert output["EMPRESA"].tolist() == ["AAL", "AZU", "GLO", "TAM"]
+    # TARIFA não está no config.ini, mas só tem números com vírgula decimal
+    assert output["TARIFA"].tolist() == [2780.0, 10.0, 1092.5, 99.9]
+    assert output["ASK"].tolist()[:2] == [1.5, 2.0]
+    assert output["ASK"].isna().tolist()[2:] == [True, True]
+    assert output["CLASSE IDA"].tolist() == ["J", "Y", "Y", "Y"]
+
+    with pytest.raises(FileNotFoundError):
+        processing.csv_source_sql(str(raw_dir / "*.parquet"))
+
+
+def test_ingest_latin1(tmp_path):
+    path = write_csv(
+        tmp_path / "latin1.CSV",
+        ["2023;4;AVIAÇÃO;J;1,5;2\n"],
+        CSV_HEADER.replace("EMPRESA", "EMPRESA_AÉREA"),
+        encoding="latin-1",
+    )
+    with pytest.raises(UnicodeDecodeError):
+        processing.csv_header(path)
+    with pytest.raises(ValueError, match="only reads UTF-8"):
+        processing.csv_source_sql(path, encoding="latin-1")
+
+    output_path = str(tmp_path / "dataset.parquet")
+    assert ingest_csv(duckdb.connect(), path, output_path, encoding="latin-1") == 1
+    output = pd.read_parquet(output_path)
+    assert output["EMPRESA_AÉREA"].tolist() == ["AVIAÇÃO"]
+    assert output["TARIFA"].tolist() == [1.5]
+    # A cópia temporária em UTF-8 é apagada
+    assert sorted(os.listdir(tmp_path)) == ["dataset.parquet", "latin1.CSV"]
+
+
+@pytest.fixture
+def raw_files(tmp_path):
+    raw_dir = tmp_path / "raw"
+    raw_dir.mkdir()
+    return [
+        write_raw(raw_dir / f"f{month}.parquet", [(2020, month)]) for month in (1, 2, 3)
+    ]
+
+
+def run(tmp_path, files, **kwargs):
+    return parallel_etl.run(
+        files, str(tmp_path / "out"), str(tmp_path / "stage"), workers=1, **kwargs
+    )
+
+
+def test_parallel_etl_resumes_and_skips(tmp_path, raw_files):
+    with open(raw_files[2], "w") as f:
+        f.write("not parquet")
+    with pytest.raises(RuntimeError, match="1 of 3 files failed"):
+        run(tmp_path, raw_files)
+    assert set(parallel_etl.read_checkpoint(str(tmp_path / "stage"))) == set(
+        raw_files[:2]
+    )
+
+    write_raw(raw_files[2], [(2020, 3)])
+    result = run(tmp_path, raw_files)
+    assert result["files_processed"] == 1
+    assert len(read_output(tmp_path / "out")) == 6
+
+    result = run(tmp_path, raw_files)
+    assert result["files_processed"] == 0
+    assert result["processed"] == []
+
+
+def test_changed_transformation_reprocesses(tmp_path, raw_files):
+    run(tmp_path, raw_files)
+    staging_dir = str(tmp_path / "stage")
+    checkpoint = parallel_etl.read_checkpoint(staging_dir)
+    checkpoint[raw_files[0]]["transform"] = "hash of an older config"
+    parallel_etl.write_checkpoint(staging_dir, checkpoint)
+    assert not parallel_etl.is_completed(checkpoint[raw_files[0]], raw_files[0])
+
+    assert run(tmp_path, raw_files)["files_processed"] == 1
+
+
+def test_subset_run_keeps_other_files_unless_pruned(tmp_path, raw_files):
+    run(tmp_path, raw_files)
+
+    result = run(tmp_path, raw_files[:1])
+    assert result["files_processed"] == 0
+    assert result["removed"] == []
+    assert len(read_output(tmp_path / "out")) == 6
+    assert len(parallel_etl.read_checkpoint(str(tmp_path / "stage"))) == 3
+
+    result = run(tmp_path, raw_files[:1], prune=True)
+    assert sorted(result["removed"]) == ["2020/2", "2020/3"]
+    assert read_output(tmp_path / "out")["MES"].unique().tolist() == [1]
+    assert list(parallel_etl.read_checkpoint(str(tmp_path / "stage"))) == raw_files[:1]
+    assert len(list((tmp_path / "stage").glob("*.parquet"))) == 1
@@ -0,0 +1,64 @@
+import io
+import json
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from src.api.export import STREAM_FORMATS, format_from_accept
+
+SCHEMA = pa.schema([("id", pa.int64()), ("value", pa.float64())])
+BATCHES = [
+    pa.RecordBatch.from_pylist(
+        [{"id": 1, "value": 1.5}, {"id": 2, "value": 2.5}], schema=SCHEMA
+    ),
+    pa.RecordBatch.from_pylist([{"id": 3, "value": None}], schema=SCHEMA),
+]
+EMPTY = [pa.RecordBatch.from_pylist([], schema=SCHEMA)]
+
+
+def serialize(data_format, batches):
+    _, serializer = STREAM_FORMATS[data_format]
+    return b"".join(serializer(iter(batches)))
+
+
+@pytest.mark.parametrize("batches", [BATCHES, EMPTY])
+def test_arrow_stream(batches):
+    table = pa.ipc.open_stream(serialize("arrow", batches)).read_all()
+    assert table.schema == SCHEMA
+    assert table.to_pylist() == pa.Table.from_batches(batches).to_pylist()
+
+
+@pytest.mark.parametrize("batches", [BATCHES, EMPTY])
+def test_parquet(batches):
+    table = pq.read_table(io.BytesIO(serialize("parquet", batches)))
+    assert table.schema == SCHEMA
+    assert table.to_pylist() == pa.Table.from_batches(batches).to_pylist()
+
+
+def test_parquet_writes_one_row_group_per_batch():
+    metadata = pq.read_metadata(io.BytesIO(serialize("parquet", BATCHES)))
+    assert metadata.num_row_groups == 2
+
+
+def test_text_formats():
+    assert serialize("csv", BATCHES).decode().splitlines() == [
+        '"id","value"',
+        "1,1.5",
+        "2,2.5",
+        "3,",
+    ]
+    rows = [json.loads(line) for line in serialize("ndjson", BATCHES).splitlines()]
+    assert rows == [
+        {"id": 1, "value": 1.5},
+        {"id": 2, "value": 2.5},
+        {"id": 3, "value": None},
+    ]
+    assert serialize("csv", EMPTY).decode() == '"id","value"\n'
+
+
+def test_format_from_accept():
+    assert format_from_accept("application/vnd.apache.arrow.stream") == "arrow"
+    assert format_from_accept("text/html, text/csv;q=0.9") == "csv"
+    assert format_from_accept("*/*") is None
+    assert format_from_accept(None) is None
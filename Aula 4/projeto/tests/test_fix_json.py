@@ -0,0 +1,97 @@
+import gzip
+import io
+import json
+
+import pyarrow.parquet as pq
+import pytest
+
+from src.data.fix_json import (
+    fix_json,
+    iter_records,
+    json_to_parquet,
+    repaired_chunks,
+)
+
+RECORDS = [
+    {"ANO": "2021", "MES": "1", "EMPRESA_NOME": "AZUL", "ASK": "1,5"},
+    {"ANO": "2021", "MES": "2", "EMPRESA_NOME": "GOL", "ASK": ""},
+    {"ANO": "2021", "MES": "3", "EMPRESA_NOME": "LATAM", "ASK": "3"},
+]
+# Two arrays glued together, as in the ANAC export
+BROKEN = json.dumps(RECORDS[:2]) + json.dumps(RECORDS[2:])
+
+
+def chunks(text, size):
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+def test_broken_export_is_not_json():
+    assert '"}][{"' in BROKEN
+    with pytest.raises(json.JSONDecodeError):
+        json.loads(BROKEN)
+
+
+@pytest.mark.parametrize("chunk_size", range(1, 12))
+def test_separator_split_across_chunks(chunk_size):
+    # Every small chunk size puts a chunk boundary inside the separator
+    repaired = "".join(repaired_chunks(io.StringIO(BROKEN), chunk_size))
+    assert json.loads(repaired) == RECORDS
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 7, 64])
+def test_records_split_across_chunks(chunk_size):
+    assert list(iter_records(chunks(BROKEN, chunk_size))) == RECORDS
+    repaired = repaired_chunks(io.StringIO(BROKEN), chunk_size)
+    assert list(iter_records(repaired)) == RECORDS
+
+
+@pytest.mark.parametrize(
+    "text, message",
+    [
+        ('[{"A": 1}', "not closed"),
+        ('[{"A": 1', "Truncated record"),
+        ('[{"A": 1}}]', "Unexpected"),
+        ('{"A": 1}', "Expected '\\['"),
+    ],
+)
+def test_invalid_exports(text, message):
+    with pytest.raises(ValueError, match=message):
+        list(iter_records(chunks(text, 3)))
+
+
+def test_malformed_record_does_not_grow_the_buffer():
+    text = '[{"A": ' + "1" * 100
+    with pytest.raises(ValueError, match="Malformed record"):
+        list(iter_records(chunks(text, 10), max_record_size=50))
+
+
+def test_json_to_parquet(tmp_path):
+    path = tmp_path / "export.json.gz"
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write(BROKEN)
+    output_path = str(tmp_path / "dataset.parquet")
+
+    rows = json_to_parquet(str(path), output_path, chunk_size=7, row_group_size=2)
+    assert rows == 3
+    table = pq.read_table(output_path)
+    assert pq.read_metadata(output_path).num_row_groups == 2
+    assert str(table.schema.field("ASK").type) == "float"
+    assert str(table.schema.field("ANO").type) == "int32"
+    assert table.column("ASK").to_pylist() == [1.5, None, 3.0]
+    assert table.column("EMPRESA_NOME").to_pylist() == ["AZUL", "GOL", "LATAM"]
+
+    # A record with a column the first one does not have keeps the old output
+    path.write_bytes(gzip.compress(json.dumps(RECORDS + [{"NOVA": 1}]).encode()))
+    with pytest.raises(ValueError, match="new columns \\['NOVA'\\]"):
+        json_to_parquet(str(path), output_path, chunk_size=7)
+    assert pq.read_table(output_path).num_rows == 3
+    assert not (tmp_path / "dataset.parquet.tmp").exists()
+
+
+def test_fix_json(tmp_path):
+    path = tmp_path / "export.json"
+    path.write_text(BROKEN, encoding="utf-8")
+    output_path = str(tmp_path / "fixed.json")
+    fix_json(str(path), output_path, chunk_size=4)
+    with open(output_path, encoding="utf-8") as f:
+        assert json.load(f) == RECORDS
@@ -0,0 +1,46 @@
+import io
+
+import pandas as pd
+import pytest
+
+from src.monitoring.ground_truth import format_from_content_type, read_actual_values
+
+
+def test_read_every_format():
+    expected = pd.DataFrame({"id": [1, 2], "actual_value": [2.5, 3.0]})
+    parquet = io.BytesIO()
+    expected.to_parquet(parquet)
+    payloads = [
+        ("json", b'[{"id": 1, "actual_value": 2.5}, {"id": 2, "actual_value": 3}]'),
+        ("json", b"[[1, 2.5], [2.0, 3]]"),
+        ("csv", b"id,actual_value,extra\n1,2.5,x\n2,3,y\n"),
+        ("parquet", parquet.getvalue()),
+    ]
+    for data_format, content in payloads:
+        pd.testing.assert_frame_equal(
+            read_actual_values(content, data_format), expected
+        )
+
+
+@pytest.mark.parametrize(
+    "content, message",
+    [
+        (b"[[1.7, 2.5]]", "id must be an integer"),
+        (b'[["abc", 2.5]]', "id must be an integer"),
+        (b"id,actual_value\ninf,1\n", "id must be an integer"),
+        (b"[[1, null]]", "must not be null"),
+        (b"id,actual_value\n1,inf\n", "finite number"),
+        (b"id\n1\n", "Missing columns: actual_value"),
+    ],
+)
+def test_invalid_actual_values(content, message):
+    data_format = "csv" if content.startswith(b"id") else "json"
+    with pytest.raises(ValueError, match=message):
+        read_actual_values(content, data_format)
+
+
+def test_content_types():
+    assert format_from_content_type("text/csv; charset=utf-8") == "csv"
+    assert format_from_content_type(None) == "json"
+    with pytest.raises(ValueError, match="not supported"):
+        format_from_content_type("text/plain")
@@ -0,0 +1,87 @@
+import json
+import logging
+
+import pytest
+
+from src.monitoring.logging_pipeline import DbLogSampler, LogPipeline
+
+
+@pytest.fixture
+def logger():
+    # A private logger, so the root logger installed by the API is left alone
+    logger = logging.getLogger("test_logging_pipeline")
+    logger.propagate = False
+    logger.setLevel(logging.DEBUG)
+    yield logger
+    logger.handlers.clear()
+
+
+def read_lines(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_records_are_written_as_json_lines(tmp_path, logger):
+    path = tmp_path / "logs" / "app.log"
+    pipeline = LogPipeline(path=str(path))
+    logger.addHandler(pipeline.queue_handler)
+    pipeline.start()
+    items = ["a"]
+    logger.info("items: %s", items, extra={"request_id": "r1"})
+    items.append("b")  # the message was resolved when it was logged
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.exception("failed")
+    pipeline.stop()
+
+    first, second = read_lines(path)
+    assert first["message"] == "items: ['a']"
+    assert first["level"] == "INFO"
+    assert first["request_id"] == "r1"
+    assert first["function"] == "test_records_are_written_as_json_lines"
+    assert second["level"] == "ERROR"
+    assert "ValueError: boom" in second["exception"]
+
+
+def test_full_queue_drops_and_counts(tmp_path, logger):
+    path = tmp_path / "app.log"
+    pipeline = LogPipeline(path=str(path), queue_size=2)
+    logger.addHandler(pipeline.queue_handler)
+    for i in range(5):
+        logger.info("record %d", i)
+    assert pipeline.stats() == {"queued_records": 2, "dropped_records": 3}
+    pipeline.start()
+    pipeline.stop()
+    assert [line["message"] for line in read_lines(path)] == ["record 0", "record 1"]
+
+
+def test_rotation(tmp_path, logger):
+    path = tmp_path / "app.log"
+    pipeline = LogPipeline(path=str(path), max_bytes=1000, backup_count=2)
+    logger.addHandler(pipeline.queue_handler)
+    pipeline.start()
+    for i in range(100):
+        logger.info("record %d", i)
+    pipeline.stop()
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "app.log",
+        "app.log.1",
+        "app.log.2",
+    ]
+    assert read_lines(path)[-1]["message"] == "record 99"
+
+
+def record(module, function, level=logging.INFO):
+    return logging.makeLogRecord(
+        {"module": module, "funcName": function, "levelno": level}
+    )
+
+
+def test_db_log_sampler():
+    sampler = DbLogSampler(rate=0)
+    assert not sampler.filter(record("db_manager", "insert_predictions"))
+    assert not sampler.filter(record("sharded_db_manager", "fetch_predictions"))
+    assert sampler.filter(record("db_manager", "insert_predictions", logging.ERROR))
+    assert sampler.filter(record("db_manager", "archive_rows"))
+    assert sampler.filter(record("routes", "update_prediction"))
+    assert DbLogSampler(rate=1).filter(record("db_manager", "insert_predictions"))
@@ -0,0 +1,47 @@
+import os
+
+from src.utils.model_utils import ModelCache
+
+
+def test_loads_once_and_reloads_on_change(tmp_path):
+    path = tmp_path / "model.json"
+    path.write_text("1")
+    loads = []
+
+    def loader(file):
+        loads.append(file)
+        with open(file) as f:
+            return f.read()
+
+    cache = ModelCache()
+    assert cache.get(str(path), loader) == "1"
+    assert cache.get(str(path), loader) == "1"
+    assert len(loads) == 1
+
+    # A new file (other inode/mtime) is loaded again on the next lookup
+    tmp_file = tmp_path / "model.json.tmp"
+    tmp_file.write_text("22")
+    os.replace(tmp_file, path)
+    assert cache.get(str(path), loader) == "22"
+    assert len(loads) == 2
+    assert cache.stats() == {
+        "hits": 1,
+        "misses": 1,
+        "reloads": 1,
+        "cached_models": 1,
+    }
+
+
+def test_one_entry_per_loader(tmp_path):
+    first, second = tmp_path / "a.json", tmp_path / "b.json"
+    first.write_text("a")
+    second.write_text("b")
+    cache = ModelCache()
+    cache.get(str(first), lambda path: "a")
+    other_loader = lambda path: "other"  # noqa: E731
+    cache.get(str(first), other_loader)
+    assert cache.stats()["cached_models"] == 2
+
+    # Another version for the same loader replaces the previous one
+    cache.get(str(second), other_loader)
+    assert cache.stats()["cached_models"] == 2
@@ -0,0 +1,66 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from src.utils import model_utils
+
+
+def test_publish_and_rollback(workdir, xgb_model):
+    assert model_utils.get_current_version() is None
+    with pytest.raises(ValueError, match="No model version"):
+        model_utils.rollback_models()
+
+    first = model_utils.publish_models(xgb_model, 1.0)
+    assert model_utils.get_baseline_model() == 1.0
+    assert first["previous_version"] is None
+
+    second = model_utils.publish_models(xgb_model, 2.0, {"rows": 500})
+    assert second["previous_version"] == first["version"]
+    assert model_utils.get_current_version() == second["version"]
+    assert model_utils.get_model_version("baseline") == second["version"]
+    assert model_utils.get_baseline_model() == 2.0
+    assert [m["version"] for m in model_utils.list_model_versions()] == [
+        second["version"],
+        first["version"],
+    ]
+
+    rolled_back = model_utils.rollback_models()
+    assert rolled_back["version"] == first["version"]
+    assert model_utils.get_baseline_model() == 1.0
+    with pytest.raises(ValueError, match="no previous version"):
+        model_utils.rollback_models()
+
+
+def test_manifest_describes_artifacts(workdir, xgb_model):
+    manifest = model_utils.publish_models(xgb_model, 1.0)
+    version_dir = os.path.join(model_utils.VERSIONS_DIR, manifest["version"])
+    for model_type, artifact in manifest["artifacts"].items():
+        path = os.path.join(version_dir, artifact["file"])
+        assert model_utils.get_artifact_path(model_type) == path
+        assert os.path.getsize(path) == artifact["size"]
+        assert model_utils._sha256(path) == artifact["sha256"]
+    # Nothing half-written is left next to the published versions
+    assert os.listdir(model_utils.VERSIONS_DIR) == [manifest["version"]]
+
+
+def test_legacy_artifacts_without_registry(workdir):
+    os.makedirs(model_utils.MODEL_DIR)
+    with open(model_utils.BASELINE_MODEL_PATH, "w") as f:
+        json.dump({"baseline_value": 3.5}, f)
+    assert model_utils.get_artifact_path("baseline") == model_utils.BASELINE_MODEL_PATH
+    assert model_utils.get_baseline_model() == 3.5
+    assert model_utils.get_model_version("baseline").startswith("legacy-")
+
+
+def test_engine_and_model_load_the_same_version(workdir, xgb_model, training_data):
+    model_utils.publish_models(xgb_model, 1.0)
+    path = model_utils.get_artifact_path("xgboost")
+    features = training_data[0][:50]
+    np.testing.assert_allclose(
+        model_utils.load_xgboost_engine(path).predict(features),
+        model_utils.load_xgboost_model(path).predict(features),
+        rtol=1e-5,
+        atol=1e-2,
+    )
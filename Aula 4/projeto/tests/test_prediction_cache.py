@@ -0,0 +1,71 @@
+import pytest
+
+from src.models.predict import validate_features
+from src.utils.prediction_cache import PREDICTION_CACHE_DECIMALS, PredictionCache
+
+DATA = {"ASK": 2397890.0, "ATK": 277088.0, "COMBUSTIVEL_LITROS": 5.0}
+
+
+def test_baseline_key_ignores_features():
+    key = PredictionCache.make_key("baseline", "v1", {})
+    assert key == PredictionCache.make_key("baseline", "v1", DATA)
+    assert key != PredictionCache.make_key("baseline", "v2", {})
+
+
+def test_key_rounds_features_and_includes_version():
+    close = {**DATA, "ASK": DATA["ASK"] + 10 ** -(PREDICTION_CACHE_DECIMALS + 2)}
+    assert PredictionCache.make_key("xgboost", "v1", DATA) == PredictionCache.make_key(
+        "xgboost", "v1", close
+    )
+    assert PredictionCache.make_key("xgboost", "v1", DATA) != PredictionCache.make_key(
+        "xgboost", "v2", DATA
+    )
+
+
+@pytest.mark.parametrize(
+    "data, message",
+    [
+        ({}, "Missing features"),
+        ({**DATA, "ASK": "abc"}, "must be numbers: ASK"),
+        ({**DATA, "ATK": None}, "must be numbers: ATK"),
+        ({**DATA, "ATK": True}, "must be numbers: ATK"),
+    ],
+)
+def test_invalid_features(data, message):
+    with pytest.raises(ValueError, match=message):
+        validate_features(data)
+
+
+def test_validate_features_returns_floats():
+    assert validate_features({**DATA, "ASK": 1, "extra": "x"}) == {**DATA, "ASK": 1.0}
+
+
+def test_lru_eviction_and_invalidation():
+    cache = PredictionCache(max_size=2, ttl_seconds=60)
+    cache.put("a", 1.0)
+    cache.put("b", 2.0)
+    assert cache.get("a") == 1.0  # "b" becomes the least recently used
+    cache.put("c", 3.0)
+    assert cache.get("b") is None
+    assert cache.get("c") == 3.0
+
+    cache.clear()
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["invalidations"] == 1
+    assert stats["hits"] == 2
+    assert stats["size"] == 0
+
+
+def test_expired_entries_are_misses():
+    cache = PredictionCache(max_size=10, ttl_seconds=-1)
+    cache.put("a", 1.0)
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_disabled_cache():
+    cache = PredictionCache(max_size=0, ttl_seconds=60)
+    cache.put("a", 1.0)
+    assert cache.get("a") is None
@@ -0,0 +1,41 @@
+import cProfile
+import re
+
+import pytest
+
+from src.monitoring.profiling import Profiler
+
+
+def test_only_the_token_enables_profiling(tmp_path):
+    profiler = Profiler(token="secret", sample_rate=0, profile_dir=str(tmp_path))
+    assert profiler.start_request({}) is None
+    assert profiler.start_request({"x-profile": "wrong"}) is None
+    assert profiler.start_request({"x-profile": "secret", "x-request-id": "r1"}) == "r1"
+    assert not profiler.is_authorized({"x-profile-token": "wrong"})
+    assert profiler.is_authorized({"x-profile-token": "secret"})
+
+    no_token = Profiler(token=None, sample_rate=0, profile_dir=str(tmp_path))
+    assert no_token.start_request({"x-profile": ""}) is None
+    assert not no_token.is_authorized({})
+
+
+def test_sampled_requests_are_profiled(tmp_path):
+    profiler = Profiler(token=None, sample_rate=1, profile_dir=str(tmp_path))
+    assert re.fullmatch("[0-9a-f]{32}", profiler.start_request({}))
+
+
+@pytest.mark.parametrize("request_id", ["../db", "a/b", "..", "", "x" * 65])
+def test_malformed_request_ids_never_reach_the_filesystem(tmp_path, request_id):
+    profiler = Profiler(token="secret", profile_dir=str(tmp_path))
+    with pytest.raises(ValueError, match="Invalid request id"):
+        profiler.path(request_id)
+    headers = {"x-profile": "secret", "x-request-id": request_id}
+    assert re.fullmatch("[0-9a-f]{32}", profiler.start_request(headers))
+
+
+def test_existing_profiles_are_not_overwritten(tmp_path):
+    profiler = Profiler(token="secret", profile_dir=str(tmp_path))
+    profiler.save("r1", cProfile.Profile())
+    headers = {"x-profile": "secret", "x-request-id": "r1"}
+    assert profiler.start_request(headers) != "r1"
+    assert [p["request_id"] for p in profiler.list_profiles()] == ["r1"]
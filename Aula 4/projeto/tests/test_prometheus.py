@@ -0,0 +1,60 @@
+import threading
+
+from src.monitoring.prometheus import CallbackMetric, MetricsRegistry
+
+
+def test_counter_text_format():
+    registry = MetricsRegistry()
+    counter = registry.counter("requests_total", "Requests.", ("method", "path"))
+    counter.inc(1, "GET", "/a")
+    counter.inc(2, "GET", "/a")
+    counter.inc(0.5, "POST", 'say "hi"\\\n')
+    assert registry.render() == (
+        "# HELP requests_total Requests.\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{method="GET",path="/a"} 3\n'
+        'requests_total{method="POST",path="say \\"hi\\"\\\\\\n"} 0.5\n'
+    )
+
+
+def test_histogram_text_format():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("latency_seconds", "Latency.", bounds=[0.1, 1])
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+    assert registry.render().splitlines()[2:] == [
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        "latency_seconds_sum 3.65",
+        "latency_seconds_count 4",
+    ]
+
+
+def test_series_from_every_thread_are_summed():
+    registry = MetricsRegistry()
+    counter = registry.counter("events_total", "Events.")
+    histogram = registry.histogram("sizes", "Sizes.", bounds=[10])
+
+    def record():
+        for _ in range(1000):
+            counter.inc()
+            histogram.observe(1)
+
+    threads = [threading.Thread(target=record) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counter.collect() == {(): 8000}
+    assert histogram.collect()[()][:2] == [8000, 0]
+
+
+def test_registry_returns_the_existing_metric():
+    registry = MetricsRegistry()
+    first = registry.counter("hits_total", "Hits.")
+    assert registry.counter("hits_total", "Hits.") is first
+    registry.register(
+        CallbackMetric("size", "Size.", lambda: {("a",): 2}, ("name",), "gauge")
+    )
+    assert registry.render().endswith('# TYPE size gauge\nsize{name="a"} 2\n')
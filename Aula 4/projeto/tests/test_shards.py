@@ -0,0 +1,89 @@
+import datetime
+import os
+
+import duckdb
+import pandas as pd
+import pytest
+
+from src.monitoring.retention import apply_retention
+from src.utils.compact_shards import compact_table, load_into_db
+from src.utils.db_manager import DBManager
+from src.utils.sharded_db_manager import (
+    SHARD_DIR,
+    ShardedDBManager,
+    retired_segments,
+    scan_sql,
+    segment_files,
+)
+
+OLD = datetime.datetime(2020, 1, 1)
+
+
+@pytest.fixture
+def shards(workdir):
+    shards = ShardedDBManager()
+    shards.setup_tables()
+    yield shards
+    shards.close()
+
+
+def count(con, source):
+    return con.execute(f"SELECT COUNT(*) FROM {source}").fetchone()[0]
+
+
+def test_compaction_keeps_merged_segments_until_the_next_one(shards):
+    for _ in range(3):
+        shards.insert_predictions(
+            datetime.datetime.now(), "xgboost", ["{}"] * 5, [1.0] * 5
+        )
+    con = duckdb.connect()
+    held = scan_sql("predictions")  # lista de arquivos de uma leitura em andamento
+
+    assert compact_table(con, "predictions") == 3
+    assert len(segment_files("predictions")) == 1
+    assert count(con, held) == 15
+    assert count(con, scan_sql("predictions")) == 15
+
+    retired = retired_segments("predictions")
+    shards.insert_predictions(datetime.datetime.now(), "xgboost", ["{}"] * 5, [1.0] * 5)
+    assert compact_table(con, "predictions") == 2
+    table_dir = os.path.join(SHARD_DIR, "predictions")
+    assert not any(os.path.exists(os.path.join(table_dir, name)) for name in retired)
+    assert count(con, scan_sql("predictions")) == 20
+
+
+def test_retention_is_refused_in_shard_mode(shards):
+    with pytest.raises(RuntimeError, match="compact_shards --into-db"):
+        shards.archive_rows("predictions", OLD)
+    with pytest.raises(RuntimeError, match="compact_shards --into-db"):
+        shards.delete_rollups_before("minute", OLD)
+
+
+def test_load_after_retention_does_not_reinsert(shards):
+    shards.insert_predictions(OLD, "xgboost", ["{}"] * 5, [1.0] * 5)
+    shards.insert_predictions(datetime.datetime.now(), "xgboost", ["{}"] * 3, [1.0] * 3)
+    shards.update_actual_values(
+        pd.DataFrame({"id": [1, 2, 6], "actual_value": [2.0, 3.0, 4.0]})
+    )
+    con = duckdb.connect()
+    for table in ("predictions", "actuals"):
+        compact_table(con, table)
+    shards.close()
+
+    db = DBManager()
+    db.setup_tables()
+    try:
+        loaded = load_into_db(db)
+        assert loaded["predictions"] == 8
+        assert loaded["actuals"] == 3
+        before = db.fetch_metric_aggregates()
+
+        assert apply_retention(db, raw_days=30)["archived"]["predictions"] == 5
+        assert load_into_db(db)["predictions"] == 0
+        assert len(db.fetch_predictions()) == 3
+        assert len(db.fetch_predictions(include_archive=True)) == 8
+
+        db.recompute_metric_aggregates()
+        assert db.fetch_metric_aggregates() == before
+    finally:
+        db.close()
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+import xgboost as xgb
+
+from src.models.tree_engine import TreeEnsemble
+
+
+def test_matches_xgboost(xgb_model, training_data):
+    features = training_data[0][:200]
+    engine = TreeEnsemble.from_booster(xgb_model.get_booster())
+    np.testing.assert_allclose(
+        engine.predict(features), xgb_model.predict(features), rtol=1e-5, atol=1e-2
+    )
+
+
+def test_missing_values_follow_default_direction(training_data):
+    features, target = training_data
+    features = features.copy()
+    features[::3, 1] = np.nan
+    model = xgb.XGBRegressor(n_estimators=10, max_depth=3, random_state=0)
+    model.fit(features, target)
+    engine = TreeEnsemble.from_booster(model.get_booster())
+    np.testing.assert_allclose(
+        engine.predict(features[:100]),
+        model.predict(features[:100]),
+        rtol=1e-5,
+        atol=1e-2,
+    )
+
+
+def test_load_json_file_and_single_row(xgb_model, training_data, tmp_path):
+    path = str(tmp_path / "model.json")
+    xgb_model.save_model(path)
+    engine = TreeEnsemble.load(path)
+    row = training_data[0][0]
+    assert engine.predict(row).shape == (1,)
+    np.testing.assert_allclose(
+        engine.predict(row), xgb_model.predict(row.reshape(1, -1)), rtol=1e-5
+    )
+
+
+def test_unsupported_objective(training_data):
+    features, target = training_data
+    model = xgb.XGBRegressor(n_estimators=2, objective="reg:logistic")
+    model.fit(features, (target > np.median(target)).astype(float))
+    with pytest.raises(ValueError, match="not supported"):
+        TreeEnsemble.from_booster(model.get_booster())
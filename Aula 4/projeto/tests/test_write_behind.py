@@ -0,0 +1,131 @@
+import threading
+
+import pandas as pd
+
+from src.utils.write_behind import WriteBehindBuffer, get_buffer_stats
+
+COLUMNS = ["id", "value"]
+
+
+def collector():
+    batches = []
+    flushed = threading.Event()
+
+    def flush_fn(df):
+        batches.append(df)
+        flushed.set()
+
+    return batches, flushed, flush_fn
+
+
+def test_background_flush_when_enough_rows_are_waiting():
+    batches, flushed, flush_fn = collector()
+    buffer = WriteBehindBuffer(
+        "test-rows", COLUMNS, flush_fn, flush_rows=3, flush_interval_ms=60_000
+    )
+    buffer.start()
+    try:
+        for i in range(3):
+            assert buffer.append((i, float(i)))
+        assert flushed.wait(5)
+    finally:
+        buffer.stop()
+    assert len(batches) == 1
+    assert list(batches[0].columns) == COLUMNS
+    assert batches[0]["id"].tolist() == [0, 1, 2]
+    assert buffer.stats()["flushed_rows"] == 3
+    assert get_buffer_stats()["test-rows"]["flushes"] == 1
+
+
+def test_background_flush_on_interval():
+    batches, flushed, flush_fn = collector()
+    buffer = WriteBehindBuffer(
+        "test-interval", COLUMNS, flush_fn, flush_rows=100, flush_interval_ms=10
+    )
+    buffer.start()
+    try:
+        buffer.append((1, 1.0))
+        assert flushed.wait(5)
+    finally:
+        buffer.stop()
+    assert sum(len(batch) for batch in batches) == 1
+
+
+def test_stop_flushes_pending_rows():
+    batches, _, flush_fn = collector()
+    buffer = WriteBehindBuffer(
+        "test-stop", COLUMNS, flush_fn, flush_rows=100, flush_interval_ms=60_000
+    )
+    buffer.start()
+    buffer.append((1, 1.0))
+    buffer.append((2, 2.0))
+    buffer.stop()
+    assert sum(len(batch) for batch in batches) == 2
+    assert buffer.stats()["pending_rows"] == 0
+
+
+def test_full_buffer_drops_and_counts_rows():
+    batches, _, flush_fn = collector()
+    buffer = WriteBehindBuffer("test-drop", COLUMNS, flush_fn, max_rows=2)
+    assert buffer.append((1, 1.0))
+    assert buffer.append((2, 2.0))
+    assert not buffer.append((3, 3.0))
+    assert buffer.stats()["dropped_rows"] == 1
+    assert buffer.flush() == 2
+    assert batches[0]["id"].tolist() == [1, 2]
+
+
+def test_full_buffer_flushes_synchronously_when_asked():
+    batches, _, flush_fn = collector()
+    buffer = WriteBehindBuffer(
+        "test-overflow", COLUMNS, flush_fn, max_rows=2, flush_when_full=True
+    )
+    for i in range(3):
+        assert buffer.append((i, float(i)))
+    stats = buffer.stats()
+    assert stats["dropped_rows"] == 0
+    assert stats["overflow_flushes"] == 1
+    assert stats["pending_rows"] == 1
+    assert batches[0]["id"].tolist() == [0, 1]
+
+
+def test_failed_flush_is_retried(workdir):
+    batches, _, flush_fn = collector()
+    failures = [RuntimeError("database is locked")]
+
+    def flaky_flush(df):
+        if failures:
+            raise failures.pop()
+        flush_fn(df)
+
+    buffer = WriteBehindBuffer("test-retry", COLUMNS, flaky_flush)
+    buffer.append((1, 1.0))
+    assert buffer.flush() == 0
+    assert buffer.stats()["pending_rows"] == 1
+    buffer.append((2, 2.0))
+    assert buffer.flush() == 2
+    assert batches[0]["id"].tolist() == [1, 2]
+    stats = buffer.stats()
+    assert stats["failed_rows"] == 1
+    assert stats["flushed_rows"] == 2
+    assert stats["spilled_rows"] == 0
+
+
+def test_batch_is_spilled_after_the_last_retry(workdir):
+    def failing_flush(df):
+        raise RuntimeError("database is locked")
+
+    buffer = WriteBehindBuffer("test-spill", COLUMNS, failing_flush, max_retries=2)
+    buffer.append((1, 1.0))
+    buffer.flush()
+    buffer.append((2, 2.0))
+    buffer.flush()
+    assert buffer.stats()["pending_rows"] == 0
+    assert buffer.stats()["spilled_rows"] == 2
+    (path,) = (workdir / "logs" / "write_behind").glob("test-spill-*.parquet")
+    assert pd.read_parquet(path)["id"].tolist() == [1, 2]
+
+    # A failure on stop does not wait for more retries
+    buffer.append((3, 3.0))
+    buffer.stop()
+    assert buffer.stats()["spilled_rows"] == 3